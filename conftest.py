@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The cryengine_tools package does not depend on Blender, so the tests import it directly
+# instead of going through the io_cryengine_importer package (which imports bpy).
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "io_cryengine_importer", "lib"))
@@ -28,10 +28,22 @@ import bpy.types
 import bpy.utils
 import mathutils
 
-from . import collections, constants, bones, widgets, materials, utilities
-from .CryXmlB.CryXmlReader import CryXmlSerializer
+from . import collections, constants, bones, widgets, materials, utilities, collada
+from .lib.cryengine_tools.CryXmlB.CryXmlReader import CryXmlSerializer, string_pool
+from .lib.cryengine_tools.CryXmlB.CryXmlCache import parse_cache
+from .lib.cryengine_tools.GeometryCache import geometry_cache
+from .lib.cryengine_tools.TextureBaker import texture_baker
+from .lib.cryengine_tools.TextureBudget import estimate_prefab_textures, estimate_textures, MAX_DOWNSCALE, MEGABYTE
+from .lib.cryengine_tools.PakFileSystem import PakFileSystem
+from .lib.cryengine_tools.ParsePipeline import ParsePipeline
+from .lib.cryengine_tools.AssetIndex import AssetIndex, asset_index_cache
+from .lib.cryengine_tools.PrefabDependencies import DependencyResolver, print_prefetch_summary
 
 object_dictionary = {}
+imported_bindings = {}  # Resolved binding path: {bone name: objects bound to that bone} in the current mech import
+bone_groups = {}        # Mesh name: bone of the rigid vertex group added to it in the current mech import
+asset_collections = {}  # Resolved .dae path: source collection instanced by prefab placements
+pending_transforms = {} # Object name: (object, Pos, Rotate, Scale, parent Id) waiting for apply_transforms
 
 def strip_slash(line_split):
     if line_split[-1][-1] == 92:  # '\' char
@@ -367,19 +379,29 @@ def set_custom_shapes(armature, mech):
 
 def import_geometry(dae_file, basedir):
     try:
-        bpy.ops.wm.collada_import(filepath=dae_file,find_chains=True,auto_connect=True)
-        return bpy.context.selected_objects[:]      # Return the objects added.
+        return collada.import_collada(dae_file, find_chains=True, auto_connect=True)      # Return the objects added.
     except:
         # Unable to open the file.  Probably not found (like Urbie lights, under purchasable).
         print("Error importing Collada file: " + dae_file + ", basedir: " + basedir)
     
-def import_mech_geometry(cdf_file, basedir, bodydir, mechname):
+def import_mech_geometry(cdf_file, basedir, bodydir, mechname, use_skin_weights=False):
     armature = bpy.data.objects['Armature']
     print("Importing mech geometry...")
-    cry_xml = CryXmlSerializer()
+    imported_bindings.clear()
+    bone_groups.clear()
+    cry_xml = CryXmlSerializer(lazy=True, cache=parse_cache, file_system=constants.file_system, string_pool=string_pool)
     geometry = cry_xml.read_file(cdf_file)
+    attachments = []
     for geo in geometry.iter("Attachment"):
         if not geo.attrib["AName"] == "cockpit":
+            binding = utilities.resolve_file(os.path.join(basedir, os.path.splitext(geo.attrib["Binding"])[0] + ".dae"))
+            attachments.append((geo, binding))
+    # Bindings that are imported rather than shared, in import order.
+    unique_bindings = {}
+    for geo, binding in attachments:
+        unique_bindings.setdefault(os.path.normcase(os.path.abspath(binding)), binding)
+    with create_parse_pipeline(unique_bindings.values()) as pipeline:
+        for geo, binding in attachments:
             print("Importing " + geo.attrib["AName"])
             # Get all the attribs
             aname    = geo.attrib["AName"]
@@ -387,7 +409,6 @@ def import_mech_geometry(cdf_file, basedir, bodydir, mechname):
             location = utilities.convert_to_vector(geo.attrib["Position"])
             bonename = process_bonename(geo, aname)
             print("*** *** Bonename: " + bonename)
-            binding  = os.path.join(basedir, os.path.splitext(geo.attrib["Binding"])[0] + ".dae")
             flags    = geo.attrib["Flags"]
             # Materials depend on the part type.  For most, <mech>_body.  Weapons is <mech>_variant.  Window/cockpit is 
             # <mech>_window.
@@ -403,21 +424,35 @@ def import_mech_geometry(cdf_file, basedir, bodydir, mechname):
                     materialname = mechname + "_window"
             # We now have all the geometry parts that need to be imported, their loc/rot, and material.  Import.
             print('Material: ' + materialname)
-            try:
-                bpy.ops.wm.collada_import(filepath=binding,find_chains=True,auto_connect=True)
-            except:
-                # Unable to open the file.  Probably not found (like Urbie lights, under purchasable).
-                continue
-            obj_objects = bpy.context.selected_objects[:]
+            binding_key = os.path.normcase(os.path.abspath(binding))
+            imports = imported_bindings.get(binding_key)
+            if imports and bonename in imports:
+                # Already imported for another attachment on this bone (repeated parts).  Reuse its meshes.
+                print("Sharing mesh data with earlier import of " + binding)
+                obj_objects = duplicate_objects(imports[bonename])
+            elif imports:
+                # Vertex groups belong to the mesh, so a part bound to another bone (mirrored
+                # mounts) needs its own copy of the mesh data.
+                print("Copying mesh data from earlier import of " + binding)
+                obj_objects = duplicate_objects(next(iter(imports.values())), copy_data=True)
+                imports[bonename] = obj_objects
+            else:
+                try:
+                    obj_objects = collada.import_collada(binding, pipeline=pipeline, use_skin_weights=use_skin_weights,
+                                                         find_chains=True, auto_connect=True)
+                except:
+                    # Unable to open the file.  Probably not found (like Urbie lights, under purchasable).
+                    continue
+                imported_bindings[binding_key] = {bonename: obj_objects}
             collections.move_object_to_collection(obj_objects[0], constants.MECH_COLLECTION) # Move root object to Mech Collection
-            i = 0
+            parented = False
             for obj in obj_objects:
                 if not obj.type == 'EMPTY':
                     armature.select_set(True)
                     bpy.context.view_layer.objects.active = armature
                     bpy.context.view_layer.objects.active = obj
                     # If this is a parent node, rotate/translate it. Otherwise skip it.
-                    if i == 0:
+                    if not parented:
                         matrix = utilities.get_transform_matrix(rotation, location)       # Converts the location vector and rotation quat into a 4x4 matrix.
                         #parent this first object to the appropriate bone
                         obj.rotation_mode = 'QUATERNION'
@@ -425,18 +460,53 @@ def import_mech_geometry(cdf_file, basedir, bodydir, mechname):
                         obj.parent_bone = bonename
                         obj.parent_type = 'BONE'
                         obj.matrix_world = matrix
-                        i = i + 1
-                    # Vertex groups
-                    vg = obj.vertex_groups.new(name=bonename)
-                    nverts = len(obj.data.vertices)
-                    for i in range(nverts):
-                        vg.add([i], 1.0, 'REPLACE')
+                        parented = True
+                    # Vertex groups.  Skinned parts keep their skin weights if asked to, the rest
+                    # are bound rigidly to the attachment bone in one call.
+                    if not (use_skin_weights and obj.vertex_groups):
+                        vg = obj.vertex_groups.get(bonename) or obj.vertex_groups.new(name=bonename)
+                        vg.add(list(range(len(obj.data.vertices))), 1.0, 'REPLACE')
+                        bone_groups[obj.data.name] = bonename
                     if len(bpy.context.object.material_slots) == 0:
-                        bpy.context.object.data.materials.append(bpy.data.materials[materialname])  # If there is no material, add a dummy mat.
+                        bpy.context.object.data.materials.append(get_mech_material(materialname))  # If there is no material, add a dummy mat.
                     if "_prop" in obj.name:
                         materialname = mechname + "_body"
-                    bpy.context.object.data.materials[0] = bpy.data.materials[materialname]
+                    material = get_mech_material(materialname)
+                    if obj.data.users > 1 and obj.data.materials[0] != material:
+                        # The mesh is shared with a part that uses another material, so set it on the object.
+                        obj.material_slots[0].link = 'OBJECT'
+                        obj.material_slots[0].material = material
+                    else:
+                        bpy.context.object.data.materials[0] = material
                     obj.select_set(False)
+    pipeline.print_summary()
+
+def get_mech_material(name):
+    # Looked up by the name in the .mtl file, since an identical material from an earlier
+    # import may have been reused under its own name.
+    material = constants.materials.get(name) or constants.cockpit_materials.get(name)
+    return material if material is not None else bpy.data.materials[name]
+
+def duplicate_objects(objects, copy_data=False):
+    """ Copies imported objects and the parent links between them.  The copies share
+        mesh data with the originals, unless copy_data is set.  Copied meshes lose the
+        rigid bone vertex group of the originals.
+    """
+    copies = {}
+    for obj in objects:
+        copy = obj.copy()
+        if copy_data and obj.data is not None:
+            copy.data = obj.data.copy()
+            group = copy.vertex_groups.get(bone_groups.get(obj.data.name, ""))
+            if group is not None:
+                copy.vertex_groups.remove(group)
+        for collection in obj.users_collection:
+            collection.objects.link(copy)
+        copies[obj.name] = copy
+    for obj in objects:
+        if obj.parent is not None and obj.parent.name in copies:
+            copies[obj.name].parent = copies[obj.parent.name]
+    return [copies[obj.name] for obj in objects]
 
 def process_bonename(geo, aname):
     if aname in constants.bad_bonename_map:
@@ -496,8 +566,7 @@ def save_file(file):
         if not bpy.path.abspath("//"):      # not saved yet
             bpy.ops.wm.save_as_mainfile(filepath=os.path.join(file, basename + ".blend"), check_existing = True)
     else:
-        if file.endswith(".cdf"):
-            file = file.replace(".cdf", "")
+        file = os.path.splitext(file)[0]     # .cdf or prefab .xml
         basename = os.path.basename(file)
         if not bpy.path.abspath("//"):      # not saved yet
             bpy.ops.wm.save_as_mainfile(filepath=os.path.join(os.path.dirname(file), basename + ".blend"), check_existing = True)  # CDF file
@@ -510,6 +579,8 @@ def generate_preview(file):
 
 def set_viewport_shading():
     # Set material mode. # iterate through areas in current screen
+    if bpy.context.screen is None:      # No window when running in the background
+        return
     for area in bpy.context.screen.areas:
         if area.type == 'VIEW_3D':
             for space in area.spaces: 
@@ -549,21 +620,10 @@ def move_damaged_parts_to_collection():
         if obj.name.endswith('_damaged') or obj.name.endswith('_damged'):
             collections.move_object_to_collection(obj, constants.DAMAGED_PARTS_COLLECTION)
 
-def show_all_prefab_folders(prefab_xml):
+def show_all_prefab_folders(prefab_file):
     print("NOTE:  Asset importer needs to create .blend files for the following directories:")
-    all_dirs = []
-    for prefab in prefab_xml.iter("Object"):
-        if prefab.attrib["Type"] == "Brush":
-            file = "/".join(prefab.attrib["Prefab"].split("/")[0:-1])
-            all_dirs.append(file)
-        elif prefab.attrib["Type"] == "Entity":
-            properties = prefab[0]
-            file = "/".join(properties.attrib["objModel"].split("/")[0:-1])
-            all_dirs.append(file)
-        elif prefab.attrib["Type"] == "GeomEntity":
-            file = "/".join(prefab.attrib["Geometry"].split("/")[0:-1])
-            all_dirs.append(file)
-    for dir in (set(all_dirs)):
+    resolver = DependencyResolver(get_base_dir(prefab_file), constants.asset_index, constants.file_system)
+    for dir in sorted(set(os.path.dirname(path) for path in resolver.resolve(prefab_file).geometry)):
         print(dir)
 
 def import_light(object):
@@ -597,6 +657,7 @@ def import_light(object):
 def import_asset(filepath, use_dds=True, use_tif=False, auto_save_file=True, auto_generate_preview=False, **kwargs):
     print("Import Asset.  File: " + filepath)
     constants.basedir = get_base_dir(filepath)
+    constants.asset_index = AssetIndex.for_directory(constants.basedir, asset_index_cache)
     set_viewport_shading()
     collections.set_up_asset_collections()
 
@@ -623,12 +684,19 @@ def import_asset(filepath, use_dds=True, use_tif=False, auto_save_file=True, aut
     #     generate_preview(bpy.data.filepath)            #  Only generate the preview if the file is saved.
     return {'FINISHED'}
 
-def import_mech(context, *, use_dds=True, use_tif=False, auto_save_file=True, add_control_bones=True, path):
+def import_mech(context, *, use_dds=True, use_tif=False, auto_save_file=True, add_control_bones=True, use_parse_cache=True, use_pak_files=False, use_fast_collada=True, use_skin_weights=False, use_baked_textures=False, texture_budget=0, texture_budget_action='WARN', texture_quality='FULL', path):
     print("Import Mech")
+    constants.import_warnings.clear()
     print(path)
+    parse_cache.enabled = use_parse_cache
+    geometry_cache.enabled = use_parse_cache
+    constants.use_fast_collada = use_fast_collada
     cdf_file = path      # The input file
     # Split up path into the variables we want.
     constants.basedir = get_base_dir(path)
+    constants.file_system = PakFileSystem.from_directory(constants.basedir) if use_pak_files else None
+    asset_index_cache.enabled = use_parse_cache
+    constants.asset_index = AssetIndex.for_directory(constants.basedir, asset_index_cache)
     bodydir = get_body_dir(path)
     mechdir = os.path.dirname(path)
     mech = get_mech_name(path)
@@ -639,13 +707,21 @@ def import_mech(context, *, use_dds=True, use_tif=False, auto_save_file=True, ad
     set_viewport_shading()
     collections.set_up_collections(path)
     # Try to import the armature.  If we can't find it, then return error.
-    bones.import_armature(os.path.join(bodydir, mech + ".dae"), mech)
+    bones.import_armature(utilities.resolve_file(os.path.join(bodydir, mech + ".dae")), mech)
 
     # Create the materials.
+    existing_images = set(bpy.data.images)
+    estimate = estimate_textures(materials.get_texture_files([matfile, cockpit_matfile], use_dds, use_tif))
+    downscale = check_texture_budget(estimate, texture_budget, texture_budget_action, texture_quality)
+    texture_baker.enabled = use_baked_textures
+    if use_baked_textures:
+        materials.bake_textures([matfile, cockpit_matfile], use_dds, use_tif)
+    materials.reset_material_summary()
+    materials.reset_loaded_images()
     constants.materials = materials.create_materials(matfile, constants.basedir, use_dds, use_tif)
     constants.cockpit_materials = materials.create_materials(cockpit_matfile, constants.basedir, use_dds, use_tif)
     # Import the geometry and assign materials.
-    import_mech_geometry(cdf_file, constants.basedir, bodydir, mech)
+    import_mech_geometry(cdf_file, constants.basedir, bodydir, mech, use_skin_weights)
     # Set the layers for existing objects
     add_objects_to_collections()
     
@@ -657,38 +733,90 @@ def import_mech(context, *, use_dds=True, use_tif=False, auto_save_file=True, ad
     bpy.ops.object.mode_set(mode='OBJECT')
 
     materials.remove_unlinked_materials()
+    downscale_images([image for image in bpy.data.images if image not in existing_images], downscale)
+    print("String pool: " + str(string_pool.stats()))
+    print("Geometry cache: " + str(geometry_cache.hits) + " hits, " + str(geometry_cache.misses) + " misses")
+    materials.print_material_summary()
 
     if auto_save_file == True:
         save_file(path)
     return {'FINISHED'}
 
-def import_prefab(context, *, use_dds=True, use_tif=False, auto_save_file=True, auto_generate_preview=False, path):
+def import_prefab(context, *, use_dds=True, use_tif=False, auto_save_file=True, auto_generate_preview=False, use_parse_cache=True, use_pak_files=False, use_fast_collada=True, use_collection_instances=False, prefetch_dependencies=True, texture_budget=0, texture_budget_action='WARN', texture_quality='FULL', path):
+    constants.import_warnings.clear()
+    parse_cache.enabled = use_parse_cache
+    geometry_cache.enabled = use_parse_cache
+    constants.use_fast_collada = use_fast_collada
     set_viewport_shading()
     basedir = get_base_dir(path)
     print("Basedir: " + basedir)
+    constants.file_system = PakFileSystem.from_directory(basedir) if use_pak_files else None
+    asset_index_cache.enabled = use_parse_cache
+    constants.asset_index = AssetIndex.for_directory(basedir, asset_index_cache)
 
-    if os.path.isfile(path):
-        cry_xml = CryXmlSerializer()
-        prefabs_xml = cry_xml.read_file(path)
-    else:
+    if not os.path.isfile(path):
         return {'FINISHED'}  # Couldn't parse the prefab xml.
 
-    # Set up root collection
-    root_name = prefabs_xml.getroot().attrib["Name"]
-    print('Root name: ' + root_name)
-    root_collection = collections.create_collection(root_name)
-    collections.add_collection_to_parent(bpy.context.scene.collection, root_collection)
-
-    # Go through the prefabs and add each object to the appropriate collection
-    for prefab_element in prefabs_xml.iter("Prefab"):
-        collection = collections.create_collection(prefab_element.attrib["Name"])
-        print("\n*** Creating collection " + prefab_element.attrib["Name"])
-        parent_col = collections.get_collection_object(prefab_element.attrib["Library"])
-        parent_col.children.link(collection)
-
-        import_element(basedir, prefab_element, collection)
+    # Find every file the library needs, and read them on worker threads before the bpy phase.
+    resolver = DependencyResolver(basedir, constants.asset_index, constants.file_system, ".dds" if use_dds else ".tif", parse_cache)
+    dependencies = resolver.resolve(path)
+    dependencies.print_report()
+    if prefetch_dependencies:
+        warmers = {".dae": collada.warm_cache} if use_fast_collada and use_parse_cache else None
+        print_prefetch_summary(resolver.prefetch(dependencies, warmers))
+    existing_images = set(bpy.data.images)
+    materials.reset_loaded_images()
+    downscale = check_texture_budget(estimate_prefab_textures(dependencies, constants.file_system), texture_budget,
+                                     texture_budget_action, texture_quality)
+
+    asset_collections.clear()
+    # Stream the prefab library so only the prefab being imported is held in memory.
+    cry_xml = CryXmlSerializer(cache=parse_cache, file_system=constants.file_system, string_pool=string_pool)
+    root_collection = None
+    for event, element in cry_xml.iterparse(path, events=("start", "end")):
+        if root_collection is None and event == "start":
+            # Set up root collection
+            root_name = element.attrib["Name"]
+            print('Root name: ' + root_name)
+            root_collection = collections.create_collection(root_name)
+            collections.add_collection_to_parent(bpy.context.scene.collection, root_collection)
+        elif event == "end" and element.tag == "Prefab":
+            # Add each object of the prefab to the appropriate collection
+            collection = collections.create_collection(element.attrib["Name"])
+            print("\n*** Creating collection " + element.attrib["Name"])
+            parent_col = collections.get_collection_object(element.attrib["Library"])
+            parent_col.children.link(collection)
+
+            import_element(basedir, element, collection, use_instances=use_collection_instances)
+            element.clear()
+    apply_transforms()
+    downscale_images([image for image in bpy.data.images if image not in existing_images], downscale)
     return {'FINISHED'}
 
+def check_texture_budget(estimate, texture_budget, texture_budget_action='WARN', texture_quality='FULL'):
+    """ Prints the texture memory estimate at texture_quality and adds a warning to
+        constants.import_warnings when it is over texture_budget MB (0 for no budget).  Returns the factor to downscale the imported
+        images by: the quality's, or more to fit the budget when the action is 'DOWNSCALE'.
+    """
+    downscale = constants.TEXTURE_QUALITY[texture_quality]
+    estimate.print_report()
+    memory = estimate.memory(downscale=downscale)
+    if not texture_budget or memory <= texture_budget * MEGABYTE:
+        return downscale
+    message = "Textures need an estimated %.0f MB, over the %d MB budget." % (memory / MEGABYTE, texture_budget)
+    if texture_budget_action == 'DOWNSCALE':
+        downscale = max(downscale, estimate.get_downscale(texture_budget * MEGABYTE) or MAX_DOWNSCALE)
+        message += "  Downscaling them to 1/" + str(downscale) + " size."
+    print(message)
+    constants.import_warnings.append(message)
+    return downscale
+
+def downscale_images(images, downscale):
+    # Points the images loaded by an import at downscaled copies from the texture cache.  Prefab
+    # imports load their images with the Collada materials, in collada.create_material.
+    if downscale > 1:
+        materials.use_downscaled_images(images, downscale)
+
 def add_empty(object):
     print("Adding empty " + object.attrib["Name"])
     new_object = bpy.data.objects.new(object.attrib["Name"], None)
@@ -696,93 +824,167 @@ def add_empty(object):
     set_object_location(object, new_object)
     return new_object
 
-def import_element(basedir, prefab_element, collection, matrix = mathutils.Matrix()):
+def get_asset_library_collection():
+    # Hidden collection that holds the source collections of instanced prefab assets.
+    library = collections.get_collection_object(constants.PREFAB_ASSETS_COLLECTION)
+    if library is None:
+        library = bpy.data.collections.new(constants.PREFAB_ASSETS_COLLECTION)
+        collections.add_collection_to_parent(bpy.context.scene.collection, library)
+        bpy.context.view_layer.layer_collection.children[library.name].exclude = True
+    return library
+
+def import_prefab_geometry(dae_file, use_instances=False, pipeline=None):
+    """ Imports the geometry of a prefab object and returns its root object, or None if the
+        file couldn't be read.  With use_instances, each file is imported once into a source
+        collection, and every placement is an empty that instances it.
+    """
+    if not use_instances:
+        if not collada.import_collada(dae_file, pipeline=pipeline):
+            return None     # Missing or unreadable file
+        return get_root(bpy.context.object)
+    key = os.path.normcase(os.path.abspath(dae_file))
+    source = asset_collections.get(key)
+    if source is None:
+        source = bpy.data.collections.new(os.path.splitext(os.path.basename(key))[0])
+        get_asset_library_collection().children.link(source)
+        for obj in collada.import_collada(dae_file, pipeline=pipeline):
+            collections.move_object_to_collection(obj, source.name)
+        asset_collections[key] = source
+    instance = bpy.data.objects.new(source.name, None)
+    instance.instance_type = 'COLLECTION'
+    instance.instance_collection = source
+    return instance
+
+def get_imported_files(dae_files, use_instances=False):
+    # The files import_prefab_geometry will import, in order.  Instanced files are only imported once.
+    if not use_instances:
+        return list(dae_files)
+    keys = set(asset_collections)
+    files = []
+    for dae_file in dae_files:
+        key = os.path.normcase(os.path.abspath(dae_file))
+        if key not in keys:
+            keys.add(key)
+            files.append(dae_file)
+    return files
+
+def create_parse_pipeline(dae_files):
+    # Reads upcoming Collada files on worker threads while the main thread builds their objects.
+    # The threads hide the file reads; the XML parsing still shares the GIL with the main thread.
+    return ParsePipeline(collada.load_collada, dae_files if constants.use_fast_collada else [])
+
+def get_object_geometry(obj_element):
+    # The .cgf/.cga a prefab object places, or None for lights, empties and groups.
+    object_type = obj_element.attrib["Type"]
+    if object_type == "Brush":
+        return obj_element.attrib["Prefab"]
+    if object_type == "Entity" and len(obj_element):
+        return obj_element[0].get("objModel", obj_element[0].get("object_Model"))
+    if object_type == "GeomEntity":
+        return obj_element.get("Geometry")
+    return None
+
+def get_dae_file(basedir, cgf_file):
+    # The converted Collada file for a .cgf/.cga, found case insensitively.
+    return utilities.resolve_file(os.path.join(basedir, os.path.splitext(cgf_file)[0] + ".dae"))
+
+def import_element(basedir, prefab_element, collection, matrix = mathutils.Matrix(), use_instances=False):
+    # Objects inside a Group are placed relative to the group, unless they name another Parent.
+    group_ids = {}
+    for group in prefab_element.iter("Object"):
+        if group.get("Type") == "Group":
+            for member in group.iter("Object"):
+                if member is not group:
+                    group_ids[member] = group.attrib["Id"]
+    # Read the geometry of the objects on worker threads while they are built below.
+    dae_files = {}
     for obj_element in prefab_element.iter("Object"):
-        object_type = obj_element.attrib["Type"]
-        print("Processing Object type " + object_type)            
-        if object_type == "Brush":
-            cgf_file = obj_element.attrib["Prefab"]
-            dae_file = os.path.join(basedir, cgf_file).replace(".cgf",".dae").replace(".cga",".dae").replace("\\","\\\\").replace("/", "\\\\")
-            bpy.ops.wm.collada_import(filepath=dae_file)
-            added_obj = get_root(bpy.context.object)
-            object_dictionary[obj_element.attrib["Id"]] = added_obj
-            if "Parent" in obj_element.attrib:
-                added_obj.parent = object_dictionary[obj_element.attrib["Parent"]]
-            set_object_location(obj_element, added_obj)
-            for obj in get_all_child_objects(added_obj):
-                collections.move_object_to_collection(obj, collection.name)
-        elif object_type == "Entity":
-            properties = obj_element[0]
-            if "objModel" in properties.attrib:
-                cgf_file = properties.attrib["objModel"]
-                dae_file = os.path.join(basedir, cgf_file).replace(".cgf",".dae").replace(".cga",".dae").replace("\\","\\\\").replace("/", "\\\\")
-                bpy.ops.wm.collada_import(filepath=dae_file)
-                added_obj = get_root(bpy.context.object)
-                object_dictionary[obj_element.attrib["Id"]] = added_obj
-                set_object_location(obj_element, added_obj)
-                for obj in get_all_child_objects(added_obj):
-                    collections.move_object_to_collection(obj, collection.name)
-            elif "object_Model" in properties.attrib:
-                cgf_file = properties.attrib["object_Model"]
-                dae_file = os.path.join(basedir, cgf_file).replace(".cgf",".dae").replace(".cga",".dae").replace("\\","\\\\").replace("/", "\\\\")
-                bpy.ops.wm.collada_import(filepath=dae_file)
-                added_obj = get_root(bpy.context.object)
+        cgf_file = get_object_geometry(obj_element)
+        if cgf_file is not None:
+            dae_files[obj_element] = get_dae_file(basedir, cgf_file)
+    with create_parse_pipeline(get_imported_files(dae_files.values(), use_instances)) as pipeline:
+        for obj_element in prefab_element.iter("Object"):
+            object_type = obj_element.attrib["Type"]
+            parent_id = obj_element.get("Parent", group_ids.get(obj_element))
+            print("Processing Object type " + object_type)            
+            if object_type == "Brush":
+                dae_file = dae_files[obj_element]
+                added_obj = import_prefab_geometry(dae_file, use_instances, pipeline)
                 object_dictionary[obj_element.attrib["Id"]] = added_obj
-                set_object_location(obj_element, added_obj)
-                for obj in get_all_child_objects(added_obj):
+                set_object_location(obj_element, added_obj, parent_id)
+                for obj in get_all_child_objects(added_obj) if added_obj is not None else ():
                     collections.move_object_to_collection(obj, collection.name)
-            else:  # Light or particle (TODO: Could also be gamemode object which has multiple geometry assets)
-                light_data = bpy.data.lights.new(name=obj_element.attrib["Name"], type='POINT')
-                light_object = bpy.data.objects.new(name=obj_element.attrib["Name"], object_data=light_data)
-                object_dictionary[obj_element.attrib["Id"]] = light_object
-                collections.move_object_to_collection(light_object, collection.name)
-                set_object_location(obj_element, light_object)
-        elif object_type == "GeomEntity":
-            if "Geometry" in obj_element.attrib:
-                cgf_file = obj_element.attrib["Geometry"]
-                dae_file = os.path.join(basedir, cgf_file).replace(".cgf",".dae").replace(".cga",".dae").replace("\\","\\\\").replace("/", "\\\\")
-                bpy.ops.wm.collada_import(filepath=dae_file)
-                added_obj = get_root(bpy.context.object)
-                object_dictionary[obj_element.attrib["Id"]] = added_obj
-                set_object_location(obj_element, added_obj)
-                for obj in get_all_child_objects(added_obj):
-                    collections.move_object_to_collection(obj, collection.name)
-            else:
-                add_empty(obj_element)
-                added_obj = get_root(bpy.context.object)
-                object_dictionary[obj_element.attrib["Id"]] = added_obj
-                set_object_location(obj_element, added_obj)
-                collections.move_object_to_collection(added_obj, collection.name)
-        elif object_type == "Group":
-            print("Group type object.")
-            group_container = add_empty(obj_element)
-            set_object_location(obj_element, group_container)
-            collections.move_object_to_collection(group_container, collection.name)
-            object_dictionary[obj_element.attrib["Id"]] = group_container
-            objects = obj_element[0]
-            for obj in objects.iter("Object"):
-                import_element(basedir, obj, collection)
-
-def set_object_location(object, added_obj):
+            elif object_type == "Entity":
+                properties = obj_element[0]
+                if "objModel" in properties.attrib:
+                    dae_file = dae_files[obj_element]
+                    added_obj = import_prefab_geometry(dae_file, use_instances, pipeline)
+                    object_dictionary[obj_element.attrib["Id"]] = added_obj
+                    set_object_location(obj_element, added_obj, parent_id)
+                    for obj in get_all_child_objects(added_obj) if added_obj is not None else ():
+                        collections.move_object_to_collection(obj, collection.name)
+                elif "object_Model" in properties.attrib:
+                    dae_file = dae_files[obj_element]
+                    added_obj = import_prefab_geometry(dae_file, use_instances, pipeline)
+                    object_dictionary[obj_element.attrib["Id"]] = added_obj
+                    set_object_location(obj_element, added_obj, parent_id)
+                    for obj in get_all_child_objects(added_obj) if added_obj is not None else ():
+                        collections.move_object_to_collection(obj, collection.name)
+                else:  # Light or particle (TODO: Could also be gamemode object which has multiple geometry assets)
+                    light_data = bpy.data.lights.new(name=obj_element.attrib["Name"], type='POINT')
+                    light_object = bpy.data.objects.new(name=obj_element.attrib["Name"], object_data=light_data)
+                    object_dictionary[obj_element.attrib["Id"]] = light_object
+                    collections.move_object_to_collection(light_object, collection.name)
+                    set_object_location(obj_element, light_object, parent_id)
+            elif object_type == "GeomEntity":
+                if "Geometry" in obj_element.attrib:
+                    dae_file = dae_files[obj_element]
+                    added_obj = import_prefab_geometry(dae_file, use_instances, pipeline)
+                    object_dictionary[obj_element.attrib["Id"]] = added_obj
+                    set_object_location(obj_element, added_obj, parent_id)
+                    for obj in get_all_child_objects(added_obj) if added_obj is not None else ():
+                        collections.move_object_to_collection(obj, collection.name)
+                else:
+                    added_obj = add_empty(obj_element)
+                    object_dictionary[obj_element.attrib["Id"]] = added_obj
+                    set_object_location(obj_element, added_obj, parent_id)
+                    collections.move_object_to_collection(added_obj, collection.name)
+            elif object_type == "Group":
+                print("Group type object.")
+                group_container = add_empty(obj_element)
+                set_object_location(obj_element, group_container, parent_id)
+                collections.move_object_to_collection(group_container, collection.name)
+                object_dictionary[obj_element.attrib["Id"]] = group_container
+                # The group's members come later in this loop.
+    if pipeline.decoded:
+        pipeline.print_summary()
+
+def set_object_location(object, added_obj, parent_id=None):
+    # Queues the object's transform and parent.  apply_transforms sets them all at once.
     if not added_obj == None:
-        added_obj.rotation_mode = 'QUATERNION'
-        if "Pos" in object.attrib:
-            location = utilities.convert_to_vector(object.attrib["Pos"])
-        else:
-            location = utilities.convert_to_vector("0.0, 0.0, 0.0")
-        if "Rotate" in object.attrib:
-            rotation = utilities.convert_to_quaternion(object.attrib["Rotate"])
-        else:
-            rotation = utilities.convert_to_quaternion("1, 0, 0, 0")
-        if "Scale" in object.attrib:
-            scale = utilities.convert_to_vector(object.attrib["Scale"])
-        else:
-            scale = utilities.convert_to_vector("1, 1, 1")
-        added_obj.rotation_quaternion = rotation
-        added_obj.location = location
-        added_obj.scale = scale
-        added_obj.rotation_mode = 'QUATERNION'
-        # Use view layer update instead of explicit depsgraph update
-        bpy.context.view_layer.update()
+        pending_transforms[added_obj.name] = (added_obj, object.get("Pos", "0,0,0"), object.get("Rotate", "1,0,0,0"),
+                                              object.get("Scale", "1,1,1"), parent_id)
     else:
-        print("Unable to find Brush entity " + added_obj.name)
+        print("Unable to find Brush entity " + object.attrib["Name"])
+
+def apply_transforms():
+    """ Parents every queued prefab object and sets its local transform, composing all the
+        matrices in one numpy pass.  World matrices follow from the parent links, so the
+        view layer is updated once at the end instead of once per object.
+    """
+    if not pending_transforms:
+        return
+    entries = list(pending_transforms.values())
+    pending_transforms.clear()
+    locations = utilities.parse_vectors([entry[1] for entry in entries], 3, (0.0, 0.0, 0.0))
+    rotations = utilities.parse_vectors([entry[2] for entry in entries], 4, (1.0, 0.0, 0.0, 0.0))
+    scales = utilities.parse_vectors([entry[3] for entry in entries], 3, (1.0, 1.0, 1.0))
+    matrices = utilities.compose_transform_matrices(locations, rotations, scales)
+    for (obj, _, _, _, parent_id), matrix in zip(entries, matrices):
+        parent = object_dictionary.get(parent_id) if parent_id is not None else None
+        if parent is not None and parent != obj:
+            obj.parent = parent
+        obj.rotation_mode = 'QUATERNION'
+        obj.matrix_basis = mathutils.Matrix(matrix.tolist())
+    print("Placed " + str(len(entries)) + " objects")
+    bpy.context.view_layer.update()
@@ -26,11 +26,15 @@ import bpy.types
 import bpy.utils
 from bpy.props import (
         BoolProperty,
+        IntProperty,
         StringProperty,
         EnumProperty)
 from bpy_extras.io_utils import ImportHelper, orientation_helper
 
-from . import Cryengine_Importer
+from . import Cryengine_Importer, constants, materials
+from .lib.cryengine_tools.CryXmlB.CryXmlCache import parse_cache
+from .lib.cryengine_tools.GeometryCache import geometry_cache
+from .lib.cryengine_tools.AssetIndex import AssetIndex, asset_index_cache
 
 bl_info = {
     "name": 'Cryengine Importer', 
@@ -45,6 +49,10 @@ bl_info = {
     "support": "COMMUNITY"
     }
 
+def report_import_warnings(operator):
+    for message in constants.import_warnings:
+        operator.report({'WARNING'}, message)
+
 @orientation_helper(axis_forward='Y', axis_up='Z')
 class MechImporter(bpy.types.Operator, ImportHelper):
     bl_idname = "import_scene.mech"
@@ -79,6 +87,45 @@ class MechImporter(bpy.types.Operator, ImportHelper):
         name = "Use TIF",
         description = "Use TIF format for image textures",
         default = False)
+    use_parse_cache: BoolProperty(
+        name="Use Parse Cache",
+        description="Reuse decoded CryXmlB and Collada files from the on-disk caches when they haven't changed",
+        default=True)
+    use_pak_files: BoolProperty(
+        name="Read From Pak Files",
+        description="Read materials, textures and other game files from the .pak files under the game directory when they haven't been extracted",
+        default=False)
+    use_fast_collada: BoolProperty(
+        name="Fast Geometry Loader",
+        description="Build meshes directly from the Collada files instead of using Blender's Collada importer",
+        default=True)
+    use_skin_weights: BoolProperty(
+        name="Skin Weights",
+        description="Use the skin weights of skinned parts instead of binding every vertex to the attachment bone",
+        default=False)
+    use_baked_textures: BoolProperty(
+        name="Bake Textures",
+        description="Bake normal and roughness maps on worker processes and use them instead of correcting the textures in the shader nodes",
+        default=False)
+    texture_budget: IntProperty(
+        name="Texture Budget (MB)",
+        description="Estimated texture memory above which the import warns or downscales its textures.  0 for no budget",
+        default=0,
+        min=0)
+    texture_budget_action: EnumProperty(
+        name="Over Budget",
+        description="What to do when the textures are estimated to need more memory than the budget",
+        items=(('WARN', "Warn", "Only report the estimate"),
+               ('DOWNSCALE', "Downscale", "Use smaller copies of the textures until they fit the budget"),
+        ))
+    texture_quality: EnumProperty(
+        name="Texture Quality",
+        description="Size of the textures loaded.  Lower qualities use downscaled copies, made once and kept in the texture cache",
+        items=(('FULL', "Full", "Full resolution textures"),
+               ('HALF', "Half", "Half width and height"),
+               ('QUARTER', "Quarter", "Quarter width and height"),
+               ('THUMBNAIL', "Thumbnail", "1/16 width and height, for layout work"),
+        ))
     
     def execute(self, context):
         if self.texture_type == 'OFF':
@@ -101,6 +148,7 @@ class MechImporter(bpy.types.Operator, ImportHelper):
         keywords["path"] = fdir
         self.add_control_bones
         Cryengine_Importer.import_mech(context, **keywords)
+        report_import_warnings(self)
         return { 'FINISHED'}
 
     def draw(self, context):
@@ -114,6 +162,23 @@ class MechImporter(bpy.types.Operator, ImportHelper):
         row.prop(self, "auto_save_file")
         row = layout.row(align=True)
         row.prop(self, "add_control_bones")
+        row = layout.row(align=True)
+        row.prop(self, "use_parse_cache")
+        row.operator(RefreshAssetIndexOperator.bl_idname, text="", icon='FILE_REFRESH')
+        row.operator(PurgeParseCacheOperator.bl_idname, text="", icon='TRASH')
+        row = layout.row(align=True)
+        row.prop(self, "use_pak_files")
+        row = layout.row(align=True)
+        row.prop(self, "use_fast_collada")
+        row = layout.row(align=True)
+        row.prop(self, "use_skin_weights")
+        row = layout.row(align=True)
+        row.prop(self, "use_baked_textures")
+        row = layout.row(align=True)
+        row.prop(self, "texture_quality")
+        row = layout.row(align=True)
+        row.prop(self, "texture_budget")
+        row.prop(self, "texture_budget_action", text="")
 
 @orientation_helper(axis_forward='Y', axis_up='Z')
 class PrefabImporter(bpy.types.Operator, ImportHelper):
@@ -146,6 +211,45 @@ class PrefabImporter(bpy.types.Operator, ImportHelper):
         name = "Use TIF",
         description = "Use TIF format for image textures",
         default = False)
+    use_parse_cache: BoolProperty(
+        name="Use Parse Cache",
+        description="Reuse decoded CryXmlB and Collada files from the on-disk caches when they haven't changed",
+        default=True)
+    use_pak_files: BoolProperty(
+        name="Read From Pak Files",
+        description="Read materials, textures and other game files from the .pak files under the game directory when they haven't been extracted",
+        default=False)
+    use_fast_collada: BoolProperty(
+        name="Fast Geometry Loader",
+        description="Build meshes directly from the Collada files instead of using Blender's Collada importer",
+        default=True)
+    use_collection_instances: BoolProperty(
+        name="Instance Repeated Assets",
+        description="Import each asset once into a hidden collection and place it with collection instances",
+        default=False)
+    prefetch_dependencies: BoolProperty(
+        name="Prefetch Files",
+        description="Read the geometry, materials and textures the prefabs need on worker threads before building the scene",
+        default=True)
+    texture_budget: IntProperty(
+        name="Texture Budget (MB)",
+        description="Estimated texture memory above which the import warns or downscales its textures.  0 for no budget",
+        default=0,
+        min=0)
+    texture_budget_action: EnumProperty(
+        name="Over Budget",
+        description="What to do when the textures are estimated to need more memory than the budget",
+        items=(('WARN', "Warn", "Only report the estimate"),
+               ('DOWNSCALE', "Downscale", "Use smaller copies of the textures until they fit the budget"),
+        ))
+    texture_quality: EnumProperty(
+        name="Texture Quality",
+        description="Size of the textures the prefabs' Collada materials load.  Lower qualities use downscaled copies, made once and kept in the texture cache",
+        items=(('FULL', "Full", "Full resolution textures"),
+               ('HALF', "Half", "Half width and height"),
+               ('QUARTER', "Quarter", "Quarter width and height"),
+               ('THUMBNAIL', "Thumbnail", "1/16 width and height, for layout work"),
+        ))
     def execute(self, context):
         if self.texture_type == 'OFF':
             self.use_tif = True
@@ -163,7 +267,9 @@ class PrefabImporter(bpy.types.Operator, ImportHelper):
                                             ))
         fdir = self.properties.filepath
         keywords["path"] = fdir
-        return Cryengine_Importer.import_prefab(context, **keywords)
+        result = Cryengine_Importer.import_prefab(context, **keywords)
+        report_import_warnings(self)
+        return result
     def draw(self, context):
         layout = self.layout
         row = layout.row(align = True)
@@ -173,6 +279,23 @@ class PrefabImporter(bpy.types.Operator, ImportHelper):
         row.prop(self, "texture_type", expand = True)
         row = layout.row(align=True)
         row.prop(self, "auto_save_file")
+        row = layout.row(align=True)
+        row.prop(self, "use_parse_cache")
+        row.operator(RefreshAssetIndexOperator.bl_idname, text="", icon='FILE_REFRESH')
+        row.operator(PurgeParseCacheOperator.bl_idname, text="", icon='TRASH')
+        row = layout.row(align=True)
+        row.prop(self, "use_pak_files")
+        row = layout.row(align=True)
+        row.prop(self, "use_fast_collada")
+        row = layout.row(align=True)
+        row.prop(self, "use_collection_instances")
+        row = layout.row(align=True)
+        row.prop(self, "prefetch_dependencies")
+        row = layout.row(align=True)
+        row.prop(self, "texture_quality")
+        row = layout.row(align=True)
+        row.prop(self, "texture_budget")
+        row.prop(self, "texture_budget_action", text="")
 
 # -----------------------------------------------------------------------------
 #                                                                          Menu
@@ -189,16 +312,57 @@ class MessageOperator(bpy.types.Operator):
         self.report({self.severity}, self.message)
         return {'FINISHED'}
 
+class FullResolutionTexturesOperator(bpy.types.Operator):
+    """ Switch the images using downscaled copies of textures back to the full resolution files """
+    bl_idname = "wm.cryengine_full_resolution_textures"
+    bl_label = "Use Full Resolution Cryengine Textures"
+    bl_options = {'UNDO'}
+
+    def execute(self, context):
+        count = materials.use_full_resolution_images()
+        self.report({'INFO'}, "Switched " + str(count) + " images to full resolution")
+        return {'FINISHED'}
+
+class PurgeParseCacheOperator(bpy.types.Operator):
+    """ Remove all decoded CryXmlB and Collada files and asset indexes from the parse caches """
+    bl_idname = "wm.purge_cryxml_cache"
+    bl_label = "Purge Parse Cache"
+
+    def execute(self, context):
+        parse_cache.purge()
+        geometry_cache.purge()
+        asset_index_cache.purge()
+        AssetIndex.indexes.clear()
+        self.report({'INFO'}, "Purged parse caches " + parse_cache.cache_dir + ", " + geometry_cache.cache_dir)
+        return {'FINISHED'}
+
+class RefreshAssetIndexOperator(bpy.types.Operator):
+    """ Rescan the game directories indexed this session for added or removed files """
+    bl_idname = "wm.refresh_cryengine_asset_index"
+    bl_label = "Refresh Asset Index"
+
+    def execute(self, context):
+        for index in AssetIndex.indexes.values():
+            index.refresh()
+        self.report({'INFO'}, "Refreshed " + str(len(AssetIndex.indexes)) + " asset indexes")
+        return {'FINISHED'}
+
 def menu_func_mech_import(self, context):
     self.layout.operator(MechImporter.bl_idname, text="Import Mech")
 
 def menu_func_prefab_import(self, context):
     self.layout.operator(PrefabImporter.bl_idname, text="Import Cryengine Prefab")
 
+def menu_func_full_resolution_textures(self, context):
+    self.layout.operator(FullResolutionTexturesOperator.bl_idname)
+
 classes = (
      MechImporter,
      PrefabImporter,
-     MessageOperator
+     MessageOperator,
+     FullResolutionTexturesOperator,
+     RefreshAssetIndexOperator,
+     PurgeParseCacheOperator
  )
 
 def register():
@@ -206,8 +370,10 @@ def register():
         bpy.utils.register_class(cls)
     bpy.types.TOPBAR_MT_file_import.append(menu_func_mech_import)
     bpy.types.TOPBAR_MT_file_import.append(menu_func_prefab_import)
+    bpy.types.TOPBAR_MT_file_external_data.append(menu_func_full_resolution_textures)
 
 def unregister():
+    bpy.types.TOPBAR_MT_file_external_data.remove(menu_func_full_resolution_textures)
     bpy.types.TOPBAR_MT_file_import.remove(menu_func_mech_import)
     bpy.types.TOPBAR_MT_file_import.remove(menu_func_prefab_import)
     for cls in reversed(classes):
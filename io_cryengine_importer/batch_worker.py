@@ -0,0 +1,56 @@
+""" Blender side of lib/cryengine_tools/BatchImporter.py.  Imports one mech or prefab library into an
+empty file and saves it:
+
+    blender --background --factory-startup --python batch_worker.py -- <job .json> <result .json>
+
+The result file is only written once the job has finished, so a missing result means the
+worker crashed.
+"""
+
+import inspect
+import json
+import os
+import sys
+import time
+import traceback
+
+import bpy
+
+# Import the add-on next to this script, not an installed copy.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from io_cryengine_importer import Cryengine_Importer, constants
+
+IMPORTERS = {"mech": Cryengine_Importer.import_mech, "prefab": Cryengine_Importer.import_prefab}
+
+def run_job(job):
+    importer = IMPORTERS[job["type"]]
+    parameters = inspect.signature(importer).parameters
+    options = {key: value for key, value in job.get("options", {}).items() if key in parameters}
+    options["auto_save_file"] = False
+    bpy.ops.wm.read_factory_settings(use_empty=True)
+    start = time.perf_counter()
+    importer(bpy.context, path=job["path"], **options)
+    import_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    if job.get("output"):
+        os.makedirs(os.path.dirname(job["output"]), exist_ok=True)
+        bpy.ops.wm.save_as_mainfile(filepath=job["output"])
+    else:
+        Cryengine_Importer.save_file(job["path"])
+    return {"status": "ok", "output": bpy.data.filepath, "import_seconds": import_seconds,
+            "save_seconds": time.perf_counter() - start, "warnings": list(constants.import_warnings)}
+
+def main(argv):
+    job_file, result_file = argv[argv.index("--") + 1:][:2]
+    with open(job_file, encoding="utf-8") as f:
+        job = json.load(f)
+    try:
+        result = run_job(job)
+    except Exception:
+        traceback.print_exc()
+        result = {"status": "failed", "error": traceback.format_exc()}
+    with open(result_file, "w", encoding="utf-8") as f:
+        json.dump(result, f)
+
+if __name__ == "__main__":
+    main(sys.argv)
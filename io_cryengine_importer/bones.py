@@ -3,11 +3,12 @@ import math
 import mathutils
 from mathutils import Vector, Matrix, Color
 import rna_prop_ui
-from . import collections, constants, utilities
+from . import collections, constants, utilities, collada
 
 def import_armature(rig, mech_name):
     try:
-        bpy.ops.wm.collada_import(filepath=rig, find_chains=True, auto_connect=True)
+        # The direct loader doesn't read skeletons, so don't parse the whole rig file first.
+        collada.import_collada(rig, use_fast_loader=False, find_chains=True, auto_connect=True)
         armature = bpy.data.objects['Armature']
         mech_triangle_geometry = bpy.data.objects[mech_name]
         collections.move_object_to_collection(mech_triangle_geometry, constants.MECH_COLLECTION)
@@ -0,0 +1,545 @@
+import json
+import math
+import os
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass, field
+
+import bpy
+import mathutils
+import numpy
+
+from . import constants, materials, utilities
+from .lib.cryengine_tools.ColladaImages import get_image_path, resolve_image_path
+from .lib.cryengine_tools.GeometryCache import geometry_cache
+
+# Reads the Collada files written by Cryengine Converter straight into mesh datablocks.
+# Parsing only needs numpy, and the mesh is filled in with foreach_set, so there is no
+# per-vertex Python and no operator or depsgraph overhead.  Files with content this loader
+# doesn't handle (skeletons, lines, <ph> holes) go through bpy.ops.wm.collada_import instead.
+# Parsed files are kept in the geometry cache, so later imports of an unchanged file skip the XML.
+# Materials get the color and the diffuse, specular and bump textures of their <effect>.
+
+MESH_ARRAYS = ("positions", "loop_vertices", "loop_starts", "material_indices", "normals", "uvs",
+               "weight_vertices", "weight_joints", "weight_values")
+SCENE_VERSION = 3       # Version of the packed scene in the geometry cache
+EFFECT_CHANNELS = ("diffuse", "specular", "bump")   # Effect channels built into materials
+WEIGHT_LEVELS = 255     # Skin weights are rounded to Cryengine's 8-bit precision
+
+class UnsupportedColladaError(Exception):
+    """ Raised for Collada content the direct loader can't import. """
+    pass
+
+@dataclass
+class ColladaMesh:
+    name: str
+    positions: numpy.ndarray            # (vertices, 3) float32
+    loop_vertices: numpy.ndarray        # (loops,) int32 vertex index of each polygon corner
+    loop_starts: numpy.ndarray          # (polygons,) int32 first loop of each polygon
+    material_indices: numpy.ndarray     # (polygons,) int32 index into materials
+    materials: list                     # Material symbols, in slot order
+    normals: numpy.ndarray = None       # (loops, 3) float32, or None
+    uvs: numpy.ndarray = None           # (loops, 2) float32, or None
+    skin_joints: list = None            # Joint names of the skin controller, or None
+    weight_vertices: numpy.ndarray = None   # (influences,) int32 vertex of each skin influence
+    weight_joints: numpy.ndarray = None     # (influences,) int32 index into skin_joints
+    weight_values: numpy.ndarray = None     # (influences,) float32 weight
+
+@dataclass
+class ColladaNode:
+    name: str
+    parent: int                         # Index of the parent node, or -1 for a root
+    matrix: numpy.ndarray               # (4, 4) float32 local transform
+    geometry: str = None                # Id of the instanced geometry, or None for an empty
+    materials: dict = field(default_factory=dict)   # Material symbol: material name
+
+@dataclass
+class ColladaScene:
+    meshes: dict                        # Geometry id: ColladaMesh
+    nodes: list                         # ColladaNodes, parents before their children
+    up_axis: str = "Z_UP"
+    effects: dict = field(default_factory=dict)     # Material name: {"color": rgba or None, "textures": {channel: image path}}
+
+def parse_floats(text):
+    return numpy.fromstring(text or "", dtype=numpy.float32, sep=" ")
+
+def parse_ints(text):
+    return numpy.fromstring(text or "", dtype=numpy.int32, sep=" ")
+
+def get_url_id(url):
+    return url[1:] if url and url.startswith("#") else url
+
+def read_collada(filepath):
+    """ Parses a Collada file into a ColladaScene.  Raises UnsupportedColladaError when the
+        file needs the Blender operator.
+    """
+    root = ET.parse(filepath).getroot()
+    ns = root.tag[:root.tag.index("}") + 1] if root.tag.startswith("{") else ""
+    up_axis = root.findtext(ns + "asset/" + ns + "up_axis", "Z_UP").strip()
+    images = {}
+    for image in root.iterfind(ns + "library_images/" + ns + "image"):
+        path = get_image_path(image, ns)
+        if path is not None:
+            images[image.get("id")] = resolve_image_path(filepath, path)
+    effects = {}
+    for effect in root.iterfind(ns + "library_effects/" + ns + "effect"):
+        effects[effect.get("id")] = read_effect(effect, ns, images)
+    material_names = {}
+    material_effects = {}
+    for material in root.iterfind(ns + "library_materials/" + ns + "material"):
+        name = material_names[material.get("id")] = material.get("name") or material.get("id")
+        instance_effect = material.find(ns + "instance_effect")
+        if instance_effect is not None and get_url_id(instance_effect.get("url")) in effects:
+            material_effects[name] = effects[get_url_id(instance_effect.get("url"))]
+    meshes = {}
+    for geometry in root.iterfind(ns + "library_geometries/" + ns + "geometry"):
+        mesh = geometry.find(ns + "mesh")
+        if mesh is not None:
+            meshes[geometry.get("id")] = read_mesh(mesh, ns, geometry.get("name") or geometry.get("id"))
+    skins = {}
+    for controller in root.iterfind(ns + "library_controllers/" + ns + "controller"):
+        skin = controller.find(ns + "skin")
+        if skin is not None:
+            source = skins[controller.get("id")] = get_url_id(skin.get("source"))
+            if source in meshes and meshes[source].skin_joints is None:
+                read_skin(skin, ns, meshes[source])
+    visual_scene = None
+    instance = root.find(ns + "scene/" + ns + "instance_visual_scene")
+    for scene in root.iterfind(ns + "library_visual_scenes/" + ns + "visual_scene"):
+        if visual_scene is None or (instance is not None and scene.get("id") == get_url_id(instance.get("url"))):
+            visual_scene = scene
+    nodes = []
+    if visual_scene is not None:
+        for node in visual_scene.iterfind(ns + "node"):
+            read_node(node, ns, -1, nodes, skins, material_names)
+    return ColladaScene(meshes, nodes, up_axis, material_effects)
+
+def read_effect(effect, ns, images):
+    """ Returns the color and textures of an <effect>'s common profile.  Textures name a
+        sampler, which names a surface, which names the image; a texture naming the image
+        directly is accepted too.
+    """
+    profile = effect.find(ns + "profile_COMMON")
+    if profile is None:
+        return {"color": None, "textures": {}}
+    surfaces = {}
+    samplers = {}
+    for newparam in profile.iterfind(ns + "newparam"):
+        surface = newparam.find(ns + "surface")
+        sampler = newparam.find(ns + "sampler2D")
+        if surface is not None:
+            surfaces[newparam.get("sid")] = (surface.findtext(ns + "init_from") or "").strip()
+        elif sampler is not None:
+            instance_image = sampler.find(ns + "instance_image")     # Collada 1.5
+            if instance_image is not None:
+                samplers[newparam.get("sid")] = get_url_id(instance_image.get("url"))
+            else:
+                samplers[newparam.get("sid")] = surfaces.get((sampler.findtext(ns + "source") or "").strip())
+    color = None
+    textures = {}
+    for channel in EFFECT_CHANNELS:
+        # The bump channel is an extension in the <extra> of the technique or profile.
+        element = next(profile.iter(ns + channel), None)
+        if element is None:
+            continue
+        texture = element.find(ns + "texture")
+        if texture is not None:
+            image = samplers.get(texture.get("texture"), texture.get("texture"))
+            if image in images:
+                textures[channel] = images[image]
+        elif channel == "diffuse" and element.find(ns + "color") is not None:
+            values = parse_floats(element.findtext(ns + "color")).tolist()
+            if len(values) >= 3:
+                color = (values + [1.0])[:4]
+    return {"color": color, "textures": textures}
+
+def pack_scene(collada_scene):
+    """ Flattens a ColladaScene into named arrays for the geometry cache. """
+    arrays = {}
+    meshes = []
+    for i, (geometry_id, collada_mesh) in enumerate(collada_scene.meshes.items()):
+        for key in MESH_ARRAYS:
+            value = getattr(collada_mesh, key)
+            if value is not None:
+                arrays["mesh%d_%s" % (i, key)] = value
+        meshes.append({"id": geometry_id, "name": collada_mesh.name, "materials": collada_mesh.materials,
+                       "skin_joints": collada_mesh.skin_joints})
+    nodes = [{"name": node.name, "parent": node.parent, "geometry": node.geometry, "materials": node.materials}
+             for node in collada_scene.nodes]
+    arrays["node_matrices"] = numpy.array([node.matrix for node in collada_scene.nodes], dtype=numpy.float32).reshape(-1, 4, 4)
+    arrays["scene"] = numpy.array(json.dumps({"version": SCENE_VERSION, "up_axis": collada_scene.up_axis,
+                                              "meshes": meshes, "nodes": nodes, "effects": collada_scene.effects}))
+    return arrays
+
+def unpack_scene(arrays):
+    """ Rebuilds a ColladaScene from pack_scene's arrays, or returns None if they were packed
+        by another version.  The mesh arrays are used as they are, without copies.
+    """
+    scene = json.loads(str(arrays["scene"]))
+    if scene.get("version") != SCENE_VERSION:
+        return None
+    meshes = {}
+    for i, mesh in enumerate(scene["meshes"]):
+        values = {key: arrays.get("mesh%d_%s" % (i, key)) for key in MESH_ARRAYS}
+        meshes[mesh["id"]] = ColladaMesh(name=mesh["name"], materials=mesh["materials"], skin_joints=mesh["skin_joints"], **values)
+    matrices = arrays["node_matrices"]
+    nodes = [ColladaNode(node["name"], node["parent"], matrices[i], node["geometry"], node["materials"])
+             for i, node in enumerate(scene["nodes"])]
+    return ColladaScene(meshes, nodes, scene["up_axis"], scene["effects"])
+
+def load_collada(filepath):
+    """ Returns the ColladaScene for filepath, from the geometry cache if the file hasn't changed. """
+    if geometry_cache.enabled:
+        arrays = geometry_cache.load(filepath)
+        collada_scene = unpack_scene(arrays) if arrays is not None else None
+        if collada_scene is not None:
+            return collada_scene
+    collada_scene = read_collada(filepath)
+    if geometry_cache.enabled:
+        geometry_cache.store(filepath, pack_scene(collada_scene))
+    return collada_scene
+
+def warm_cache(filepath):
+    """ Parses filepath into the geometry cache ahead of its import.  Safe to call from worker threads. """
+    try:
+        load_collada(filepath)
+    except UnsupportedColladaError:
+        pass    # Imported with the Collada operator instead
+
+def read_sources(mesh, ns):
+    """ Returns source id: (count, stride) float32 array. """
+    sources = {}
+    for source in mesh.iterfind(ns + "source"):
+        float_array = source.find(ns + "float_array")
+        accessor = source.find(ns + "technique_common/" + ns + "accessor")
+        if float_array is None or accessor is None:
+            continue
+        stride = int(accessor.get("stride", 1))
+        count = int(accessor.get("count", 0))
+        values = parse_floats(float_array.text)
+        sources[source.get("id")] = values[:count * stride].reshape(-1, stride)
+    return sources
+
+def read_inputs(element, ns):
+    """ Returns (semantic, source id, offset, set) for each <input>. """
+    return [(i.get("semantic"), get_url_id(i.get("source")), int(i.get("offset", 0)), int(i.get("set", 0)))
+            for i in element.iterfind(ns + "input")]
+
+def read_mesh(mesh, ns, name):
+    sources = read_sources(mesh, ns)
+    vertices = mesh.find(ns + "vertices")
+    if vertices is None:
+        raise UnsupportedColladaError("Mesh " + name + " has no vertices")
+    vertex_inputs = {semantic: source for semantic, source, _, _ in read_inputs(vertices, ns)}
+    positions = sources[vertex_inputs["POSITION"]][:, :3]
+    materials = []
+    loop_vertices, polygon_sizes, material_indices, normals, uvs = [], [], [], [], []
+    for primitive in mesh:
+        kind = primitive.tag[len(ns):]
+        if kind in ("source", "vertices", "extra"):
+            continue
+        if kind not in ("triangles", "polylist", "polygons"):
+            raise UnsupportedColladaError("Mesh " + name + " has " + kind)
+        if primitive.find(ns + "ph") is not None:
+            raise UnsupportedColladaError("Mesh " + name + " has polygons with holes")
+        inputs = read_inputs(primitive, ns)
+        if not inputs:
+            continue
+        stride = max(offset for _, _, offset, _ in inputs) + 1
+        if kind == "polygons":
+            polygons = [parse_ints(p.text) for p in primitive.iterfind(ns + "p")]
+            indices = numpy.concatenate(polygons) if polygons else numpy.zeros(0, dtype=numpy.int32)
+            sizes = numpy.array([len(p) // stride for p in polygons], dtype=numpy.int32)
+        else:
+            indices = parse_ints(primitive.findtext(ns + "p"))
+            if kind == "polylist":
+                sizes = parse_ints(primitive.findtext(ns + "vcount"))
+            else:
+                sizes = numpy.full(len(indices) // (3 * stride), 3, dtype=numpy.int32)
+        indices = indices[:int(sizes.sum()) * stride].reshape(-1, stride)
+        corners = None
+        primitive_normals = None
+        primitive_uvs = None
+        uv_set = None
+        for semantic, source, offset, uv in inputs:
+            if semantic == "VERTEX":
+                corners = indices[:, offset]
+            elif semantic == "NORMAL":
+                primitive_normals = sources[source][indices[:, offset], :3]
+            elif semantic == "TEXCOORD" and (uv_set is None or uv < uv_set):
+                uv_set = uv
+                primitive_uvs = sources[source][indices[:, offset], :2]
+        if corners is None:
+            raise UnsupportedColladaError("Mesh " + name + " has a " + kind + " without vertices")
+        if primitive_normals is None and "NORMAL" in vertex_inputs:
+            primitive_normals = sources[vertex_inputs["NORMAL"]][corners, :3]
+        if primitive_uvs is None and "TEXCOORD" in vertex_inputs:
+            primitive_uvs = sources[vertex_inputs["TEXCOORD"]][corners, :2]
+        symbol = primitive.get("material")
+        if symbol is not None and symbol not in materials:
+            materials.append(symbol)
+        loop_vertices.append(corners)
+        polygon_sizes.append(sizes)
+        material_indices.append(numpy.full(len(sizes), materials.index(symbol) if symbol is not None else 0, dtype=numpy.int32))
+        normals.append(primitive_normals)
+        uvs.append(primitive_uvs)
+    if not loop_vertices:
+        return ColladaMesh(name, positions, numpy.zeros(0, dtype=numpy.int32), numpy.zeros(0, dtype=numpy.int32),
+                           numpy.zeros(0, dtype=numpy.int32), materials)
+    sizes = numpy.concatenate(polygon_sizes)
+    loop_starts = numpy.zeros(len(sizes), dtype=numpy.int32)
+    numpy.cumsum(sizes[:-1], out=loop_starts[1:])
+    # Custom normals need every loop, so drop them if any primitive is missing them.
+    # Missing UVs are filled with zeros instead.
+    if any(n is None for n in normals):
+        normals = None
+    else:
+        normals = numpy.concatenate(normals).astype(numpy.float32)
+    if all(uv is None for uv in uvs):
+        uvs = None
+    else:
+        uvs = numpy.concatenate([uv if uv is not None else numpy.zeros((len(v), 2), dtype=numpy.float32)
+                                 for uv, v in zip(uvs, loop_vertices)]).astype(numpy.float32)
+    return ColladaMesh(name, positions.astype(numpy.float32), numpy.concatenate(loop_vertices).astype(numpy.int32),
+                       loop_starts, numpy.concatenate(material_indices), materials, normals, uvs)
+
+def read_skin(skin, ns, collada_mesh):
+    """ Adds the vertex weights of a <skin> to the mesh it deforms.  Influences that point
+        outside the joint or weight arrays are dropped.
+    """
+    joints = []
+    weights = numpy.zeros(0, dtype=numpy.float32)
+    vertex_weights = skin.find(ns + "vertex_weights")
+    if vertex_weights is None:
+        return
+    inputs = read_inputs(vertex_weights, ns)
+    for source in skin.iterfind(ns + "source"):
+        for semantic, source_id, _, _ in inputs:
+            if source_id != source.get("id"):
+                continue
+            if semantic == "JOINT":
+                names = source.find(ns + "Name_array")
+                if names is None:
+                    names = source.find(ns + "IDREF_array")
+                joints = (names.text or "").split() if names is not None else []
+            elif semantic == "WEIGHT":
+                weights = parse_floats(source.findtext(ns + "float_array"))
+    offsets = {semantic: offset for semantic, _, offset, _ in inputs}
+    if "JOINT" not in offsets or "WEIGHT" not in offsets:
+        return
+    stride = max(offsets.values()) + 1
+    counts = parse_ints(vertex_weights.findtext(ns + "vcount"))
+    influences = parse_ints(vertex_weights.findtext(ns + "v"))[:int(counts.sum()) * stride].reshape(-1, stride)
+    vertices = numpy.repeat(numpy.arange(len(counts), dtype=numpy.int32), counts)[:len(influences)]
+    joint_indices = influences[:, offsets["JOINT"]]
+    weight_indices = influences[:, offsets["WEIGHT"]]
+    valid = ((joint_indices >= 0) & (joint_indices < len(joints)) & (weight_indices >= 0) & (weight_indices < len(weights))
+             & (vertices < len(collada_mesh.positions)))
+    collada_mesh.skin_joints = joints
+    collada_mesh.weight_vertices = vertices[valid]
+    collada_mesh.weight_joints = joint_indices[valid]
+    collada_mesh.weight_values = weights[weight_indices[valid]]
+
+def read_transform(node, ns):
+    """ Returns the node's local matrix, composed from its transform elements in order. """
+    matrix = numpy.identity(4, dtype=numpy.float32)
+    for element in node:
+        kind = element.tag[len(ns):]
+        if kind == "matrix":
+            transform = parse_floats(element.text).reshape(4, 4)
+        elif kind == "translate":
+            transform = numpy.identity(4, dtype=numpy.float32)
+            transform[:3, 3] = parse_floats(element.text)[:3]
+        elif kind == "scale":
+            transform = numpy.diag(numpy.append(parse_floats(element.text)[:3], 1.0)).astype(numpy.float32)
+        elif kind == "rotate":
+            x, y, z, angle = parse_floats(element.text)[:4]
+            transform = numpy.identity(4, dtype=numpy.float32)
+            transform[:3, :3] = numpy.array(mathutils.Matrix.Rotation(math.radians(angle), 3, (x, y, z)))
+        elif kind in ("lookat", "skew"):
+            raise UnsupportedColladaError("Node " + str(node.get("id")) + " has a " + kind + " transform")
+        else:
+            continue
+        matrix = matrix @ transform
+    return matrix
+
+def read_node(node, ns, parent, nodes, skins, material_names):
+    if node.get("type") == "JOINT":
+        raise UnsupportedColladaError("Node " + str(node.get("id")) + " is a joint")
+    geometry = None
+    bindings = {}
+    instance = node.find(ns + "instance_geometry")
+    if instance is not None:
+        geometry = get_url_id(instance.get("url"))
+    else:
+        instance = node.find(ns + "instance_controller")
+        if instance is not None:
+            geometry = skins.get(get_url_id(instance.get("url")))
+    if instance is not None:
+        for material in instance.iterfind(ns + "bind_material/" + ns + "technique_common/" + ns + "instance_material"):
+            target = get_url_id(material.get("target"))
+            bindings[material.get("symbol")] = material_names.get(target, target)
+    index = len(nodes)
+    nodes.append(ColladaNode(node.get("name") or node.get("id") or "node", parent, read_transform(node, ns), geometry, bindings))
+    for child in node.iterfind(ns + "node"):
+        read_node(child, ns, index, nodes, skins, material_names)
+
+def create_mesh(collada_mesh, bindings, effects):
+    """ Builds a mesh datablock from a ColladaMesh.  bindings maps the mesh's material
+        symbols to material names; existing materials are reused, and new ones are built
+        from their entry in effects.
+    """
+    mesh = bpy.data.meshes.new(collada_mesh.name)
+    mesh.vertices.add(len(collada_mesh.positions))
+    mesh.vertices.foreach_set("co", collada_mesh.positions.ravel())
+    mesh.loops.add(len(collada_mesh.loop_vertices))
+    mesh.loops.foreach_set("vertex_index", collada_mesh.loop_vertices)
+    mesh.polygons.add(len(collada_mesh.loop_starts))
+    mesh.polygons.foreach_set("loop_start", collada_mesh.loop_starts)
+    if bpy.app.version < (4, 0, 0):
+        loop_totals = numpy.diff(numpy.append(collada_mesh.loop_starts, len(collada_mesh.loop_vertices))).astype(numpy.int32)
+        mesh.polygons.foreach_set("loop_total", loop_totals)
+    mesh.polygons.foreach_set("material_index", collada_mesh.material_indices)
+    if collada_mesh.uvs is not None:
+        uv_layer = mesh.uv_layers.new(name="UVMap")
+        uv_layer.data.foreach_set("uv", collada_mesh.uvs.ravel())
+    for symbol in collada_mesh.materials:
+        name = bindings.get(symbol, symbol)
+        material = bpy.data.materials.get(name)
+        if material is None:
+            material = create_material(name, effects.get(name))
+        mesh.materials.append(material)
+    mesh.validate(clean_customdata=False)
+    mesh.update(calc_edges=True)
+    if collada_mesh.normals is not None and len(mesh.loops) == len(collada_mesh.normals):
+        mesh.polygons.foreach_set("use_smooth", numpy.ones(len(mesh.polygons), dtype=bool))
+        if hasattr(mesh, "use_auto_smooth"):     # Needed for custom normals before Blender 4.1
+            mesh.use_auto_smooth = True
+        mesh.normals_split_custom_set(collada_mesh.normals)
+    return mesh
+
+def create_material(name, effect):
+    """ Builds a material from a read_effect result, as bpy.ops.wm.collada_import does: a
+        Principled BSDF with the diffuse color, or the diffuse texture plugged into it, and
+        the specular and bump textures.  Missing texture files are left out.
+    """
+    material = bpy.data.materials.new(name)
+    if effect is None:
+        return material
+    material.use_nodes = True
+    tree_nodes = material.node_tree
+    links = tree_nodes.links
+    shaderPrincipledBSDF = next(node for node in tree_nodes.nodes if node.type == 'BSDF_PRINCIPLED')
+    if effect["color"] is not None:
+        shaderPrincipledBSDF.inputs['Base Color'].default_value = effect["color"]
+        material.diffuse_color = effect["color"]
+    for channel, path in effect["textures"].items():
+        texturefile = utilities.resolve_file(path)
+        if not os.path.isfile(texturefile):
+            print("Texture " + path + " of material " + name + " not found")
+            continue
+        texture_node = tree_nodes.nodes.new('ShaderNodeTexImage')
+        texture_node.image = materials.load_image(texturefile)
+        if channel == "diffuse":
+            texture_node.location = -300, 300
+            links.new(texture_node.outputs[0], shaderPrincipledBSDF.inputs['Base Color'])
+        elif channel == "specular":
+            texture_node.location = -300, 0
+            texture_node.image.colorspace_settings.name = 'Non-Color'
+            links.new(texture_node.outputs[0], shaderPrincipledBSDF.inputs['Specular Tint'])
+        else:
+            texture_node.location = -500, -300
+            texture_node.image.colorspace_settings.name = 'Non-Color'
+            normal_map_node = tree_nodes.nodes.new('ShaderNodeNormalMap')
+            normal_map_node.location = -200, -300
+            links.new(texture_node.outputs[0], normal_map_node.inputs['Color'])
+            links.new(normal_map_node.outputs[0], shaderPrincipledBSDF.inputs['Normal'])
+    return material
+
+def assign_skin_weights(obj, collada_mesh):
+    """ Adds a vertex group for each joint of the mesh's skin.  The influences are grouped by
+        joint and rounded weight, so there is one call for each group instead of one for
+        each vertex.
+    """
+    if not collada_mesh.skin_joints or collada_mesh.weight_values is None or not len(collada_mesh.weight_values):
+        return
+    levels = numpy.rint(numpy.clip(collada_mesh.weight_values, 0.0, 1.0) * WEIGHT_LEVELS).astype(numpy.int32)
+    keys = collada_mesh.weight_joints.astype(numpy.int64) * (WEIGHT_LEVELS + 1) + levels
+    order = numpy.argsort(keys, kind="stable")
+    keys = keys[order]
+    vertices = collada_mesh.weight_vertices[order]
+    starts = numpy.flatnonzero(numpy.diff(keys, prepend=-1))
+    ends = numpy.append(starts[1:], len(keys))
+    groups = {}
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        joint, level = divmod(int(keys[start]), WEIGHT_LEVELS + 1)
+        if level == 0:
+            continue
+        name = collada_mesh.skin_joints[joint]
+        group = groups.get(name)
+        if group is None:
+            group = groups[name] = obj.vertex_groups.get(name) or obj.vertex_groups.new(name=name)
+        # ADD sums the influences of a vertex that lists a joint more than once.
+        group.add(vertices[start:end].tolist(), level / WEIGHT_LEVELS, 'ADD')
+
+def create_objects(collada_scene, collection, use_skin_weights=False):
+    """ Creates an object for each node of the scene in collection.  Nodes that instance
+        the same geometry share a mesh.  With use_skin_weights, skinned meshes get a vertex
+        group for each joint.  Returns the objects, parents first.
+    """
+    meshes = {}
+    objects = []
+    up_axis_matrix = mathutils.Matrix.Identity(4)
+    if collada_scene.up_axis == "Y_UP":
+        up_axis_matrix = mathutils.Matrix.Rotation(math.radians(90.0), 4, 'X')
+    for node in collada_scene.nodes:
+        data = None
+        new_mesh = False
+        if node.geometry in collada_scene.meshes:
+            data = meshes.get(node.geometry)
+            if data is None:
+                data = meshes[node.geometry] = create_mesh(collada_scene.meshes[node.geometry], node.materials, collada_scene.effects)
+                new_mesh = True
+        obj = bpy.data.objects.new(node.name, data)
+        collection.objects.link(obj)
+        if use_skin_weights and new_mesh:
+            # The weights and group names are stored on the mesh, so objects sharing it get them too.
+            assign_skin_weights(obj, collada_scene.meshes[node.geometry])
+        matrix = mathutils.Matrix(node.matrix.tolist())
+        if node.parent >= 0:
+            obj.parent = objects[node.parent]
+        else:
+            matrix = up_axis_matrix @ matrix
+        obj.matrix_basis = matrix
+        objects.append(obj)
+    return objects
+
+def import_collada(filepath, use_fast_loader=None, pipeline=None, use_skin_weights=False, **options):
+    """ Imports a Collada file into the active collection and returns the added objects.
+        As with bpy.ops.wm.collada_import, the new objects are left selected and a root
+        object is made active.  Falls back to the operator (called with options) when
+        use_fast_loader is off or the file has content the direct loader doesn't handle.
+        With a ParsePipeline decoding load_collada, the parsed file is taken from it.
+        A missing or unreadable file is reported and adds no objects.
+        use_skin_weights adds the vertex groups of skinned meshes; the operator always does.
+    """
+    if use_fast_loader is None:
+        use_fast_loader = constants.use_fast_collada
+    if use_fast_loader:
+        try:
+            collada_scene = pipeline.get(filepath) if pipeline is not None else load_collada(filepath)
+        except (UnsupportedColladaError, ET.ParseError, ValueError, KeyError, IndexError) as e:
+            print("Using the Collada importer for " + filepath + ": " + str(e))
+        except OSError as e:
+            print("Unable to read Collada file " + filepath + ": " + str(e))
+            return []
+        else:
+            for obj in bpy.context.selected_objects:
+                obj.select_set(False)
+            objects = create_objects(collada_scene, bpy.context.collection, use_skin_weights)
+            for obj in objects:
+                obj.select_set(True)
+            if objects:
+                bpy.context.view_layer.objects.active = objects[0]
+            return objects
+    bpy.ops.wm.collada_import(filepath=filepath, **options)
+    return bpy.context.selected_objects[:]
@@ -8,8 +8,14 @@ WEAPONS_COLLECTION = "Weapons"
 DAMAGED_PARTS_COLLECTION = "Damaged Parts"
 VARIANTS_COLLECTION = "Variants"
 MECH_COLLECTION = "Mech"
+PREFAB_ASSETS_COLLECTION = "Prefab Assets"  # Hidden source collections for instanced prefab assets
+TEXTURE_QUALITY = {'FULL': 1, 'HALF': 2, 'QUARTER': 4, 'THUMBNAIL': 16}  # Texture quality setting: factor to divide texture sides by
 
 basedir = ""
+file_system = None  # PakFileSystem used to find game files that haven't been extracted.
+asset_index = None  # AssetIndex of the files under basedir.
+use_fast_collada = True  # Build meshes with the direct Collada loader instead of bpy.ops.wm.collada_import.
+import_warnings = []  # Warnings of the last import, for the operators to report.
 
 # store keymaps here to access after registration
 addon_keymaps = []
@@ -0,0 +1,133 @@
+import os
+import threading
+
+from .CryXmlB.CryXmlCache import CryXmlCache, default_cache_dir
+from .PakFileSystem import normalize_path
+
+class AssetIndex:
+    """ Case insensitive index of the files under a game directory, built with one
+        os.scandir walk.  Maps normalized game-relative paths ("objects/mechs/...") to
+        the real paths on disk, so lookups of existing files don't touch the file system.
+
+        The index can be cached on disk.  It also records the modification time of every
+        directory, and revalidate() rescans when any of them changed, so files converted or
+        extracted deeper in the tree are picked up.  A lookup that misses checks the disk
+        too.  When the file turns out to exist it is added to the index and its directory
+        is marked as changed, so the next revalidate() rescans.
+    """
+    indexes = {}    # Game directory: AssetIndex, shared by every import in the session
+
+    def __init__(self, root, index_cache=None):
+        self.root = os.path.abspath(root)
+        self.root_path = normalize_path(self.root)
+        self.index_cache = index_cache
+        self.lock = threading.Lock()
+        self.files = None
+        self.directories = None     # Real directory path: st_mtime_ns when it was scanned
+        if index_cache is not None and index_cache.enabled:
+            cached = index_cache.load(self.root)
+            if isinstance(cached, tuple):
+                self.files, self.directories = cached
+                self.revalidate()
+        if self.files is None:
+            self.refresh()
+
+    @classmethod
+    def for_directory(cls, root, index_cache=None):
+        """ Returns the index for root, building it the first time root is used and
+            revalidating it after that.
+        """
+        key = os.path.normcase(os.path.abspath(root))
+        index = cls.indexes.get(key)
+        if index is None:
+            index = cls.indexes[key] = cls(root, index_cache)
+            print("Indexed " + str(len(index.files)) + " files under " + index.root)
+        elif index.revalidate():
+            print("Reindexed " + str(len(index.files)) + " files under " + index.root)
+        return index
+
+    def refresh(self):
+        with self.lock:
+            self.files, self.directories = self.scan()
+            if self.index_cache is not None and self.index_cache.enabled:
+                self.index_cache.store(self.root, (self.files, self.directories))
+
+    def add_file(self, game_path, real_path):
+        """ Adds a file found outside of a scan, and marks its directory as changed. """
+        with self.lock:
+            self.files[game_path] = real_path
+            self.directories[os.path.dirname(real_path)] = None
+
+    def is_stale(self):
+        for directory, mtime in self.directories.items():
+            try:
+                if os.stat(directory).st_mtime_ns != mtime:
+                    return True
+            except OSError:
+                return True
+        return False
+
+    def revalidate(self):
+        """ Rescans the tree if a directory changed since the last scan.  Returns True if it did. """
+        if not self.is_stale():
+            return False
+        self.refresh()
+        return True
+
+    def scan(self):
+        files = {}
+        directories = {}
+        pending = [(self.root, "")]
+        while pending:
+            directory, prefix = pending.pop()
+            try:
+                directories[directory] = os.stat(directory).st_mtime_ns
+                entries = os.scandir(directory)
+            except OSError:
+                continue
+            with entries:
+                for entry in entries:
+                    name = prefix + entry.name.lower()
+                    try:
+                        if entry.is_dir():
+                            pending.append((entry.path, name + "/"))
+                        else:
+                            files[name] = entry.path
+                    except OSError:
+                        continue
+        return files, directories
+
+    def game_path(self, path):
+        """ Returns the normalized game-relative path for a relative path or an absolute
+            path under root, or None for an absolute path somewhere else.
+        """
+        path = path.replace("\\", "/")
+        if not os.path.isabs(path):
+            path = os.path.join(self.root, path)
+        path = normalize_path(os.path.normpath(path))
+        if self.root_path and not path.startswith(self.root_path + "/"):
+            return None
+        return path[len(self.root_path) + 1:] if self.root_path else path
+
+    def covers(self, path):
+        return self.game_path(path) is not None
+
+    def lookup(self, path):
+        """ Returns the real path of the file at path, or None if it doesn't exist. """
+        game_path = self.game_path(path)
+        if game_path is None:
+            return None
+        real_path = self.files.get(game_path)
+        if real_path is None:
+            # Not in the index, but it may have been added since the index was built.
+            real_path = path.replace("\\", "/")
+            if not os.path.isabs(real_path):
+                real_path = os.path.join(self.root, real_path)
+            real_path = os.path.normpath(real_path)
+            if not os.path.isfile(real_path):
+                return None
+            self.add_file(game_path, real_path)
+        return real_path
+
+# Cache of the asset indexes.  Set enabled to False to bypass it.
+asset_index_cache = CryXmlCache(default_cache_dir("assetindex"))
@@ -0,0 +1,259 @@
+""" Imports a roster of mechs and prefab libraries into .blend files, with several Blender
+instances running in the background at once.
+
+Does not need Blender to start; each asset is imported by a `blender --background` worker:
+
+    python -m cryengine_tools.BatchImporter <.cdf, prefab .xml, directory or manifest>... [--blender <path>] [--output <directory>] [--workers N] [--report report.json]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+
+from .CryXmlB.CryXmlReader import CryXmlSerializer
+
+MECH = "mech"
+PREFAB = "prefab"
+PREFAB_ROOT = "PrefabsLibrary"
+MANIFEST_EXTENSIONS = (".json", ".txt")
+ADDON_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+WORKER_SCRIPT = os.path.join(ADDON_DIR, "batch_worker.py")
+DEFAULT_RETRIES = 2
+LOG_TAIL_LINES = 40
+
+@dataclass
+class BatchJob:
+    path: str
+    type: str                       # MECH or PREFAB
+    output: str = None              # .blend file to write, or None to save next to path
+    options: dict = field(default_factory=dict)     # Keyword arguments for import_mech/import_prefab
+
+def is_prefab_library(file):
+    try:
+        for event, element in CryXmlSerializer().iterparse(file, events=("start",)):
+            return element.tag == PREFAB_ROOT
+    except Exception:
+        pass
+    return False
+
+def get_job_type(file):
+    extension = os.path.splitext(file)[1].lower()
+    if extension == ".cdf":
+        return MECH
+    if extension == ".xml" and is_prefab_library(file):
+        return PREFAB
+    return None
+
+def read_manifest(file):
+    """ Reads the jobs of a manifest.  A .txt manifest lists one asset per line.  A .json
+        manifest is a list of entries, or {"options": {...}, "jobs": [...]}, where an entry
+        is a path or {"path": ..., "type": ..., "output": ..., "options": {...}}.  Relative
+        paths are relative to the manifest.
+    """
+    directory = os.path.dirname(os.path.abspath(file))
+    with open(file, encoding="utf-8") as f:
+        if file.lower().endswith(".txt"):
+            manifest = [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+        else:
+            manifest = json.load(f)
+    options = {}
+    if isinstance(manifest, dict):
+        options = manifest.get("options", {})
+        manifest = manifest.get("jobs", [])
+    entries = []
+    for entry in manifest:
+        if isinstance(entry, str):
+            entry = {"path": entry}
+        entry = dict(entry)
+        entry["path"] = os.path.join(directory, entry["path"])
+        if entry.get("output"):
+            entry["output"] = os.path.join(directory, entry["output"])
+        entry["options"] = {**options, **entry.get("options", {})}
+        entries.append(entry)
+    return entries
+
+def find_jobs(inputs, output_dir=None, options=None):
+    """ Returns a BatchJob for each .cdf and prefab library in inputs, which are asset files,
+        directories to search and manifests.  options are the defaults for every job.
+    """
+    entries = []
+    for path in inputs:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                entries.extend({"path": os.path.join(root, name)} for name in sorted(files)
+                               if name.lower().endswith((".cdf", ".xml")))
+        elif path.lower().endswith(MANIFEST_EXTENSIONS):
+            entries.extend(read_manifest(path))
+        else:
+            entries.append({"path": path, "required": True})
+    jobs = []
+    outputs = {}
+    for entry in entries:
+        path = os.path.abspath(entry["path"])
+        job_type = entry.get("type") or get_job_type(path)
+        if job_type not in (MECH, PREFAB):
+            if entry.get("required") or "type" in entry or entry.get("output"):
+                raise ValueError("Not a .cdf or prefab library: " + path)
+            continue    # Some other XML file in a searched directory
+        output = entry.get("output")
+        if output is None and output_dir is not None:
+            output = os.path.join(output_dir, os.path.splitext(os.path.basename(path))[0] + ".blend")
+        if output is not None:
+            output = os.path.abspath(output)
+            key = os.path.normcase(output)
+            if key in outputs:
+                raise ValueError(path + " and " + outputs[key] + " would both be saved to " + output)
+            outputs[key] = path
+        jobs.append(BatchJob(path, job_type, output, {**(options or {}), **entry.get("options", {})}))
+    return jobs
+
+def get_log_tail(output, lines=LOG_TAIL_LINES):
+    if isinstance(output, bytes):
+        output = output.decode("utf-8", "replace")
+    return "\n".join((output or "").splitlines()[-lines:])
+
+class BatchImporter:
+    """ Runs BatchJobs on a pool of background Blender processes.  A worker that crashes or
+        times out is started again, up to retries times.  An import that fails with a Python
+        error is reported and not retried.
+    """
+    def __init__(self, blender="blender", workers=None, retries=DEFAULT_RETRIES, timeout=None, worker_script=WORKER_SCRIPT):
+        self.blender = blender
+        self.workers = workers or os.cpu_count() or 1
+        self.retries = retries
+        self.timeout = timeout
+        self.worker_script = worker_script
+        self.lock = threading.Lock()
+
+    def command(self, job_file, result_file):
+        return [self.blender, "--background", "--factory-startup", "--python", self.worker_script, "--", job_file, result_file]
+
+    def run(self, jobs):
+        """ Runs every job and returns the report. """
+        start = time.perf_counter()
+        report = {"started": time.strftime("%Y-%m-%dT%H:%M:%S"), "blender": self.blender, "workers": self.workers}
+        results = [None] * len(jobs)
+        with tempfile.TemporaryDirectory(prefix="cryengine_batch_") as work_dir:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                futures = {executor.submit(self.run_job, job, os.path.join(work_dir, "job%d" % i)): i for i, job in enumerate(jobs)}
+                for finished, future in enumerate(as_completed(futures), 1):
+                    result = results[futures[future]] = future.result()
+                    print("[%d/%d] %s %s (%.1fs, %d attempts)" % (finished, len(jobs), result["status"], result["path"],
+                                                                  result["seconds"], result["attempts"]))
+        report["seconds"] = time.perf_counter() - start
+        report["succeeded"] = sum(1 for result in results if result["status"] == "ok")
+        report["failed"] = len(results) - report["succeeded"]
+        report["assets"] = results
+        return report
+
+    def run_job(self, job, job_prefix):
+        """ Imports one asset in a Blender process.  Returns the job's entry in the report. """
+        job_file = job_prefix + ".json"
+        result_file = job_prefix + ".result.json"
+        with open(job_file, "w", encoding="utf-8") as f:
+            json.dump({"path": job.path, "type": job.type, "output": job.output, "options": job.options}, f)
+        result = {"path": job.path, "type": job.type, "output": job.output, "status": "failed",
+                  "attempts": 0, "seconds": 0.0, "error": None}
+        for attempt in range(self.retries + 1):
+            if os.path.exists(result_file):
+                os.remove(result_file)
+            result["attempts"] += 1
+            start = time.perf_counter()
+            try:
+                completed = subprocess.run(self.command(job_file, result_file), stdout=subprocess.PIPE,
+                                           stderr=subprocess.STDOUT, timeout=self.timeout)
+                log, error = completed.stdout, "Blender exited with code " + str(completed.returncode)
+            except subprocess.TimeoutExpired as e:
+                log, error = e.output, "Timed out after " + str(self.timeout) + "s"
+            except OSError as e:
+                result["error"] = "Unable to start Blender: " + str(e)
+                break
+            finally:
+                result["seconds"] += time.perf_counter() - start
+            worker_result = self.read_result(result_file)
+            if worker_result is not None:
+                result.update(worker_result)
+                if result["status"] != "ok":
+                    result["log"] = get_log_tail(log)
+                break
+            result["error"] = error
+            result["log"] = get_log_tail(log)
+            if attempt < self.retries:
+                with self.lock:
+                    print(error + " importing " + job.path + ", retrying")
+        return result
+
+    def read_result(self, result_file):
+        try:
+            with open(result_file, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None     # The worker died before writing it
+
+def write_report(report, file):
+    os.makedirs(os.path.dirname(os.path.abspath(file)), exist_ok=True)
+    with open(file, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+def print_summary(report):
+    seconds = max(report["seconds"], 1e-9)
+    total = report["succeeded"] + report["failed"]
+    print("Imported %d of %d assets in %.1fs on %d workers, %.2f assets/min" %
+          (report["succeeded"], total, seconds, report["workers"], 60 * report["succeeded"] / seconds))
+    for result in report["assets"]:
+        for warning in result.get("warnings", ()):
+            print("Warning: " + result["path"] + ": " + warning)
+        if result["status"] != "ok":
+            error = (result["error"] or "").strip().splitlines()
+            print("Failed: " + result["path"] + (": " + error[-1] if error else ""))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import Cryengine mechs and prefab libraries into .blend files with background Blender workers.")
+    parser.add_argument("inputs", nargs="+", help=".cdf files, prefab libraries, directories to search, or .json/.txt manifests")
+    parser.add_argument("-b", "--blender", default=os.environ.get("BLENDER", "blender"),
+                        help="Blender executable (default: $BLENDER or blender)")
+    parser.add_argument("-o", "--output", help="Save the .blend files in this directory instead of next to each asset")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="Number of Blender processes (default: CPU count)")
+    parser.add_argument("-r", "--retries", type=int, default=DEFAULT_RETRIES, help="Restarts of a crashed worker (default: %(default)s)")
+    parser.add_argument("-t", "--timeout", type=float, default=None, help="Seconds before a worker is stopped and retried")
+    parser.add_argument("--report", default="batch_report.json", help="JSON report file (default: %(default)s)")
+    parser.add_argument("--use-tif", action="store_true", help="Use .tif textures instead of .dds")
+    parser.add_argument("--pak-files", action="store_true", help="Read files from the game's .pak files")
+    parser.add_argument("--no-parse-cache", action="store_true", help="Don't use the parse caches")
+    parser.add_argument("--no-fast-collada", action="store_true", help="Import geometry with the Collada operator")
+    parser.add_argument("--no-control-bones", action="store_true", help="Don't add control bones to mechs")
+    parser.add_argument("--skin-weights", action="store_true", help="Use the skin weights of skinned mech parts")
+    parser.add_argument("--bake-textures", action="store_true", help="Bake normal and roughness maps for mech materials")
+    parser.add_argument("--texture-budget", type=int, default=0, help="Warn when the textures need more MB than this (default: no budget)")
+    parser.add_argument("--downscale-textures", action="store_true", help="Downscale the textures of imports over the texture budget")
+    parser.add_argument("--texture-quality", choices=("full", "half", "quarter", "thumbnail"), default="full",
+                        help="Use downscaled copies of the textures (default: %(default)s)")
+    parser.add_argument("--collection-instances", action="store_true", help="Instance repeated prefab assets")
+    args = parser.parse_args(argv)
+    options = {"use_dds": not args.use_tif, "use_tif": args.use_tif, "use_pak_files": args.pak_files,
+               "use_parse_cache": not args.no_parse_cache, "use_fast_collada": not args.no_fast_collada,
+               "add_control_bones": not args.no_control_bones, "use_skin_weights": args.skin_weights,
+               "use_baked_textures": args.bake_textures, "use_collection_instances": args.collection_instances,
+               "texture_budget": args.texture_budget, "texture_budget_action": "DOWNSCALE" if args.downscale_textures else "WARN",
+               "texture_quality": args.texture_quality.upper()}
+    try:
+        jobs = find_jobs(args.inputs, args.output, options)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    importer = BatchImporter(args.blender, args.workers, args.retries, args.timeout)
+    report = importer.run(jobs)
+    write_report(report, args.report)
+    print_summary(report)
+    print("Report: " + os.path.abspath(args.report))
+    return 1 if report["failed"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,50 @@
+import os
+import xml.etree.ElementTree as ET
+from urllib.parse import unquote
+
+# The images a Collada file's materials use.  Cryengine Converter lists each texture
+# in <library_images>, with the path relative to the .dae file.
+
+def get_image_path(image, ns=""):
+    """ Returns the file an <image> element points at, as written in the file (relative
+        or absolute, with any file: scheme removed), or None if it has none.
+    """
+    init_from = image.find(ns + "init_from")
+    if init_from is None:
+        return None
+    ref = init_from.find(ns + "ref")     # Collada 1.5
+    uri = ((ref if ref is not None else init_from).text or "").strip()
+    if not uri:
+        return None
+    if uri.lower().startswith("file:"):
+        uri = uri[5:]
+        if uri.startswith("///"):
+            uri = uri[3:] if uri[4:5] == ":" else uri[2:]    # file:///C:/... or file:///home/...
+        elif uri.startswith("//"):
+            uri = uri[2:]
+    return unquote(uri)
+
+def resolve_image_path(dae_file, path):
+    """ Returns path, an image path read from dae_file, relative to the current directory. """
+    return os.path.normpath(os.path.join(os.path.dirname(dae_file), path))
+
+def read_image_paths(source):
+    """ Returns {image id: path} for the <library_images> of a Collada file (a path or a
+        file object).  Only the start of the file is parsed: reading stops when the
+        geometry starts.
+    """
+    images = {}
+    ns = ""
+    for event, element in ET.iterparse(source, events=("start", "end")):
+        tag = element.tag
+        if event == "start":
+            if tag.endswith("}COLLADA"):
+                ns = tag[:tag.index("}") + 1]
+            elif tag in (ns + "library_geometries", ns + "library_controllers", ns + "library_visual_scenes"):
+                break
+        elif tag == ns + "image":
+            path = get_image_path(element, ns)
+            if path is not None:
+                images[element.get("id")] = path
+            element.clear()
+    return images
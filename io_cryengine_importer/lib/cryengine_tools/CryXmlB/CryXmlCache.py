@@ -0,0 +1,146 @@
+import hashlib
+import marshal
+import os
+import threading
+
+CACHE_MAGIC = b"CXC1"
+CACHE_EXTENSION = ".cxc"
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024    # 256 MB
+
+def default_cache_dir(name="cryxml"):
+    base = os.environ.get("LOCALAPPDATA") or os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "cryengine_importer", name)
+
+class CryXmlCache:
+    """ On-disk cache of decoded CryXmlB tables, keyed by the absolute path, size and
+        modification time of the source file.  Entries are stored with marshal, and the
+        least recently used entries are evicted once the cache grows past max_size bytes.
+        The size is scanned once and then kept as a running total of the entries this
+        cache writes, so the directory is only listed again when the total passes max_size.
+        Any marshal-able value can be stored, so it is also used for other per-file indexes.
+    """
+    extension = CACHE_EXTENSION
+
+    def __init__(self, cache_dir=None, max_size=DEFAULT_MAX_SIZE, enabled=True):
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.max_size = max_size
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.total_size = None      # Running size of the cache directory, None until it is scanned
+        self.size_lock = threading.Lock()
+
+    def entry_path(self, file):
+        key = hashlib.sha1(os.path.normcase(os.path.abspath(file)).encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, key + self.extension)
+
+    def load(self, file):
+        """ Returns the cached tables for file, or None if there is no valid entry. """
+        entry = self.entry_path(file)
+        try:
+            stat = os.stat(file)
+            with open(entry, "rb") as f:
+                data = f.read()
+        except OSError:
+            self.misses += 1
+            return None
+        try:
+            if data[:len(CACHE_MAGIC)] != CACHE_MAGIC:
+                raise ValueError("Bad cache entry")
+            size, mtime, tables = marshal.loads(data[len(CACHE_MAGIC):])
+        except (EOFError, ValueError, TypeError):
+            print("Removing unreadable cache entry " + entry)
+            self.remove(entry)
+            self.misses += 1
+            return None
+        if size != stat.st_size or mtime != stat.st_mtime_ns:
+            self.misses += 1
+            return None
+        os.utime(entry)     # Mark as recently used
+        self.hits += 1
+        return tables
+
+    def store(self, file, tables):
+        stat = os.stat(file)
+        entry = self.entry_path(file)
+        data = CACHE_MAGIC + marshal.dumps((stat.st_size, stat.st_mtime_ns, tables))
+        if len(data) > self.max_size:
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            temp_entry = entry + "." + str(os.getpid()) + "." + str(threading.get_ident())
+            with open(temp_entry, "wb") as f:
+                f.write(data)
+            replaced = self.entry_size(entry)
+            os.replace(temp_entry, entry)
+        except OSError as e:
+            print("Unable to write cache entry for " + file + ": " + str(e))
+            return
+        self.stored(len(data), replaced)
+
+    def entry_size(self, entry):
+        """ Returns the size of an existing entry, or 0 if there is none. """
+        try:
+            return os.path.getsize(entry)
+        except OSError:
+            return 0
+
+    def stored(self, size, replaced=0):
+        """ Adds an entry of size bytes that replaced one of replaced bytes to the running
+            total, and evicts entries once the total passes max_size.
+        """
+        with self.size_lock:
+            if self.total_size is None:
+                self.total_size = self.size()     # Includes the new entry.
+            else:
+                self.total_size += size - replaced
+            if self.total_size > self.max_size:
+                self.evict()
+
+    def entries(self):
+        """ Returns (last used, size, path) for each cache entry, least recently used first. """
+        try:
+            scan = list(os.scandir(self.cache_dir))
+        except OSError:
+            return []
+        entries = []
+        for entry in scan:
+            if entry.name.endswith(self.extension):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        entries.sort()
+        return entries
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        # Rescanning also picks up entries written by other processes sharing the directory.
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_size:
+                break
+            self.remove(path)
+            total -= size
+        self.total_size = total
+
+    def purge(self):
+        """ Removes every entry from the cache. """
+        for _, _, path in self.entries():
+            self.remove(path)
+        self.total_size = None
+        self.hits = 0
+        self.misses = 0
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+# Cache shared by the importers.  Set enabled to False to bypass it.
+parse_cache = CryXmlCache()
@@ -0,0 +1,121 @@
+""" Converts every CryXmlB file under a directory to text XML.
+
+Does not need Blender.  Run it with any Python 3.9+ interpreter:
+
+    python -m cryengine_tools.CryXmlB.CryXmlConverter <game directory> [--output <mirror directory>]
+"""
+
+import argparse
+import os
+import sys
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+
+from .CryXmlReader import CryXmlSerializer
+
+CRYXMLB_EXTENSIONS = (".mtl", ".cdf", ".chrparams", ".xml")
+CRYXMLB_SIGNATURE = b"CryXmlB"
+TEXT_SUFFIX = ".xml"
+
+def is_cryxmlb_file(file):
+    with open(file, "rb") as f:
+        return f.read(len(CRYXMLB_SIGNATURE)) == CRYXMLB_SIGNATURE
+
+def get_output_file(file, source_dir, output_dir=None):
+    """ Returns where the text version of file is written.  Next to the source
+        (with an extra .xml suffix) when there is no output_dir, otherwise at the
+        same relative path in the mirror tree.
+    """
+    if output_dir is None:
+        return file + TEXT_SUFFIX
+    return os.path.join(output_dir, os.path.relpath(file, source_dir))
+
+def is_output_file(name, extensions=CRYXMLB_EXTENSIONS):
+    name = name.lower()
+    return name.endswith(TEXT_SUFFIX) and name[:-len(TEXT_SUFFIX)].endswith(extensions)
+
+def find_files(source_dir, extensions=CRYXMLB_EXTENSIONS):
+    for root, dirs, files in os.walk(source_dir):
+        for name in files:
+            if name.lower().endswith(extensions) and not is_output_file(name, extensions):
+                yield os.path.join(root, name)
+
+def is_up_to_date(file, output_file):
+    try:
+        return os.stat(output_file).st_mtime_ns >= os.stat(file).st_mtime_ns
+    except OSError:
+        return False
+
+def convert_file(file, output_file):
+    """ Writes the text version of a CryXmlB file.
+        Returns (converted, bytes read, error message).
+    """
+    try:
+        if not is_cryxmlb_file(file):
+            return False, 0, None
+        root = CryXmlSerializer().read_file(file)
+        tree = ET.ElementTree(root)
+        ET.indent(tree)
+        os.makedirs(os.path.dirname(os.path.abspath(output_file)), exist_ok=True)
+        tree.write(output_file, encoding="utf-8", xml_declaration=True)
+        return True, os.path.getsize(file), None
+    except Exception as e:
+        return False, 0, str(e)
+
+def convert_directory(source_dir, output_dir=None, workers=None, force=False, extensions=CRYXMLB_EXTENSIONS):
+    """ Converts every CryXmlB file under source_dir on a process pool.
+        Returns a dict of counters and the elapsed time.
+    """
+    if output_dir is not None and os.path.abspath(output_dir) == os.path.abspath(source_dir):
+        output_dir = None
+    start = time.perf_counter()
+    summary = {"converted": 0, "skipped": 0, "up_to_date": 0, "failed": 0, "bytes": 0}
+    jobs = []
+    for file in find_files(source_dir, extensions):
+        output_file = get_output_file(file, source_dir, output_dir)
+        if not force and is_up_to_date(file, output_file):
+            summary["up_to_date"] += 1
+        else:
+            jobs.append((file, output_file))
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, len(jobs) // (4 * workers))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(convert_file, [file for file, _ in jobs], [output for _, output in jobs], chunksize=chunksize)
+        for (file, _), (converted, size, error) in zip(jobs, results):
+            if error is not None:
+                print("Unable to convert " + file + ": " + error)
+                summary["failed"] += 1
+            elif converted:
+                summary["converted"] += 1
+                summary["bytes"] += size
+            else:
+                summary["skipped"] += 1
+    summary["seconds"] = time.perf_counter() - start
+    return summary
+
+def print_summary(summary):
+    seconds = max(summary["seconds"], 1e-9)
+    megabytes = summary["bytes"] / (1024 * 1024)
+    print("Converted %d files (%.1f MB) in %.2fs: %.1f files/s, %.1f MB/s" %
+          (summary["converted"], megabytes, seconds, summary["converted"] / seconds, megabytes / seconds))
+    print("Up to date: %d, not CryXmlB: %d, failed: %d" % (summary["up_to_date"], summary["skipped"], summary["failed"]))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert Cryengine binary XML (CryXmlB) files to text XML.")
+    parser.add_argument("source", help="Directory to search, e.g. an extracted game directory")
+    parser.add_argument("-o", "--output", help="Write into this mirror directory instead of next to each source file")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="Number of worker processes (default: CPU count)")
+    parser.add_argument("-f", "--force", action="store_true", help="Convert files even if the output is newer")
+    parser.add_argument("-e", "--extensions", nargs="+", default=list(CRYXMLB_EXTENSIONS),
+                        help="File extensions to check (default: %(default)s)")
+    args = parser.parse_args(argv)
+    if not os.path.isdir(args.source):
+        parser.error("Not a directory: " + args.source)
+    extensions = tuple(e.lower() if e.startswith(".") else "." + e.lower() for e in args.extensions)
+    summary = convert_directory(args.source, args.output, args.workers, args.force, extensions)
+    print_summary(summary)
+    return 1 if summary["failed"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
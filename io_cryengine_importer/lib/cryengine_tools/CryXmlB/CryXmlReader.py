@@ -0,0 +1,504 @@
+import io
+import mmap
+import os
+import struct
+import sys
+import weakref
+import xml.etree.ElementTree as ET
+from xml.etree import ElementPath
+from xml.etree.ElementTree import Element
+
+# On-disk layouts of the CryXmlB header and tables (little endian).
+HEADER_FORMAT = struct.Struct('<9i')
+# 28 bytes: name offset, content offset, attribute count, child count, parent id,
+# first attribute index, first child index, reserved
+NODE_FORMAT = struct.Struct('<iihhiiii')
+REFERENCE_FORMAT = struct.Struct('<ii')         # 8 bytes: name offset, value offset
+ORDER_FORMAT = struct.Struct('<i')              # 4 bytes: child node id
+
+class CryXmlStringPool:
+    """ Intern pool shared by decoded documents, so tag names, attribute names and
+        repeated values (shader names, texture paths, bone names) are stored once per
+        process instead of once per document.
+    """
+    def __init__(self, max_length=256):
+        self.max_length = max_length    # Longer values are unlikely to repeat and aren't pooled.
+        self.strings = {}
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+
+    def intern(self, value):
+        if len(value) > self.max_length:
+            return value
+        pooled = self.strings.get(value)
+        if pooled is None:
+            self.strings[value] = value
+            self.misses += 1
+            return value
+        if pooled is not value:
+            self.hits += 1
+            self.bytes_saved += sys.getsizeof(value)
+        return pooled
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self):
+        return {"strings": len(self.strings), "hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hit_rate(), "bytes_saved": self.bytes_saved}
+
+    def clear(self):
+        self.strings.clear()
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+
+# Pool shared by the importers.
+string_pool = CryXmlStringPool()
+
+class InterningTreeBuilder(ET.TreeBuilder):
+    """ TreeBuilder for text XML files that passes names and values through a CryXmlStringPool. """
+    def __init__(self, string_pool):
+        super().__init__()
+        self.string_pool = string_pool
+
+    def start(self, tag, attrs):
+        intern = self.string_pool.intern
+        return super().start(intern(tag), {intern(name): intern(value) for name, value in attrs.items()})
+
+class CryXmlStringTable:
+    """ String table backed by a buffer (usually an mmap) that decodes each
+        string the first time its offset is looked up.
+    """
+    def __init__(self, buffer, offset, length, string_pool=None):
+        self.buffer = buffer
+        self.offset = offset
+        self.length = length
+        self.string_pool = string_pool
+        self.strings = {}
+
+    def __contains__(self, offset):
+        # Only offsets where a string starts are valid, like the keys of read_string_table's
+        # dict: the start of the table, or just after a NUL.
+        if offset == 0:
+            return True
+        return 0 < offset < self.length and self.buffer[self.offset + offset - 1] == 0
+
+    def __getitem__(self, offset):
+        value = self.strings.get(offset)
+        if value is None:
+            if offset not in self:
+                raise KeyError(offset)
+            start = self.offset + offset
+            end = self.buffer.find(b"\0", start, self.offset + self.length)
+            if end < 0:
+                end = self.offset + self.length
+            value = bytes(self.buffer[start:end]).decode("utf-8")
+            if self.string_pool is not None:
+                value = self.string_pool.intern(value)
+            self.strings[offset] = value
+        return value
+
+    def get(self, offset, default=None):
+        return self[offset] if offset in self else default
+
+    def close(self):
+        if hasattr(self.buffer, "close"):
+            self.buffer.close()
+
+class CryXmlElement:
+    """ Read-only view of one node of a CryXmlDocument with the subset of the
+        ElementTree Element API the importer uses.
+    """
+    __slots__ = ("document", "node_id", "_attrib")
+    text = None
+    tail = None
+
+    def __init__(self, document, node_id):
+        self.document = document
+        self.node_id = node_id
+        self._attrib = None
+
+    def __repr__(self):
+        return "<CryXmlElement %r at %#x>" % (self.tag, id(self))
+
+    @property
+    def tag(self):
+        return self.document.tag(self.node_id)
+
+    @property
+    def attrib(self):
+        if self._attrib is None:
+            self._attrib = self.document.attributes(self.node_id)
+        return self._attrib
+
+    def get(self, key, default=None):
+        return self.attrib.get(key, default)
+
+    def keys(self):
+        return self.attrib.keys()
+
+    def items(self):
+        return self.attrib.items()
+
+    def __len__(self):
+        return len(self.document.child_ids(self.node_id))
+
+    def __getitem__(self, index):
+        child_ids = self.document.child_ids(self.node_id)
+        if isinstance(index, slice):
+            return [self.document.element(node_id) for node_id in child_ids[index]]
+        return self.document.element(child_ids[index])
+
+    def __iter__(self):
+        for node_id in self.document.child_ids(self.node_id):
+            yield self.document.element(node_id)
+
+    def iter(self, tag=None):
+        if tag == "*":
+            tag = None
+        document = self.document
+        if tag is not None and self.node_id == document.root_id:
+            for node_id in document.node_ids(tag):
+                yield document.element(node_id)
+            return
+        stack = [self.node_id]
+        while stack:
+            node_id = stack.pop()
+            if tag is None or document.tag(node_id) == tag:
+                yield document.element(node_id)
+            stack.extend(reversed(document.child_ids(node_id)))
+
+    def find(self, path, namespaces=None):
+        return ElementPath.find(self, path, namespaces)
+
+    def findall(self, path, namespaces=None):
+        return ElementPath.findall(self, path, namespaces)
+
+    def iterfind(self, path, namespaces=None):
+        return ElementPath.iterfind(self, path, namespaces)
+
+    def to_element(self):
+        """ Builds a regular ElementTree Element for this node and its children. """
+        element = Element(self.tag, self.attrib)
+        element.extend(child.to_element() for child in self)
+        return element
+
+class CryXmlDocument:
+    """ Decoded CryXmlB document that keeps the node, reference and order tables
+        as arrays and creates CryXmlElement objects only for nodes that are accessed.
+        Mirrors the parts of the ElementTree API used by the importer.
+    """
+    root_id = 0
+
+    def __init__(self, node_table, attribute_table, order_table, data_map):
+        self.node_table = node_table
+        self.attribute_table = attribute_table
+        self.order_table = [node_id for (node_id,) in order_table]
+        self.data_map = data_map
+        self.elements = {}
+        self.tag_index = None
+
+    def tag(self, node_id):
+        return self.data_map[self.node_table[node_id][0]]
+
+    def attributes(self, node_id):
+        # Like the engine's reader, the node's first attribute index locates its references.
+        data_map = self.data_map
+        node = self.node_table[node_id]
+        return {data_map[name_offset]: data_map.get(value_offset, "BUGGED")
+                for name_offset, value_offset in self.attribute_table[node[5]:node[5] + node[2]]}
+
+    def child_ids(self, node_id):
+        node = self.node_table[node_id]
+        return self.order_table[node[6]:node[6] + node[3]]
+
+    def node_ids(self, tag):
+        """ Returns the ids of all nodes named tag, in document order. """
+        if self.tag_index is None:
+            tag_index = {}
+            data_map = self.data_map
+            for node_id, node in enumerate(self.node_table):
+                tag_index.setdefault(data_map[node[0]], []).append(node_id)
+            self.tag_index = tag_index
+        return self.tag_index.get(tag, [])
+
+    def element(self, node_id):
+        element = self.elements.get(node_id)
+        if element is None:
+            element = self.elements[node_id] = CryXmlElement(self, node_id)
+        return element
+
+    def getroot(self):
+        return self.element(self.root_id)
+
+    def iter(self, tag=None):
+        return self.getroot().iter(tag)
+
+    def find(self, path, namespaces=None):
+        return self.getroot().find(path, namespaces)
+
+    def findall(self, path, namespaces=None):
+        return self.getroot().findall(path, namespaces)
+
+    def iterfind(self, path, namespaces=None):
+        return self.getroot().iterfind(path, namespaces)
+
+    def close(self):
+        """ Closes the memory map that a document read with use_mmap decodes its strings
+            from.  Strings that weren't accessed before can't be read afterwards.  Otherwise
+            the map is closed when the document is released.
+        """
+        if isinstance(self.data_map, CryXmlStringTable):
+            self.data_map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class CryXmlSerializer:
+    def __init__(self, use_mmap=False, lazy=False, cache=None, file_system=None, string_pool=None):
+        # With use_mmap the file is memory mapped instead of read, tables are unpacked
+        # straight from the mapping and strings are only decoded when referenced.
+        self.use_mmap = use_mmap
+        # With lazy, binary files are returned as a CryXmlDocument instead of a full Element tree.
+        self.lazy = lazy
+        # Optional CryXmlCache.  Decoded tables of binary files are stored in it, and
+        # cache hits skip decoding entirely.
+        self.cache = cache
+        # Optional PakFileSystem.  Files that aren't on disk are read from its pak files.
+        self.file_system = file_system
+        # Optional CryXmlStringPool that decoded names and values are interned in.
+        self.string_pool = string_pool
+
+    def read_file(self, file):
+        if self.file_system is not None and not os.path.isfile(file):
+            data = self.file_system.read(file)
+            if data is not None:
+                return self.read_buffer(data, io.BytesIO(data), cacheable=False)
+        if self.cache is not None and self.cache.enabled:
+            tables = self.cache.load(file)
+            if tables is not None:
+                return self.build_document(*tables)
+        with open(file, "rb") as f:
+            if not self.use_mmap:
+                return self.read_buffer(f.read(), file)
+            if os.fstat(f.fileno()).st_size == 0:
+                print("End of file")
+                return
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if not self.lazy:
+            with buffer:
+                return self.read_buffer(buffer, file)
+        result = self.read_buffer(buffer, file)
+        if self.uses_buffer(result):
+            # Strings are decoded from the mapping as they are accessed, so it stays open
+            # until the result is closed or released.
+            weakref.finalize(result, buffer.close)
+        else:
+            buffer.close()
+        return result
+
+    def uses_buffer(self, result):
+        """ Returns True if result (from read_buffer) still reads from the buffer it was read from. """
+        return isinstance(result, CryXmlDocument) and isinstance(result.data_map, CryXmlStringTable)
+
+    def read_buffer(self, buffer, file, cacheable=True):
+        c = buffer[:1]
+        if not c:
+            print("End of file")
+            return
+        if c == b'<':  # Already a text XML file.  Parse and return as ET.
+            return self.parse_text(file)
+        elif c != b"C":
+            print("Not a Cryengine Binary XML File.")
+            return
+        tables = self.read_tables(buffer)
+        if cacheable and self.cache is not None and self.cache.enabled:
+            self.cache.store(file, tables)
+        return self.build_document(*tables)
+
+    def parse_text(self, source):
+        if self.string_pool is not None:
+            return ET.parse(source, ET.XMLParser(target=InterningTreeBuilder(self.string_pool)))
+        xmlFile = ET.parse(source)
+        return xmlFile
+
+    def iterparse(self, file, events=("end",)):
+        """ Yields (event, element) pairs in document order, like ET.iterparse.
+            Only the open elements are referenced by the parser, so callers that clear()
+            elements once they are processed keep memory flat as files grow.  Binary files
+            support the "start" and "end" events, and are decoded as they are walked instead
+            of up front (and without the parse cache).  Text files are passed to ET.iterparse.
+        """
+        result = CryXmlIterParser(self, events).read_file(file)
+        if result is not None:
+            yield from result
+
+    def read_tables(self, buffer):
+        """ Decodes the node, reference and order tables and the string table of a CryXmlB buffer. """
+        header_length = buffer.find(b"\0") + 1
+        (file_length,
+         node_table_offset, node_table_count,
+         reference_table_offset, reference_table_count,
+         order_table_offset, order_table_count,
+         content_offset, content_length) = HEADER_FORMAT.unpack_from(buffer, header_length)
+        # Each table is unpacked in bulk from a slice of the buffer.
+        node_table = self.read_table(buffer, node_table_offset, node_table_count, NODE_FORMAT)
+        attribute_table = self.read_table(buffer, reference_table_offset, reference_table_count, REFERENCE_FORMAT)
+        order_table = self.read_table(buffer, order_table_offset, order_table_count, ORDER_FORMAT)
+
+        # Data table section.  Cached documents need every string, so they are decoded up front.
+        if self.use_mmap and (self.cache is None or not self.cache.enabled):
+            data_map = CryXmlStringTable(buffer, content_offset, file_length - content_offset, self.string_pool)
+        else:
+            data_map = self.read_string_table(buffer, content_offset, file_length - content_offset)
+        return node_table, attribute_table, order_table, data_map
+
+    def build_document(self, node_table, attribute_table, order_table, data_map):
+        if self.string_pool is not None and isinstance(data_map, dict):
+            intern = self.string_pool.intern
+            data_map = {offset: intern(value) for offset, value in data_map.items()}
+        if self.lazy:
+            return CryXmlDocument(node_table, attribute_table, order_table, data_map)
+
+        # Make the XML.  Each node's first attribute and first child indexes locate its
+        # references and child ids, as in CryXmlDocument and CryXmlIterParser.
+        if not node_table:
+            return ET.ElementTree
+        elements = []
+        for node in node_table:
+            node_name_offset, item_type, attribute_count, child_count, parent_node_id, first_attribute = node[:6]
+            element = Element(data_map[node_name_offset])
+            for name_offset, value_offset in attribute_table[first_attribute:first_attribute + attribute_count]:
+                element.set(data_map[name_offset], data_map.get(value_offset, "BUGGED"))
+            elements.append(element)
+
+        for element, node in zip(elements, node_table):
+            first_child, child_count = node[6], node[3]
+            element.extend(elements[child_id] for (child_id,) in order_table[first_child:first_child + child_count])
+        #ET.dump(elements[0])
+        return elements[0]
+
+    def read_table(self, buffer, offset, count, table_format):
+        """ Unpacks count records of table_format starting at offset, without
+            copying the table out of the buffer.
+            Returns a list of tuples, one per record.
+        """
+        if count <= 0:
+            return []
+        with memoryview(buffer) as view:
+            return list(table_format.iter_unpack(view[offset:offset + count * table_format.size]))
+
+    def read_string_table(self, buffer, offset, length):
+        """ Decodes the NUL separated string table in one pass.
+            Returns a dict of offset (relative to the start of the table) to string.
+        """
+        data = bytes(buffer[offset:offset + length])
+        if data.endswith(b"\0"):
+            data = data[:-1]
+        data_map = {}
+        position = 0
+        for value in data.split(b"\0"):
+            data_map[position] = value.decode("utf-8")
+            position += len(value) + 1
+        return data_map
+
+    def read_c_string(self, binary_reader):
+        chars = bytearray()
+        while True:
+            c = binary_reader.read(1)
+            if c == b"\0" or not c:
+                return chars.decode("utf-8")
+            chars += c
+    
+    def read_int32(self, binary_reader):
+        val = struct.unpack('<i', binary_reader.read(4))[0]
+        return val
+    
+    def read_int16(self, binary_reader):
+        val = struct.unpack('<h', binary_reader.read(2))[0]
+        return val
+
+class CryXmlIterParser(CryXmlSerializer):
+    """ Serializer used by CryXmlSerializer.iterparse.  Returns event iterators instead of trees.
+
+        Binary files are decoded while they are walked.  Each node's record, attributes and
+        child ids are unpacked from a memory map of the file when the walk reaches the node,
+        and strings are decoded the first time they are used.  The parse cache only holds fully
+        decoded tables, so it isn't used.
+    """
+    def __init__(self, serializer, events):
+        super().__init__(True, True, None, serializer.file_system, serializer.string_pool)
+        self.events = tuple(events)
+
+    def uses_buffer(self, result):
+        return result is not None     # Event iterators are lazy, so keep the buffer until they are released.
+
+    def parse_text(self, source):
+        parser = ET.iterparse(source, self.events)
+        if self.string_pool is None:
+            return parser
+        return self.intern_events(parser)
+
+    def intern_events(self, parser):
+        intern = self.string_pool.intern
+        for event, element in parser:
+            if event in ("start", "end"):
+                element.tag = intern(element.tag)
+                element.attrib = {intern(name): intern(value) for name, value in element.attrib.items()}
+            yield event, element
+
+    def read_tables(self, buffer):
+        # Only the header is read up front.  iterate_buffer unpacks the tables as it goes.
+        header_length = buffer.find(b"\0") + 1
+        return (buffer,) + HEADER_FORMAT.unpack_from(buffer, header_length)
+
+    def build_document(self, buffer, file_length, node_table_offset, node_table_count, reference_table_offset,
+                       reference_table_count, order_table_offset, order_table_count, content_offset, content_length):
+        unsupported = set(self.events) - {"start", "end"}
+        if unsupported:
+            raise ValueError("unknown event " + repr(sorted(unsupported)[0]))
+        if node_table_count <= 0:
+            return iter(())
+        strings = CryXmlStringTable(buffer, content_offset, file_length - content_offset, self.string_pool)
+        return self.iterate_buffer(buffer, strings, node_table_offset, reference_table_offset, order_table_offset)
+
+    def iterate_buffer(self, buffer, strings, node_table_offset, reference_table_offset, order_table_offset):
+        yield_start = "start" in self.events
+        yield_end = "end" in self.events
+
+        def read_node(node_id):
+            # Returns the node's Element and an iterator over its child ids.  Like the engine's
+            # reader, the node's first attribute and first child indexes locate its records.
+            (name_offset, _, attribute_count, child_count, _,
+             first_attribute, first_child, _) = NODE_FORMAT.unpack_from(buffer, node_table_offset + node_id * NODE_FORMAT.size)
+            attrib = {}
+            for index in range(first_attribute, first_attribute + attribute_count):
+                name, value = REFERENCE_FORMAT.unpack_from(buffer, reference_table_offset + index * REFERENCE_FORMAT.size)
+                attrib[strings[name]] = strings.get(value, "BUGGED")
+            child_ids = (ORDER_FORMAT.unpack_from(buffer, order_table_offset + index * ORDER_FORMAT.size)[0]
+                         for index in range(first_child, first_child + child_count))
+            return Element(strings[name_offset], attrib), child_ids
+
+        root, child_ids = read_node(0)
+        if yield_start:
+            yield "start", root
+        stack = [(root, child_ids)]
+        while stack:
+            element, child_ids = stack[-1]
+            child_id = next(child_ids, None)
+            if child_id is None:
+                stack.pop()
+                if yield_end:
+                    yield "end", element
+                continue
+            child, grandchild_ids = read_node(child_id)
+            element.append(child)
+            if yield_start:
+                yield "start", child
+            stack.append((child, grandchild_ids))
@@ -0,0 +1,118 @@
+""" Writes Element trees as CryXmlB files, and generates synthetic CryXmlB corpora
+for testing and benchmarking the reader.  Does not need Blender:
+
+    python -m cryengine_tools.CryXmlB.CryXmlWriter <output directory> --nodes 1000 10000 100000
+"""
+
+import argparse
+import os
+import random
+import xml.etree.ElementTree as ET
+
+from .CryXmlReader import HEADER_FORMAT, NODE_FORMAT, REFERENCE_FORMAT, ORDER_FORMAT
+
+CRYXMLB_HEADER = b"CryXmlB\0"
+
+TAGS = ["Object", "Properties", "Material", "Texture", "Attachment", "Prefab", "Objects", "SubMaterials"]
+ATTRIBUTE_NAMES = ["Name", "File", "Shader", "Map", "StringGenMask", "BoneName", "Pos", "Rotate", "Scale", "Id",
+                   "Type", "Binding", "Flags", "Diffuse", "Specular", "Opacity", "Shininess", "Layer"]
+
+def write_cryxmlb(root):
+    """ Serializes an Element tree to CryXmlB bytes.  Nodes are written in document order
+        and identical strings share one entry in the string table.
+    """
+    strings = {}
+    content = bytearray()
+    def offset_of(value):
+        offset = strings.get(value)
+        if offset is None:
+            offset = strings[value] = len(content)
+            content.extend(value.encode("utf-8") + b"\0")
+        return offset
+    offset_of("")
+    elements = list(root.iter())
+    ids = {id(e): i for i, e in enumerate(elements)}
+    nodes, references, order = bytearray(), bytearray(), bytearray()
+    parent_ids = {}
+    attribute_index = 0
+    for node_id, element in enumerate(elements):
+        first_child = len(order) // ORDER_FORMAT.size
+        for child in element:
+            parent_ids[id(child)] = node_id
+            order.extend(ORDER_FORMAT.pack(ids[id(child)]))
+        nodes.extend(NODE_FORMAT.pack(offset_of(element.tag), offset_of(element.text or ""), len(element.attrib),
+                                      len(element), parent_ids.get(id(element), -1), attribute_index, first_child, 0))
+        for name, value in element.attrib.items():
+            references.extend(REFERENCE_FORMAT.pack(offset_of(name), offset_of(value)))
+        attribute_index += len(element.attrib)
+    node_offset = len(CRYXMLB_HEADER) + HEADER_FORMAT.size
+    reference_offset = node_offset + len(nodes)
+    order_offset = reference_offset + len(references)
+    content_offset = order_offset + len(order)
+    file_length = content_offset + len(content)
+    header = HEADER_FORMAT.pack(file_length,
+                                node_offset, len(elements),
+                                reference_offset, len(references) // REFERENCE_FORMAT.size,
+                                order_offset, len(order) // ORDER_FORMAT.size,
+                                content_offset, len(content))
+    return CRYXMLB_HEADER + header + bytes(nodes) + bytes(references) + bytes(order) + bytes(content)
+
+def write_file(root, file):
+    with open(file, "wb") as f:
+        f.write(write_cryxmlb(root))
+
+def generate_tree(node_count, attribute_count=4, depth=4, string_count=1000, value_length=24, seed=0):
+    """ Builds a synthetic Element tree.
+        node_count:      total number of elements, including the root
+        attribute_count: attributes per element
+        depth:           number of levels below the root
+        string_count:    distinct attribute values, which (with value_length) sets the string table size
+    """
+    rng = random.Random(seed)
+    values = [("value_%d_" % i).ljust(value_length, "x") for i in range(string_count)]
+    names = ATTRIBUTE_NAMES + ["Attribute%d" % i for i in range(max(0, attribute_count - len(ATTRIBUTE_NAMES)))]
+    root = ET.Element("CryXmlCorpus", Nodes=str(node_count))
+    levels = [[root]]
+    for i in range(1, node_count):
+        # Fill the first levels so the tree always reaches the requested depth.
+        level = min(i, depth) if i <= depth else rng.randint(1, depth)
+        parent = rng.choice(levels[level - 1])
+        element = ET.SubElement(parent, TAGS[i % len(TAGS)],
+                                {names[a]: rng.choice(values) for a in range(attribute_count)})
+        if level == len(levels):
+            levels.append([])
+        levels[level].append(element)
+    return root
+
+def write_corpus(output_dir, node_counts, attribute_count=4, depth=4, string_count=1000, text=True):
+    """ Writes one CryXmlB file (and a text XML copy when text is set) per node count.
+        Returns a list of (node count, binary file, text file or None).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    files = []
+    for node_count in node_counts:
+        root = generate_tree(node_count, attribute_count, depth, string_count)
+        binary_file = os.path.join(output_dir, "corpus_%d.cryxml" % node_count)
+        write_file(root, binary_file)
+        text_file = None
+        if text:
+            text_file = os.path.join(output_dir, "corpus_%d.xml" % node_count)
+            ET.ElementTree(root).write(text_file, encoding="utf-8")
+        files.append((node_count, binary_file, text_file))
+    return files
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic Cryengine binary XML (CryXmlB) files.")
+    parser.add_argument("output", help="Directory to write the corpus to")
+    parser.add_argument("-n", "--nodes", type=int, nargs="+", default=[1000, 10000, 100000], help="Node count of each file")
+    parser.add_argument("-a", "--attributes", type=int, default=4, help="Attributes per node")
+    parser.add_argument("-d", "--depth", type=int, default=4, help="Tree depth")
+    parser.add_argument("-s", "--strings", type=int, default=1000, help="Distinct attribute values")
+    parser.add_argument("--no-text", action="store_true", help="Don't write text XML copies")
+    args = parser.parse_args(argv)
+    for node_count, binary_file, text_file in write_corpus(args.output, args.nodes, args.attributes, args.depth,
+                                                           args.strings, not args.no_text):
+        print("%d nodes: %s" % (node_count, binary_file))
+
+if __name__ == "__main__":
+    main()
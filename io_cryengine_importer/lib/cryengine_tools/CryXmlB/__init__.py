@@ -0,0 +1 @@
+""" Reading, writing, caching and converting Cryengine binary XML (CryXmlB) files. """
@@ -0,0 +1,105 @@
+import os
+import threading
+import zipfile
+
+import numpy
+import numpy.lib.format
+
+from .CryXmlB.CryXmlCache import CryXmlCache, default_cache_dir, DEFAULT_MAX_SIZE
+from .PakFileSystem import LOCAL_HEADER_FORMAT, LOCAL_HEADER_SIGNATURE
+
+GEOMETRY_CACHE_EXTENSION = ".npz"
+SOURCE_KEY = "__source__"   # (size, mtime) of the file an entry was made from
+
+def read_npz(path):
+    """ Returns the arrays of an uncompressed .npz file as read-only views of one buffer
+        holding the whole file, so it is read in one call and nothing is copied per array.
+        The file isn't kept open (or mapped, which would lock it on Windows), so the entry
+        can be replaced or evicted while the arrays are in use.
+    """
+    arrays = {}
+    with open(path, "rb") as f:
+        with zipfile.ZipFile(f) as npz:
+            infos = npz.infolist()
+        if not infos:
+            return arrays
+        f.seek(0)
+        buffer = f.read()
+        for info in infos:
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(info.filename + " is compressed")
+            f.seek(info.header_offset)
+            header = LOCAL_HEADER_FORMAT.unpack(f.read(LOCAL_HEADER_FORMAT.size))
+            if header[0] != LOCAL_HEADER_SIGNATURE:
+                raise ValueError("Bad local file header for " + info.filename)
+            name_length, extra_length = header[-2:]
+            f.seek(name_length + extra_length, os.SEEK_CUR)
+            version = numpy.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = numpy.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = numpy.lib.format.read_array_header_2_0(f)
+            if dtype.hasobject:
+                raise ValueError(info.filename + " holds Python objects")
+            count = int(numpy.prod(shape))
+            if count == 0:
+                array = numpy.zeros(shape, dtype=dtype)
+            else:
+                array = numpy.frombuffer(buffer, dtype=dtype, count=count, offset=f.tell())
+            name = info.filename[:-4] if info.filename.endswith(".npy") else info.filename
+            arrays[name] = array.reshape(shape, order="F" if fortran_order else "C")
+    return arrays
+
+class GeometryCache(CryXmlCache):
+    """ On-disk cache of decoded geometry, one uncompressed .npz of named arrays per
+        source file.  Entries are keyed and evicted the same way as the CryXmlB cache,
+        and are read with one call when loaded.
+    """
+    extension = GEOMETRY_CACHE_EXTENSION
+
+    def __init__(self, cache_dir=None, max_size=DEFAULT_MAX_SIZE, enabled=True):
+        super().__init__(cache_dir or default_cache_dir("geometry"), max_size, enabled)
+
+    def load(self, file):
+        """ Returns the cached arrays for file, or None if there is no valid entry. """
+        entry = self.entry_path(file)
+        try:
+            stat = os.stat(file)
+            arrays = read_npz(entry)
+        except OSError:
+            self.misses += 1
+            return None
+        except (ValueError, EOFError, zipfile.BadZipFile):
+            print("Removing unreadable cache entry " + entry)
+            self.remove(entry)
+            self.misses += 1
+            return None
+        source = arrays.pop(SOURCE_KEY, None)
+        if source is None or tuple(source.tolist()) != (stat.st_size, stat.st_mtime_ns):
+            self.misses += 1
+            return None
+        os.utime(entry)     # Mark as recently used
+        self.hits += 1
+        return arrays
+
+    def store(self, file, arrays):
+        stat = os.stat(file)
+        entry = self.entry_path(file)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            temp_entry = entry + "." + str(os.getpid()) + "." + str(threading.get_ident())
+            with open(temp_entry, "wb") as f:
+                numpy.savez(f, **arrays, **{SOURCE_KEY: numpy.array([stat.st_size, stat.st_mtime_ns], dtype=numpy.int64)})
+            size = os.path.getsize(temp_entry)
+            if size > self.max_size:
+                self.remove(temp_entry)
+                return
+            replaced = self.entry_size(entry)
+            os.replace(temp_entry, entry)
+        except OSError as e:
+            print("Unable to write cache entry for " + file + ": " + str(e))
+            return
+        self.stored(size, replaced)
+
+# Cache shared by the importers.  Set enabled to False to bypass it.
+geometry_cache = GeometryCache()
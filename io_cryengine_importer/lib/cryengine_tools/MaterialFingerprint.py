@@ -0,0 +1,27 @@
+import hashlib
+import json
+
+# Attributes that don't change how a material looks.  Identical materials under
+# different names (or in different .mtl files) get the same fingerprint.
+IGNORED_ATTRIBUTES = ("Name",)
+NESTED_MATERIAL_TAGS = ("SubMaterials", "Material")
+
+def normalize_value(name, value):
+    value = value.strip()
+    if name == "File":      # Game paths are case insensitive
+        value = value.replace("\\", "/").lower()
+    return value
+
+def canonical_element(element, ignored=()):
+    """ Returns element as nested lists with sorted attributes, leaving out nested materials. """
+    attributes = sorted((name, normalize_value(name, value)) for name, value in element.attrib.items() if name not in ignored)
+    children = [canonical_element(child) for child in element if child.tag not in NESTED_MATERIAL_TAGS]
+    return [element.tag, attributes, children]
+
+def material_fingerprint(material_xml, *context):
+    """ Returns a hash of a <Material> element's attributes and children (its Textures and
+        parameters), ignoring its name and submaterials.  context is hashed too, for
+        anything else the built material depends on, like the texture file extension.
+    """
+    canonical = [canonical_element(material_xml, IGNORED_ATTRIBUTES), [str(value) for value in context]]
+    return hashlib.sha1(json.dumps(canonical, separators=(",", ":")).encode("utf-8")).hexdigest()
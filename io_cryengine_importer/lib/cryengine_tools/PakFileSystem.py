@@ -0,0 +1,161 @@
+import os
+import struct
+import threading
+import zipfile
+import zlib
+
+from .CryXmlB.CryXmlCache import CryXmlCache, default_cache_dir
+
+LOCAL_HEADER_FORMAT = struct.Struct('<4s5H3I2H')   # 30 bytes
+LOCAL_HEADER_SIGNATURE = b"PK\x03\x04"
+HEADER_CHUNK_SIZE = 16 * 1024     # Compressed bytes read at a time by read_header
+CRC_EXTENSION = ".crc32"    # Next to an extracted file: the CRC-32 of the pak entry it was extracted from
+ENTRY_FIELDS = 6            # Fields of each cached central directory entry
+
+def normalize_path(path):
+    """ Returns path with forward slashes, lower case and without empty or '.' parts. """
+    return "/".join(part for part in path.replace("\\", "/").lower().split("/") if part and part != ".")
+
+class PakFileSystem:
+    """ Read-only view of the files in a set of Cryengine .pak (zip) archives.
+
+        The central directory of each archive is read once and cached on disk, keyed by
+        the archive's path, size and mtime.  Lookups are case insensitive and take either
+        game-relative paths ("objects/mechs/...") or absolute paths under root.  All paks
+        are mounted at root, and files in later paks override files in earlier ones.
+        Extracted files are reused until the CRC-32 of their pak entry changes.
+    """
+    def __init__(self, root, pak_files=(), index_cache=None, extract_dir=None):
+        self.root = normalize_path(os.path.abspath(root))
+        self.index_cache = index_cache
+        self.extract_dir = extract_dir or default_cache_dir("pak")
+        self.pak_files = []
+        self.index = {}
+        for pak_file in pak_files:
+            self.add_pak(pak_file)
+
+    @classmethod
+    def from_directory(cls, root, index_cache=None, extract_dir=None):
+        """ Mounts every .pak file found under root. """
+        pak_files = []
+        for directory, dirs, files in os.walk(root):
+            dirs.sort()
+            pak_files.extend(os.path.join(directory, name) for name in sorted(files) if name.lower().endswith(".pak"))
+        if index_cache is None:
+            index_cache = CryXmlCache(default_cache_dir("pakindex"))
+        print("Found " + str(len(pak_files)) + " pak files under " + root)
+        return cls(root, pak_files, index_cache, extract_dir)
+
+    def add_pak(self, pak_file):
+        entries = self.index_cache.load(pak_file) if self.index_cache is not None else None
+        if entries is None or any(len(entry) != ENTRY_FIELDS for entry in entries[:1]):
+            entries = self.read_central_directory(pak_file)
+            if self.index_cache is not None:
+                self.index_cache.store(pak_file, entries)
+        pak_id = len(self.pak_files)
+        self.pak_files.append(pak_file)
+        for name, header_offset, compress_type, compress_size, file_size, crc in entries:
+            self.index[name] = (pak_id, header_offset, compress_type, compress_size, file_size, crc)
+
+    def read_central_directory(self, pak_file):
+        """ Returns (normalized name, header offset, compression, compressed size, size, CRC-32) for each file. """
+        try:
+            with zipfile.ZipFile(pak_file) as pak:
+                return [(normalize_path(info.filename), info.header_offset, info.compress_type, info.compress_size, info.file_size,
+                         info.CRC) for info in pak.infolist() if not info.is_dir()]
+        except (OSError, zipfile.BadZipFile) as e:
+            print("Unable to read pak file " + pak_file + ": " + str(e))
+            return []
+
+    def game_path(self, path):
+        """ Returns the normalized game-relative path for a relative or absolute path. """
+        path = normalize_path(path)
+        if self.root and path.startswith(self.root + "/"):
+            return path[len(self.root) + 1:]
+        return path
+
+    def exists(self, path):
+        return self.game_path(path) in self.index
+
+    def size(self, path):
+        entry = self.index.get(self.game_path(path))
+        return entry[4] if entry is not None else None
+
+    def read(self, path):
+        """ Returns the contents of the file at path, or None if no pak contains it. """
+        entry = self.index.get(self.game_path(path))
+        if entry is None:
+            return None
+        pak_id, header_offset, compress_type, compress_size, file_size, crc = entry
+        with open(self.pak_files[pak_id], "rb") as f:
+            self.seek_data(f, entry, path)
+            data = f.read(compress_size)
+        if compress_type == zipfile.ZIP_STORED:
+            return data
+        if compress_type == zipfile.ZIP_DEFLATED:
+            return zlib.decompress(data, -zlib.MAX_WBITS)
+        raise ValueError("Unsupported compression method " + str(compress_type) + " for " + path)
+
+    def read_header(self, path, size):
+        """ Returns the first size bytes of the file at path (all of it if it is shorter),
+            inflating only as much as they need.  Returns None if no pak contains it.
+        """
+        entry = self.index.get(self.game_path(path))
+        if entry is None:
+            return None
+        pak_id, header_offset, compress_type, compress_size, file_size, crc = entry
+        with open(self.pak_files[pak_id], "rb") as f:
+            self.seek_data(f, entry, path)
+            if compress_type == zipfile.ZIP_STORED:
+                return f.read(min(size, compress_size))
+            if compress_type != zipfile.ZIP_DEFLATED:
+                raise ValueError("Unsupported compression method " + str(compress_type) + " for " + path)
+            decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+            data = b""
+            remaining = compress_size
+            while len(data) < size and remaining > 0 and not decompressor.eof:
+                chunk = f.read(min(HEADER_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                data += decompressor.decompress(chunk, size - len(data))
+            return data
+
+    def seek_data(self, f, entry, path):
+        # Moves f past the local file header of entry, to the start of its data.
+        f.seek(entry[1])
+        header = LOCAL_HEADER_FORMAT.unpack(f.read(LOCAL_HEADER_FORMAT.size))
+        if header[0] != LOCAL_HEADER_SIGNATURE:
+            raise ValueError("Bad local file header for " + path + " in " + self.pak_files[entry[0]])
+        name_length, extra_length = header[-2:]
+        f.seek(name_length + extra_length, os.SEEK_CUR)
+
+    def extract(self, path):
+        """ Copies the file at path out of its pak into extract_dir, for consumers that need
+            a real file (Blender image and Collada loaders).  Returns the extracted path, or
+            None if no pak contains the file.  The entry's CRC-32 is written next to the file,
+            so a file changed by a game patch is extracted again even if its size is the same.
+        """
+        game_path = self.game_path(path)
+        entry = self.index.get(game_path)
+        if entry is None:
+            return None
+        target = os.path.join(self.extract_dir, *game_path.split("/"))
+        crc = "%08x" % entry[5]
+        try:
+            with open(target + CRC_EXTENSION, encoding="ascii") as f:
+                if f.read() == crc and os.path.isfile(target):
+                    return target
+        except (OSError, ValueError):
+            pass
+        data = self.read(game_path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        temp_target = target + "." + str(os.getpid()) + "." + str(threading.get_ident())
+        with open(temp_target, "wb") as f:
+            f.write(data)
+        os.replace(temp_target, target)
+        # Written after the file, so it never vouches for a file that isn't in place yet.
+        with open(temp_target, "w", encoding="ascii") as f:
+            f.write(crc)
+        os.replace(temp_target, target + CRC_EXTENSION)
+        return target
@@ -0,0 +1,95 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_MAX_PENDING = 8
+
+class ParsePipeline:
+    """ Decodes files on worker threads ahead of the main thread.  Blender's data API has to
+        be used from the main thread, but reading and parsing don't, so while the main
+        thread builds the objects for one file the workers decode the next ones.
+
+        Only the parts of decode that release the GIL run alongside the main thread: file
+        reads (including geometry cache entries) and zlib.  Parsing XML with expat and
+        numpy's text parser hold it, so the CPU work of an uncached file takes turns with
+        the main thread instead of overlapping it.  The gain is on slow or cold disks; with
+        the files in the OS cache the threads cost a little more than they hide (see
+        test_benchmark_parse_pipeline).  Worker processes would overlap the parsing too,
+        but the decode functions come from the add-on package, which child interpreters
+        can't import without bpy.
+
+        items is the list of files in the order they will be asked for; an item that is
+        used more than once should be listed once per get().  At most max_pending decoded
+        results are held at a time.  Items are expected to be requested in order: any
+        earlier item that wasn't asked for is dropped, and an item that isn't queued is
+        decoded on the calling thread.
+    """
+    def __init__(self, decode, items, workers=None, max_pending=DEFAULT_MAX_PENDING):
+        self.decode = decode
+        self.items = list(items)
+        self.next_item = 0
+        self.pending = deque()      # (item, future), in request order
+        self.max_pending = max(1, max_pending)
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self.executor = ThreadPoolExecutor(max_workers=self.workers)
+        self.lock = threading.Lock()
+        self.decoded = 0
+        self.decode_seconds = 0.0   # Summed over the workers
+        self.wait_seconds = 0.0     # Time get() spent blocked
+        self.fill()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def fill(self):
+        while len(self.pending) < self.max_pending and self.next_item < len(self.items):
+            item = self.items[self.next_item]
+            self.next_item += 1
+            self.pending.append((item, self.executor.submit(self.timed_decode, item)))
+
+    def timed_decode(self, item):
+        start = time.perf_counter()
+        try:
+            return self.decode(item)
+        finally:
+            with self.lock:
+                self.decoded += 1
+                self.decode_seconds += time.perf_counter() - start
+
+    def get(self, item):
+        """ Returns decode(item), waiting for the worker if it isn't finished.  Exceptions
+            raised by decode are raised here.
+        """
+        start = time.perf_counter()
+        future = None
+        while self.pending:
+            pending_item, pending_future = self.pending.popleft()
+            if pending_item == item:
+                future = pending_future
+                break
+            pending_future.cancel()     # Skipped by the caller
+        if future is None:
+            try:
+                self.next_item = self.items.index(item, self.next_item) + 1
+            except ValueError:
+                pass
+        self.fill()
+        try:
+            return future.result() if future is not None else self.timed_decode(item)
+        finally:
+            self.wait_seconds += time.perf_counter() - start
+
+    def close(self):
+        for _, future in self.pending:
+            future.cancel()
+        self.pending.clear()
+        self.executor.shutdown(wait=True)
+
+    def print_summary(self):
+        print("Decoded %d files in %.2fs on %d worker threads; the main thread waited %.2fs" %
+              (self.decoded, self.decode_seconds, self.workers, self.wait_seconds))
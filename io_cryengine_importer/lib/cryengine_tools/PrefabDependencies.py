@@ -0,0 +1,240 @@
+""" Finds every file a prefab library needs and reads them ahead of the import.
+
+Does not need Blender:
+
+    python -m cryengine_tools.PrefabDependencies <prefab library> <game directory>
+"""
+
+import argparse
+import io
+import os
+import posixpath
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from .AssetIndex import AssetIndex
+from .ColladaImages import read_image_paths
+from .CryXmlB.CryXmlCache import parse_cache
+from .CryXmlB.CryXmlReader import CryXmlSerializer
+
+GEOMETRY_EXTENSION = ".dae"
+MATERIAL_EXTENSION = ".mtl"
+READ_CHUNK_SIZE = 1024 * 1024
+PAK_FILE = "<pak>"      # Location of files that only exist in a pak
+
+@dataclass
+class PrefabDependencies:
+    """ The files a prefab library needs, by kind.  Each maps a game-relative path to the
+        real path on disk, PAK_FILE, or None when the file can't be found.
+    """
+    geometry: dict = field(default_factory=dict)
+    materials: dict = field(default_factory=dict)
+    textures: dict = field(default_factory=dict)
+    sizes: dict = field(default_factory=dict)       # Game-relative path: bytes
+    prefab_materials: dict = field(default_factory=dict)    # Prefab name: game-relative paths of its materials
+    material_textures: dict = field(default_factory=dict)   # Material path: game-relative paths of its textures
+    prefab_geometry: dict = field(default_factory=dict)     # Prefab name: game-relative paths of its geometry
+    geometry_textures: dict = field(default_factory=dict)   # Geometry path: game-relative paths of its Collada images
+    prefabs: int = 0
+    objects: int = 0
+    groups: int = 0
+
+    def kinds(self):
+        return (("geometry", self.geometry), ("materials", self.materials), ("textures", self.textures))
+
+    def missing(self):
+        return sorted(path for _, files in self.kinds() for path, location in files.items() if location is None)
+
+    def total_size(self):
+        return sum(self.sizes.values())
+
+    def print_report(self):
+        print("Prefab library: " + str(self.prefabs) + " prefabs, " + str(self.objects) + " objects, "
+              + str(self.groups) + " groups")
+        for kind, files in self.kinds():
+            found = [path for path, location in files.items() if location is not None]
+            size = sum(self.sizes.get(path, 0) for path in found)
+            print("  %s: %d files, %.1f MB, %d missing" % (kind, len(found), size / (1024 * 1024), len(files) - len(found)))
+        for path in self.missing():
+            print("  Missing: " + path)
+
+class DependencyResolver:
+    """ Builds the dependency closure of a prefab library: the geometry each object places,
+        the materials it uses and the textures of those materials, including objects
+        nested in Groups, and the textures the geometry's Collada materials use.  Files
+        are found through the asset index first and then the pak files.
+    """
+    def __init__(self, basedir, asset_index=None, file_system=None, texture_extension=".dds", cache=parse_cache, workers=None):
+        self.basedir = basedir
+        self.asset_index = asset_index or AssetIndex.for_directory(basedir)
+        self.file_system = file_system
+        self.cache = cache
+        self.texture_extension = texture_extension
+        self.workers = workers or min(32, (os.cpu_count() or 1) + 4)
+
+    def locate(self, path):
+        """ Returns (location, size) for a game-relative path. """
+        real_path = self.asset_index.lookup(path)
+        if real_path is not None:
+            try:
+                return real_path, os.path.getsize(real_path)
+            except OSError:
+                pass
+        if self.file_system is not None and self.file_system.exists(path):
+            return PAK_FILE, self.file_system.size(path)
+        return None, 0
+
+    def add(self, dependencies, files, path):
+        path = path.replace("\\", "/").lower()
+        if path and path not in files:
+            files[path], size = self.locate(path)
+            if size:
+                dependencies.sizes[path] = size
+        return path
+
+    def resolve(self, prefab_file):
+        dependencies = PrefabDependencies()
+        serializer = CryXmlSerializer(file_system=self.file_system)
+        for event, element in serializer.iterparse(prefab_file):
+            if element.tag == "Prefab":
+                dependencies.prefabs += 1
+                materials = dependencies.prefab_materials.setdefault(element.get("Name"), set())
+                geometry = dependencies.prefab_geometry.setdefault(element.get("Name"), set())
+                for obj in element.iter("Object"):
+                    self.add_object(dependencies, obj, materials, geometry)
+                element.clear()
+        # Materials are read on the pool to find their textures.
+        material_files = [(path, location) for path, location in dependencies.materials.items() if location is not None]
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for (material, _), textures in zip(material_files, executor.map(self.get_textures, material_files)):
+                dependencies.material_textures[material] = [self.add(dependencies, dependencies.textures, texture)
+                                                            for texture in textures]
+            # And the geometry, for the images of its Collada materials.
+            geometry_files = [(path, location) for path, location in dependencies.geometry.items() if location is not None]
+            for (geometry, _), textures in zip(geometry_files, executor.map(self.get_geometry_textures, geometry_files)):
+                dependencies.geometry_textures[geometry] = [self.add(dependencies, dependencies.textures, texture)
+                                                            for texture in textures]
+        return dependencies
+
+    def add_object(self, dependencies, obj, materials=None, geometry_files=None):
+        dependencies.objects += 1
+        object_type = obj.get("Type")
+        geometry = None
+        if object_type == "Brush":
+            geometry = obj.get("Prefab")
+        elif object_type == "Entity" and len(obj):
+            geometry = obj[0].get("objModel") or obj[0].get("object_Model")
+        elif object_type == "GeomEntity":
+            geometry = obj.get("Geometry")
+        elif object_type == "Group":
+            dependencies.groups += 1
+        if geometry:
+            geometry = self.add(dependencies, dependencies.geometry, os.path.splitext(geometry)[0] + GEOMETRY_EXTENSION)
+            if geometry_files is not None:
+                geometry_files.add(geometry)
+        material = obj.get("Material")
+        if material:
+            material = self.add(dependencies, dependencies.materials, os.path.splitext(material)[0] + MATERIAL_EXTENSION)
+            if materials is not None:
+                materials.add(material)
+
+    def get_textures(self, material_file):
+        path, location = material_file
+        try:
+            serializer = CryXmlSerializer(lazy=True, cache=self.cache, file_system=self.file_system)
+            material = serializer.read_file(location if location != PAK_FILE else os.path.join(self.basedir, path))
+            if material is None:
+                return []
+            return [os.path.splitext(texture.get("File"))[0] + self.texture_extension
+                    for texture in material.iter("Texture") if texture.get("File") and not texture.get("File").startswith("$")]
+        except Exception as e:
+            print("Unable to read material " + path + ": " + str(e))
+            return []
+
+    def get_geometry_textures(self, geometry_file):
+        """ Returns the game-relative paths of the images in a Collada file's image library,
+            which are relative to the .dae file.  Images outside the game directory are left out.
+        """
+        path, location = geometry_file
+        try:
+            if location == PAK_FILE:
+                images = read_image_paths(io.BytesIO(self.file_system.read(path)))
+            else:
+                images = read_image_paths(location)
+        except Exception as e:
+            print("Unable to read geometry " + path + ": " + str(e))
+            return []
+        textures = []
+        for image in images.values():
+            if os.path.isabs(image):
+                texture = self.asset_index.game_path(image)
+            else:
+                texture = posixpath.normpath(posixpath.join(posixpath.dirname(path), image.replace("\\", "/")))
+                if texture.startswith("../"):
+                    texture = None
+            if texture is not None:
+                textures.append(texture)
+        return textures
+
+    def prefetch(self, dependencies, warmers=None):
+        """ Reads every file of dependencies on a thread pool, so the single-threaded import
+            finds them in the OS page cache.  warmers maps a file extension to a function
+            that is called with the real path instead, to fill a parse cache as well.
+            Files that are only in paks are extracted.  Returns a dict of counters.
+        """
+        start = time.perf_counter()
+        warmers = warmers or {}
+        jobs = [(path, location) for _, files in dependencies.kinds() for path, location in files.items() if location is not None]
+        summary = {"files": 0, "bytes": 0, "failed": 0}
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for size in executor.map(lambda job: self.warm(job[0], job[1], warmers), jobs):
+                if size is None:
+                    summary["failed"] += 1
+                else:
+                    summary["files"] += 1
+                    summary["bytes"] += size
+        summary["seconds"] = time.perf_counter() - start
+        return summary
+
+    def warm(self, path, location, warmers):
+        try:
+            if location == PAK_FILE:
+                location = self.file_system.extract(path)
+            extension = os.path.splitext(path)[1]
+            if extension == MATERIAL_EXTENSION:
+                CryXmlSerializer(cache=self.cache, file_system=self.file_system).read_file(location)
+            elif extension in warmers:
+                warmers[extension](location)
+            else:
+                with open(location, "rb") as f:
+                    while f.read(READ_CHUNK_SIZE):
+                        pass
+            return os.path.getsize(location)
+        except Exception as e:
+            print("Unable to prefetch " + path + ": " + str(e))
+            return None
+
+def print_prefetch_summary(summary):
+    seconds = max(summary["seconds"], 1e-9)
+    megabytes = summary["bytes"] / (1024 * 1024)
+    print("Prefetched %d files (%.1f MB) in %.2fs, %.1f MB/s, %d failed" %
+          (summary["files"], megabytes, seconds, megabytes / seconds, summary["failed"]))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="List the files a Cryengine prefab library needs.")
+    parser.add_argument("prefab", help="Prefab library (.xml)")
+    parser.add_argument("basedir", help="Game directory the prefab paths are relative to")
+    parser.add_argument("-t", "--texture-extension", default=".dds", help="Texture file extension (default: %(default)s)")
+    parser.add_argument("-p", "--prefetch", action="store_true", help="Read every file found, to warm the caches")
+    args = parser.parse_args(argv)
+    resolver = DependencyResolver(args.basedir, texture_extension=args.texture_extension)
+    dependencies = resolver.resolve(args.prefab)
+    dependencies.print_report()
+    if args.prefetch:
+        print_prefetch_summary(resolver.prefetch(dependencies))
+    return 1 if dependencies.missing() else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
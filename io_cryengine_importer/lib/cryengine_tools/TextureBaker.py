@@ -0,0 +1,263 @@
+""" Bakes the per-pixel material corrections into textures ahead of the import.  Normal maps
+get their Z channel rebuilt from X and Y, and gloss stored in a texture's alpha becomes a
+roughness map (inverted and scaled by the material's shininess).  The baked textures are
+written to a content-addressed cache, and the material builders link them instead of
+building the correction nodes.  The cache also holds the downscaled copies of textures
+used by the lower texture quality settings.
+
+Does not need Blender, but does need NumPy:
+
+    python -m cryengine_tools.TextureBaker <game directory> [.mtl files or directories...] [--workers N]
+
+The importers run it with --jobs, a JSON list of [texture file, operation, scale] jobs.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy
+
+from .AssetIndex import AssetIndex
+from .CryXmlB.CryXmlCache import CryXmlCache, default_cache_dir
+from .CryXmlB.CryXmlReader import CryXmlSerializer
+from .TextureReader import read_downscaled_texture, read_texture, write_png
+
+BAKE_VERSION = 1        # Change when the baked output changes, so old bakes aren't used.
+BAKE_NORMAL = "normal"
+BAKE_ROUGHNESS = "roughness"
+BAKE_DOWNSCALE = "downscale"    # Scale is the power of two to divide the sides by
+BAKED_EXTENSION = ".png"
+MATERIAL_EXTENSION = ".mtl"
+HASH_CHUNK_SIZE = 1024 * 1024
+
+DIFFUSE_MAP = "diffuse"
+SPECULAR_MAP = "specular"
+NORMAL_MAP = "normal"
+# Texture Map names of each surface shader, and whether it reads gloss from a texture alpha.
+ILLUM_TEXTURES = ({"Diffuse": DIFFUSE_MAP, "TexSlot1": DIFFUSE_MAP, "Specular": SPECULAR_MAP,
+                   "Bumpmap": NORMAL_MAP, "TexSlot2": NORMAL_MAP}, True)
+MECHCOCKPIT_TEXTURES = ({"Diffuse": DIFFUSE_MAP, "Specular": SPECULAR_MAP, "Bumpmap": NORMAL_MAP, "TexSlot2": NORMAL_MAP}, True)
+MECH_TEXTURES = ({"Diffuse": DIFFUSE_MAP, "TexSlot1": DIFFUSE_MAP, "Specular": SPECULAR_MAP, "TexSlot4": SPECULAR_MAP,
+                  "Bumpmap": NORMAL_MAP, "TexSlot2": NORMAL_MAP}, False)
+# The textures create_materials builds for each shader (Mech materials are built as MechCockpit).
+SURFACE_SHADERS = {"Illum": ILLUM_TEXTURES, "MechCockpit": MECHCOCKPIT_TEXTURES, "Mech": MECHCOCKPIT_TEXTURES}
+
+def get_surface_textures(material_xml, texture_maps, use_gloss_maps=False):
+    """ Returns the material's textures by kind, and whether its roughness comes from the
+        diffuse or the specular alpha.  texture_maps maps Texture Map names to DIFFUSE_MAP,
+        SPECULAR_MAP or NORMAL_MAP.
+    """
+    textures = {}
+    for texture in material_xml.iter("Texture"):
+        kind = texture_maps.get(texture.get("Map"))
+        if kind is not None:
+            textures[kind] = texture    # The last one wins, as its links would replace the others.
+    gen_mask = material_xml.get("StringGenMask", "")
+    gloss_from_diffuse_alpha = use_gloss_maps and "%GLOSS_DIFFUSEALPHA" in gen_mask and DIFFUSE_MAP in textures
+    gloss_from_specular_alpha = use_gloss_maps and "%SPECULARPOW_GLOSSALPHA%" in gen_mask and SPECULAR_MAP in textures
+    return textures, gloss_from_diffuse_alpha, gloss_from_specular_alpha
+
+def get_gloss_scale(material_xml):
+    # Gloss maps are scaled by the shininess.  For shininess values close to 10
+    # we use a lower factor to prevent over-roughening.
+    if "Shininess" not in material_xml.keys():
+        return 1.0
+    return min(1.0, max(0.0, float(material_xml.get("Shininess")) / 100.0))
+
+def get_bake_jobs(material_xml, resolve):
+    """ Returns (texture file, operation, scale) for each texture of a <Material> element
+        that can be baked.  resolve returns the file on disk for a texture's File
+        attribute, or None when it is missing.
+    """
+    if material_xml.get("Shader") not in SURFACE_SHADERS:
+        return []
+    textures, gloss_from_diffuse_alpha, gloss_from_specular_alpha = get_surface_textures(
+        material_xml, *SURFACE_SHADERS[material_xml.get("Shader")])
+    jobs = []
+    def add(kind, operation, scale=1.0):
+        texture_file = resolve(textures[kind].get("File"))
+        if texture_file is not None:
+            jobs.append((texture_file, operation, scale))
+    if NORMAL_MAP in textures:
+        add(NORMAL_MAP, BAKE_NORMAL)
+    if gloss_from_specular_alpha:
+        add(SPECULAR_MAP, BAKE_ROUGHNESS)
+    elif gloss_from_diffuse_alpha:
+        add(DIFFUSE_MAP, BAKE_ROUGHNESS, get_gloss_scale(material_xml))
+    return jobs
+
+def bake_normal(pixels):
+    """ Rebuilds the Z (blue) channel of a tangent space normal map from X and Y, for normal
+        maps stored as two channels.
+    """
+    xy = pixels[:, :, :2].astype(numpy.float32) / 127.5 - 1.0
+    z = numpy.sqrt(numpy.clip(1.0 - (xy * xy).sum(axis=2), 0.0, 1.0))
+    normal = numpy.empty(pixels.shape[:2] + (3,), dtype=numpy.uint8)
+    normal[:, :, :2] = pixels[:, :, :2]
+    normal[:, :, 2] = numpy.rint((z + 1.0) * 127.5)
+    return normal
+
+def bake_roughness(pixels, scale=1.0):
+    """ Returns the roughness map for gloss stored in the alpha channel: (1 - gloss) * scale. """
+    gloss = pixels[:, :, 3].astype(numpy.float32) / 255.0
+    return numpy.rint(numpy.clip((1.0 - gloss) * scale, 0.0, 1.0) * 255.0).astype(numpy.uint8)
+
+BAKE_OPERATIONS = {BAKE_NORMAL: lambda pixels, scale: bake_normal(pixels), BAKE_ROUGHNESS: bake_roughness}
+
+class TextureBaker:
+    """ Content-addressed cache of baked textures.  A baked texture's name is a hash of the
+        source texture's contents, the operation and its scale, so copies of a texture
+        share their bakes and an edited texture gets a new one.  Source hashes are kept in
+        a CryXmlCache, so a texture is only read again after it changes.
+    """
+    def __init__(self, cache_dir=None, enabled=True):
+        self.cache_dir = cache_dir or default_cache_dir("textures")
+        self.hash_cache = CryXmlCache(os.path.join(self.cache_dir, "hashes"))
+        self.enabled = enabled
+
+    def content_hash(self, file):
+        content_hash = self.hash_cache.load(file)
+        if content_hash is None:
+            sha1 = hashlib.sha1()
+            with open(file, "rb") as f:
+                for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                    sha1.update(chunk)
+            content_hash = sha1.hexdigest()
+            self.hash_cache.store(file, content_hash)
+        return content_hash
+
+    def baked_path(self, file, operation, scale=1.0):
+        key = "%s|%s|%.4f|%d" % (self.content_hash(file), operation, scale, BAKE_VERSION)
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode("utf-8")).hexdigest() + BAKED_EXTENSION)
+
+    def lookup(self, file, operation, scale=1.0):
+        """ Returns the baked version of file, or None if it hasn't been baked. """
+        try:
+            path = self.baked_path(file, operation, scale)
+        except OSError:
+            return None
+        return path if os.path.isfile(path) else None
+
+    def bake(self, file, operation, scale=1.0):
+        """ Bakes file unless it already is.  Returns (baked path, whether it was baked now). """
+        path = self.baked_path(file, operation, scale)
+        if os.path.isfile(path):
+            return path, False
+        if operation == BAKE_DOWNSCALE:
+            pixels = read_downscaled_texture(file, int(scale))
+        else:
+            pixels = BAKE_OPERATIONS[operation](read_texture(file), scale)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        temp_path = path + "." + str(os.getpid()) + "." + str(threading.get_ident())
+        try:
+            write_png(temp_path, pixels)
+            os.replace(temp_path, path)
+        except OSError:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+        return path, True
+
+    def bake_all(self, jobs, workers=None):
+        """ Bakes (texture file, operation, scale) jobs on a process pool.
+            Returns a dict of counters and the elapsed time.
+        """
+        start = time.perf_counter()
+        jobs = list(dict.fromkeys(jobs))
+        summary = {"baked": 0, "up_to_date": 0, "failed": 0, "seconds": 0.0}
+        if not jobs:
+            return summary
+        workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as executor:
+            results = executor.map(bake_job, [self.cache_dir] * len(jobs), *zip(*jobs))
+            for (file, operation, _), (baked, error) in zip(jobs, results):
+                if error is not None:
+                    print("Unable to bake " + operation + " for " + file + ": " + error)
+                    summary["failed"] += 1
+                elif baked:
+                    summary["baked"] += 1
+                else:
+                    summary["up_to_date"] += 1
+        summary["seconds"] = time.perf_counter() - start
+        return summary
+
+def bake_job(cache_dir, file, operation, scale):
+    """ Runs one bake on a worker process.  Returns (baked now, error message). """
+    try:
+        return TextureBaker(cache_dir).bake(file, operation, scale)[1], None
+    except Exception as e:
+        return False, str(e)
+
+# Baked textures shared by the importers.  Baked normal and roughness maps are only used
+# when enabled by the Bake Textures option.
+texture_baker = TextureBaker(enabled=False)
+
+def find_material_files(inputs):
+    for path in inputs:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                for name in files:
+                    if name.lower().endswith(MATERIAL_EXTENSION):
+                        yield os.path.join(root, name)
+        else:
+            yield path
+
+def find_bake_jobs(material_files, basedir, texture_extension=".dds"):
+    """ Returns the bake jobs for the materials in material_files, finding their textures
+        under basedir.
+    """
+    asset_index = AssetIndex.for_directory(basedir)
+    def resolve(texture):
+        if not texture or texture.startswith("$"):
+            return None
+        return asset_index.lookup(os.path.splitext(texture)[0] + texture_extension)
+    serializer = CryXmlSerializer()
+    jobs = []
+    for material_file in material_files:
+        try:
+            materials = serializer.read_file(material_file)
+        except Exception as e:
+            print("Unable to read material " + material_file + ": " + str(e))
+            continue
+        for material_xml in materials.iter("Material"):
+            jobs.extend(get_bake_jobs(material_xml, resolve))
+    return jobs
+
+def print_summary(summary):
+    print("Baked %d textures in %.2fs.  Up to date: %d, failed: %d" %
+          (summary["baked"], summary["seconds"], summary["up_to_date"], summary["failed"]))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bake normal and roughness textures for Cryengine materials.")
+    parser.add_argument("basedir", nargs="?", help="Game directory the textures are found under")
+    parser.add_argument("materials", nargs="*", help=".mtl files or directories to search (default: the game directory)")
+    parser.add_argument("-t", "--texture-extension", default=".dds", help="Texture file extension (default: %(default)s)")
+    parser.add_argument("-c", "--cache-dir", default=None, help="Directory for the baked textures")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="Number of worker processes (default: CPU count)")
+    parser.add_argument("--jobs", help="Bake the jobs in this JSON file instead of searching materials")
+    parser.add_argument("--summary", help="Also write the summary to this JSON file")
+    args = parser.parse_args(argv)
+    if args.jobs:
+        with open(args.jobs, encoding="utf-8") as f:
+            jobs = [tuple(job) for job in json.load(f)]
+    elif args.basedir and os.path.isdir(args.basedir):
+        jobs = find_bake_jobs(find_material_files(args.materials or [args.basedir]), args.basedir, args.texture_extension)
+    else:
+        parser.error("Not a directory: " + str(args.basedir))
+    summary = TextureBaker(args.cache_dir).bake_all(jobs, args.workers)
+    print_summary(summary)
+    if args.summary:
+        with open(args.summary, "w", encoding="utf-8") as f:
+            json.dump(summary, f)
+    return 1 if summary["failed"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+import io
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from .PrefabDependencies import PAK_FILE
+from .TextureReader import read_texture_header
+
+BYTES_PER_PIXEL = 4         # Blender keeps 8 bit images as RGBA bytes,
+MIPMAP_FACTOR = 4 / 3       # and the GPU textures made from them have mipmaps.
+MAX_DOWNSCALE = 8
+MEGABYTE = 1024 * 1024
+PAK_HEADER_SIZE = 4096      # Bytes inflated to read a texture header from a pak: a DDS header, or a TIF directory before the pixels
+
+@dataclass
+class TextureInfo:
+    width: int
+    height: int
+    mip_count: int
+    format: str
+
+    def memory(self, downscale=1):
+        """ Estimated bytes the texture takes once loaded, with its sides divided by downscale. """
+        width, height = max(1, self.width // downscale), max(1, self.height // downscale)
+        return int(width * height * BYTES_PER_PIXEL * MIPMAP_FACTOR)
+
+@dataclass
+class TextureMemoryEstimate:
+    """ Estimated texture memory of an import.  Textures shared by several assets are
+        only counted once in the total.
+    """
+    textures: dict = field(default_factory=dict)    # Texture path: TextureInfo, or None if it couldn't be read
+    assets: dict = field(default_factory=dict)      # Asset name: paths of the textures it uses
+
+    def memory(self, paths=None, downscale=1):
+        paths = self.textures if paths is None else set(paths)
+        return sum(self.textures[path].memory(downscale) for path in paths if self.textures.get(path) is not None)
+
+    def asset_memory(self, downscale=1):
+        return {name: self.memory(paths, downscale) for name, paths in self.assets.items()}
+
+    def get_downscale(self, budget):
+        """ Returns the smallest power of two downscale that fits the textures in budget
+            bytes, or None if MAX_DOWNSCALE isn't enough.
+        """
+        downscale = 1
+        while downscale <= MAX_DOWNSCALE:
+            if self.memory(downscale=downscale) <= budget:
+                return downscale
+            downscale *= 2
+        return None
+
+    def unreadable(self):
+        return sorted(path for path, info in self.textures.items() if info is None)
+
+    def print_report(self):
+        print("Texture memory: %.1f MB estimated for %d textures, %d unreadable" %
+              (self.memory() / MEGABYTE, len(self.textures), len(self.unreadable())))
+        for name, memory in sorted(self.asset_memory().items(), key=lambda item: (-item[1], item[0])):
+            print("  %s: %.1f MB, %d textures" % (name, memory / MEGABYTE, len(self.assets[name])))
+
+def read_texture_info(path, location, file_system=None):
+    """ Reads the header of a texture at location: a real path, or PAK_FILE to read path
+        from file_system.  Returns None when the texture can't be read.
+    """
+    try:
+        if location == PAK_FILE:
+            header = file_system.read_header(path, PAK_HEADER_SIZE)
+            if header is None:
+                raise KeyError("not in the pak files")
+            try:
+                return TextureInfo(*read_texture_header(io.BytesIO(header)))
+            except struct.error:
+                # A TIF with its image directory after the pixels, at the end of the file.
+                return TextureInfo(*read_texture_header(io.BytesIO(file_system.read(path))))
+        with open(location, "rb") as f:
+            return TextureInfo(*read_texture_header(f))
+    except (OSError, ValueError, KeyError, struct.error) as e:
+        print("Unable to read texture header " + path + ": " + str(e))
+        return None
+
+def read_texture_infos(textures, file_system=None, workers=None):
+    """ Reads the headers of textures, a dict of path: location (as in PrefabDependencies),
+        on a thread pool.  Returns a dict of path: TextureInfo or None.
+    """
+    textures = {path: location for path, location in textures.items() if location is not None}
+    workers = workers or min(32, (os.cpu_count() or 1) + 4)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        infos = executor.map(lambda item: read_texture_info(item[0], item[1], file_system), textures.items())
+        return dict(zip(textures, infos))
+
+def estimate_prefab_textures(dependencies, file_system=None, workers=None):
+    """ Estimates the texture memory of a prefab library from its PrefabDependencies, per
+        prefab.  Only the images of the geometry's Collada materials are counted: the prefab
+        importer builds its materials from the Collada files, not the .mtl files.
+    """
+    assets = {prefab: sorted({texture for geometry in geometry_files for texture in dependencies.geometry_textures.get(geometry, ())})
+              for prefab, geometry_files in dependencies.prefab_geometry.items()}
+    textures = {texture: dependencies.textures.get(texture) for paths in assets.values() for texture in paths}
+    return TextureMemoryEstimate(read_texture_infos(textures, file_system, workers), assets)
+
+def estimate_textures(assets, workers=None):
+    """ Estimates the texture memory of assets, a dict of asset name: real paths of its textures. """
+    textures = {path: path for paths in assets.values() for path in paths}
+    return TextureMemoryEstimate(read_texture_infos(textures, workers=workers), {name: list(paths) for name, paths in assets.items()})
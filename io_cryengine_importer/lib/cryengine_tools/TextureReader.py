@@ -0,0 +1,272 @@
+import io
+import struct
+import zlib
+
+import numpy
+
+DDS_MAGIC = b"DDS "
+# DDS_HEADER after the magic: size, flags, height, width, pitch, depth, mip count, 11 reserved
+# words, then the pixel format (size, flags, four cc, bit count, R, G, B, A masks) and caps.
+DDS_HEADER_FORMAT = struct.Struct("<7I44x2I4s5I20x")
+DDS_DX10_HEADER_FORMAT = struct.Struct("<5I")
+DDPF_ALPHAPIXELS = 0x1
+DDPF_RGB = 0x40
+FOURCC_FORMATS = {b"DXT1": "BC1", b"DXT3": "BC2", b"DXT5": "BC3", b"ATI1": "BC4", b"BC4U": "BC4",
+                  b"ATI2": "BC5", b"BC5U": "BC5"}
+DXGI_FORMATS = {28: "RGBA8", 29: "RGBA8", 71: "BC1", 72: "BC1", 74: "BC2", 75: "BC2", 77: "BC3", 78: "BC3",
+                80: "BC4", 83: "BC5", 87: "BGRA8", 88: "BGRX8", 91: "BGRA8", 95: "BC6H", 96: "BC6H", 98: "BC7", 99: "BC7"}
+BLOCK_SIZES = {"BC1": 8, "BC2": 16, "BC3": 16, "BC4": 8, "BC5": 16, "BC6H": 16, "BC7": 16}
+PIXEL_SIZES = {"RGBA8": 4, "BGRA8": 4, "BGRX8": 4, "BGR8": 3}
+
+TIFF_BYTE_ORDERS = {b"II": "<", b"MM": ">"}
+TIFF_TYPES = {1: "B", 3: "H", 4: "I"}   # BYTE, SHORT, LONG; other tag types aren't needed
+TIFF_WIDTH, TIFF_HEIGHT, TIFF_BITS, TIFF_COMPRESSION, TIFF_PHOTOMETRIC = 256, 257, 258, 259, 262
+TIFF_STRIP_OFFSETS, TIFF_SAMPLES, TIFF_STRIP_BYTE_COUNTS, TIFF_PLANAR, TIFF_PREDICTOR = 273, 277, 279, 284, 317
+TIFF_UNCOMPRESSED = 1
+TIFF_DEFLATE = (8, 32946)
+TIFF_FORMATS = {1: "L8", 2: "LA8", 3: "RGB8", 4: "RGBA8"}     # By samples per pixel, for 8 bit images
+
+class UnsupportedTextureError(ValueError):
+    """ Raised for texture files that can't be decoded here, like BC7 or LZW compressed TIFs. """
+
+def read_dds_header(data):
+    """ Returns (width, height, mip count, format, offset of the pixel data) from the first
+        148 bytes of a DDS file.  format is one of the names in BLOCK_SIZES or PIXEL_SIZES,
+        or "unknown".
+    """
+    if data[:4] != DDS_MAGIC or len(data) < 4 + DDS_HEADER_FORMAT.size:
+        raise UnsupportedTextureError("Not a DDS file")
+    (_, _, height, width, _, _, mip_count, _, pf_flags, four_cc,
+     bit_count, r_mask, _, _, _) = DDS_HEADER_FORMAT.unpack_from(data, 4)
+    offset = 4 + DDS_HEADER_FORMAT.size
+    texture_format = "unknown"
+    if four_cc == b"DX10":
+        dxgi_format = DDS_DX10_HEADER_FORMAT.unpack_from(data, offset)[0]
+        texture_format = DXGI_FORMATS.get(dxgi_format, "unknown")
+        offset += DDS_DX10_HEADER_FORMAT.size
+    elif four_cc in FOURCC_FORMATS:
+        texture_format = FOURCC_FORMATS[four_cc]
+    elif pf_flags & DDPF_RGB and bit_count == 32:
+        has_alpha = pf_flags & DDPF_ALPHAPIXELS
+        texture_format = ("RGBA8" if r_mask == 0xff else "BGRA8") if has_alpha else "BGRX8"
+    elif pf_flags & DDPF_RGB and bit_count == 24:
+        texture_format = "BGR8"
+    return width, height, max(mip_count, 1), texture_format, offset
+
+def get_mip_size(width, height, texture_format):
+    """ Returns the bytes taken by one mip level of a DDS format. """
+    if texture_format in BLOCK_SIZES:
+        return max(1, (width + 3) // 4) * max(1, (height + 3) // 4) * BLOCK_SIZES[texture_format]
+    return width * height * PIXEL_SIZES[texture_format]
+
+def read_dds(data, mip=0):
+    """ Decodes one mip level of a DDS file to an (height, width, 4) RGBA uint8 array. """
+    width, height, mip_count, texture_format, offset = read_dds_header(data)
+    if texture_format not in BLOCK_SIZES and texture_format not in PIXEL_SIZES:
+        raise UnsupportedTextureError("Unknown DDS format")
+    if texture_format in ("BC6H", "BC7"):
+        raise UnsupportedTextureError(texture_format + " textures aren't supported")
+    for level in range(min(mip, mip_count - 1)):
+        offset += get_mip_size(width, height, texture_format)
+        width, height = max(1, width // 2), max(1, height // 2)
+    size = get_mip_size(width, height, texture_format)
+    if len(data) < offset + size:
+        # Streamed textures keep their larger mips in .dds.1, .dds.2 ... files.
+        raise UnsupportedTextureError("DDS file is truncated (split into mip files?)")
+    level = numpy.frombuffer(data, dtype=numpy.uint8, count=size, offset=offset)
+    if texture_format in PIXEL_SIZES:
+        pixels = level.reshape(height, width, PIXEL_SIZES[texture_format])
+        rgba = numpy.full((height, width, 4), 255, dtype=numpy.uint8)
+        if texture_format == "RGBA8":
+            rgba[:] = pixels
+        else:
+            rgba[:, :, :3] = pixels[:, :, 2::-1]
+            if texture_format == "BGRA8":
+                rgba[:, :, 3] = pixels[:, :, 3]
+        return rgba
+    return decode_blocks(level, width, height, texture_format)
+
+def decode_blocks(data, width, height, texture_format):
+    """ Decodes BC1-BC5 compressed data to an (height, width, 4) RGBA uint8 array. """
+    blocks_wide, blocks_high = max(1, (width + 3) // 4), max(1, (height + 3) // 4)
+    blocks = data.reshape(blocks_wide * blocks_high, BLOCK_SIZES[texture_format])
+    texels = numpy.empty((len(blocks), 16, 4), dtype=numpy.uint8)
+    if texture_format == "BC1":
+        texels[:] = decode_color_blocks(blocks, four_color_only=False)
+    elif texture_format == "BC2":
+        texels[:] = decode_color_blocks(blocks[:, 8:], four_color_only=True)
+        nibbles = numpy.stack((blocks[:, :8] & 0xf, blocks[:, :8] >> 4), axis=2).reshape(-1, 16)
+        texels[:, :, 3] = nibbles * 17
+    elif texture_format == "BC3":
+        texels[:] = decode_color_blocks(blocks[:, 8:], four_color_only=True)
+        texels[:, :, 3] = decode_alpha_blocks(blocks[:, :8])
+    elif texture_format == "BC4":
+        texels[:, :, :3] = decode_alpha_blocks(blocks)[:, :, None]
+        texels[:, :, 3] = 255
+    else:   # BC5: red and green, as in two channel normal maps
+        texels[:, :, 0] = decode_alpha_blocks(blocks[:, :8])
+        texels[:, :, 1] = decode_alpha_blocks(blocks[:, 8:])
+        texels[:, :, 2] = 0
+        texels[:, :, 3] = 255
+    # Blocks are 4x4 texels in rows of blocks; put the texel rows next to each other.
+    image = texels.reshape(blocks_high, blocks_wide, 4, 4, 4).transpose(0, 2, 1, 3, 4)
+    return numpy.ascontiguousarray(image.reshape(blocks_high * 4, blocks_wide * 4, 4)[:height, :width])
+
+def unpack_rgb565(colors):
+    rgb = numpy.stack(((colors >> 11) & 0x1f, (colors >> 5) & 0x3f, colors & 0x1f), axis=1)
+    return (rgb * 255 + numpy.array([15, 31, 15])) // numpy.array([31, 63, 31])
+
+def decode_color_blocks(blocks, four_color_only):
+    """ Returns the (blocks, 16, 4) texels of 8 byte BC1 color blocks. """
+    endpoints = numpy.ascontiguousarray(blocks[:, :4]).view("<u2").astype(numpy.int32)
+    color0, color1 = endpoints[:, 0], endpoints[:, 1]
+    rgb0, rgb1 = unpack_rgb565(color0), unpack_rgb565(color1)
+    four_colors = (color0 > color1)[:, None] | four_color_only
+    palette = numpy.empty((len(blocks), 4, 4), dtype=numpy.int32)
+    palette[:, 0, :3] = rgb0
+    palette[:, 1, :3] = rgb1
+    palette[:, 2, :3] = numpy.where(four_colors, (2 * rgb0 + rgb1) // 3, (rgb0 + rgb1) // 2)
+    palette[:, 3, :3] = numpy.where(four_colors, (rgb0 + 2 * rgb1) // 3, 0)
+    palette[:, :, 3] = 255
+    palette[:, 3, 3] = numpy.where(four_colors[:, 0], 255, 0)     # Three color blocks have a transparent black
+    indices = numpy.ascontiguousarray(blocks[:, 4:8]).view("<u4")[:, :1]
+    indices = (indices >> (2 * numpy.arange(16, dtype=numpy.uint32))) & 3
+    return palette[numpy.arange(len(blocks))[:, None], indices].astype(numpy.uint8)
+
+def decode_alpha_blocks(blocks):
+    """ Returns the (blocks, 16) values of 8 byte BC4 blocks (also BC3 alpha and BC5 channels). """
+    alpha0, alpha1 = blocks[:, 0].astype(numpy.int32)[:, None], blocks[:, 1].astype(numpy.int32)[:, None]
+    steps = numpy.arange(1, 7)
+    eight_values = ((7 - steps) * alpha0 + steps * alpha1 + 3) // 7
+    steps = numpy.arange(1, 5)
+    six_values = numpy.concatenate((((5 - steps) * alpha0 + steps * alpha1 + 2) // 5,
+                                    numpy.zeros_like(alpha0), numpy.full_like(alpha0, 255)), axis=1)
+    palette = numpy.concatenate((alpha0, alpha1, numpy.where(alpha0 > alpha1, eight_values, six_values)), axis=1)
+    bits = numpy.zeros(len(blocks), dtype=numpy.uint64)
+    for byte in range(6):
+        bits |= blocks[:, 2 + byte].astype(numpy.uint64) << numpy.uint64(8 * byte)
+    indices = (bits[:, None] >> (numpy.uint64(3) * numpy.arange(16, dtype=numpy.uint64))) & numpy.uint64(7)
+    return palette[numpy.arange(len(blocks))[:, None], indices.astype(numpy.intp)].astype(numpy.uint8)
+
+def read_tiff_tags(f):
+    """ Returns the byte order and the tags of the first image in a TIFF file, as
+        {tag: tuple of values}, reading only the image directory.
+    """
+    f.seek(0)
+    header = f.read(8)
+    order = TIFF_BYTE_ORDERS.get(header[:2])
+    if order is None or len(header) < 8 or struct.unpack(order + "H", header[2:4])[0] != 42:
+        raise UnsupportedTextureError("Not a TIFF file")
+    f.seek(struct.unpack(order + "I", header[4:8])[0])
+    count = struct.unpack(order + "H", f.read(2))[0]
+    entries = f.read(12 * count)
+    tags = {}
+    for index in range(count):
+        tag, tag_type, value_count, value = struct.unpack_from(order + "HHI4s", entries, 12 * index)
+        value_format = TIFF_TYPES.get(tag_type)
+        if value_format is None:
+            continue
+        size = value_count * struct.calcsize(value_format)
+        if size > 4:
+            position = f.tell()
+            f.seek(struct.unpack(order + "I", value)[0])
+            value = f.read(size)
+            f.seek(position)
+        tags[tag] = struct.unpack(order + str(value_count) + value_format, value[:size])
+    return order, tags
+
+def read_tiff(f):
+    """ Decodes an 8 bit per channel, uncompressed or Deflate compressed TIFF to an
+        (height, width, 4) RGBA uint8 array.
+    """
+    order, tags = read_tiff_tags(f)
+    width, height = tags[TIFF_WIDTH][0], tags[TIFF_HEIGHT][0]
+    samples = tags.get(TIFF_SAMPLES, (1,))[0]
+    compression = tags.get(TIFF_COMPRESSION, (TIFF_UNCOMPRESSED,))[0]
+    if any(bits != 8 for bits in tags.get(TIFF_BITS, (1,))):
+        raise UnsupportedTextureError("Only 8 bit TIFF files are supported")
+    if compression != TIFF_UNCOMPRESSED and compression not in TIFF_DEFLATE:
+        raise UnsupportedTextureError("Unsupported TIFF compression " + str(compression))
+    if tags.get(TIFF_PLANAR, (1,))[0] != 1 or samples not in (1, 2, 3, 4):
+        raise UnsupportedTextureError("Unsupported TIFF layout")
+    strips = []
+    for offset, size in zip(tags[TIFF_STRIP_OFFSETS], tags[TIFF_STRIP_BYTE_COUNTS]):
+        f.seek(offset)
+        strip = f.read(size)
+        strips.append(zlib.decompress(strip) if compression in TIFF_DEFLATE else strip)
+    pixels = numpy.frombuffer(b"".join(strips), dtype=numpy.uint8, count=width * height * samples)
+    pixels = pixels.reshape(height, width, samples)
+    if tags.get(TIFF_PREDICTOR, (1,))[0] == 2:     # Horizontal differencing
+        pixels = numpy.cumsum(pixels, axis=1, dtype=numpy.uint8)
+    rgba = numpy.full((height, width, 4), 255, dtype=numpy.uint8)
+    if samples <= 2:    # Grayscale, with alpha
+        rgba[:, :, :3] = pixels[:, :, :1]
+        if samples == 2:
+            rgba[:, :, 3] = pixels[:, :, 1]
+    else:
+        rgba[:, :, :samples] = pixels
+    return rgba
+
+def read_texture_header(f):
+    """ Returns (width, height, mip count, format) of a DDS or TIF file from its header,
+        without reading the pixels.
+    """
+    header = f.read(4 + DDS_HEADER_FORMAT.size + DDS_DX10_HEADER_FORMAT.size)
+    if header[:4] == DDS_MAGIC:
+        return read_dds_header(header)[:4]
+    order, tags = read_tiff_tags(f)
+    samples = tags.get(TIFF_SAMPLES, (1,))[0]
+    bits = tags.get(TIFF_BITS, (1,))
+    texture_format = TIFF_FORMATS.get(samples, "unknown") if all(value == 8 for value in bits) else "unknown"
+    return tags[TIFF_WIDTH][0], tags[TIFF_HEIGHT][0], 1, texture_format
+
+def read_texture(path):
+    """ Decodes the first image of a DDS or TIF file to an (height, width, 4) RGBA uint8 array. """
+    with open(path, "rb") as f:
+        if f.read(4) == DDS_MAGIC:
+            f.seek(0)
+            return read_dds(f.read())
+        return read_tiff(f)
+
+def read_downscaled_texture(path, downscale):
+    """ Returns the first image of a DDS or TIF file with its sides divided by downscale, a
+        power of two.  DDS files use their mip level of that size when they have it.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:4] != DDS_MAGIC:
+        return downscale_pixels(read_tiff(io.BytesIO(data)), downscale)
+    mip_count = read_dds_header(data)[2]
+    level = downscale.bit_length() - 1
+    if level < mip_count:
+        return read_dds(data, level)
+    return downscale_pixels(read_dds(data), downscale)
+
+def downscale_pixels(pixels, downscale):
+    """ Box filters an (height, width, channels) uint8 array down by a power of two, stopping
+        before a side would go under one pixel.
+    """
+    height, width = pixels.shape[:2]
+    while downscale > 1 and (height < downscale or width < downscale):
+        downscale //= 2
+    if downscale <= 1:
+        return pixels
+    height, width = height // downscale, width // downscale
+    blocks = pixels[:height * downscale, :width * downscale].reshape(height, downscale, width, downscale, -1)
+    return (blocks.mean(axis=(1, 3)) + 0.5).astype(numpy.uint8)
+
+def write_png(path, pixels):
+    """ Writes an (height, width) or (height, width, channels) uint8 array as an 8 bit PNG. """
+    if pixels.ndim == 2:
+        pixels = pixels[:, :, None]
+    height, width, channels = pixels.shape
+    color_type = {1: 0, 2: 4, 3: 2, 4: 6}[channels]
+    rows = numpy.zeros((height, width * channels + 1), dtype=numpy.uint8)    # Filter type 0 per row
+    rows[:, 1:] = pixels.reshape(height, -1)
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xffffffff)
+    with open(path, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        f.write(chunk(b"IHDR", struct.pack(">2I5B", width, height, 8, color_type, 0, 0, 0)))
+        f.write(chunk(b"IDAT", zlib.compress(rows.tobytes(), 6)))
+        f.write(chunk(b"IEND", b""))
@@ -0,0 +1,9 @@
+""" Readers, caches and command line tools for Cryengine game files that don't need Blender.
+
+Everything in this package imports only the standard library, NumPy and its own modules
+(relative imports), so it can be used outside Blender.  Run the tools as modules from the
+lib directory (not the add-on directory, whose collections.py hides the standard library's):
+
+    cd io_cryengine_importer/lib
+    python -m cryengine_tools.BatchImporter <.cdf, prefab .xml, directory or manifest>...
+"""
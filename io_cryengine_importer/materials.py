@@ -1,9 +1,38 @@
-import os, os.path
+import json, os, os.path, subprocess, sys, tempfile
 import bpy
-from . import utilities
-from .CryXmlB.CryXmlReader import CryXmlSerializer
+from . import constants, utilities
+from .lib.cryengine_tools import TextureBaker
+from .lib.cryengine_tools.CryXmlB.CryXmlReader import CryXmlSerializer, string_pool
+from .lib.cryengine_tools.CryXmlB.CryXmlCache import parse_cache
+from .lib.cryengine_tools.MaterialFingerprint import material_fingerprint
+from .lib.cryengine_tools.TextureBaker import (texture_baker, get_bake_jobs, get_gloss_scale, get_surface_textures, BAKE_DOWNSCALE, BAKE_NORMAL, BAKE_ROUGHNESS,
+                                   DIFFUSE_MAP, SPECULAR_MAP, NORMAL_MAP, ILLUM_TEXTURES, MECHCOCKPIT_TEXTURES, MECH_TEXTURES, SURFACE_SHADERS)
 
 default_texture_file = os.path.join(os.path.dirname(os.path.realpath(__file__)), "assets\\default_mat_warning.png")
+FINGERPRINT_PROPERTY = "cryengine_fingerprint"
+FULL_RESOLUTION_PROPERTY = "cryengine_full_resolution"     # Texture file of an image pointed at a downscaled copy
+TEXTURE_EXTENSIONS = (".dds", ".tif")
+BAKE_TIMEOUT = 30 * 60      # Seconds before a texture bake is stopped
+FINGERPRINT_VERSION = 2     # Change when the node trees built below change, so old materials aren't reused.
+SHADER_GROUP_PREFIX = "Cryengine "
+# Inputs of the surface shader groups: name, socket type, default value.
+SURFACE_GROUP_INPUTS = (
+    ("Base Color", 'NodeSocketColor', (0.8, 0.8, 0.8, 1.0)),
+    ("Diffuse Alpha", 'NodeSocketFloat', 1.0),
+    ("Specular Tint", 'NodeSocketColor', (1.0, 1.0, 1.0, 1.0)),
+    ("Specular Alpha", 'NodeSocketFloat', 1.0),
+    ("Normal Map", 'NodeSocketColor', (0.5, 0.5, 1.0, 1.0)),
+    ("Metallic", 'NodeSocketFloat', 1.0),
+    ("Roughness", 'NodeSocketFloat', 0.5),
+    ("Gloss Scale", 'NodeSocketFloat', 1.0),
+    ("Specular IOR Level", 'NodeSocketFloat', 0.5),
+    ("Emission", 'NodeSocketColor', (0.0, 0.0, 0.0, 1.0)),
+    ("Emission Strength", 'NodeSocketFloat', 0.0),
+    ("Alpha", 'NodeSocketFloat', 1.0),
+    ("Transmission Weight", 'NodeSocketFloat', 0.0),
+)
+material_summary = {"created": 0, "reused": {}}     # Reused: material name: name of the existing material
+loaded_images = None    # Texture file: image, built by load_image once per import
 
 def fix_submaterials(mats_raw):
     submats = mats_raw.findall("SubMaterials")
@@ -23,8 +52,9 @@ def create_materials(matfile, basedir, use_dds=True, use_tif=False):
     elif use_tif == True:
         print("Using TIF")
         file_extension = ".tif"
-    cry_xml = CryXmlSerializer()
-    mats = cry_xml.read_file(matfile)
+    cry_xml = CryXmlSerializer(lazy=True, cache=parse_cache, file_system=constants.file_system, string_pool=string_pool)
+    mats = cry_xml.read_file(utilities.resolve_file(matfile, extract=False))   # The serializer reads paks itself
+    existing_materials = get_fingerprinted_materials()
     # Find if it has submaterial element
     for material_xml in mats.iter("Material"):
         if "Shader" in material_xml.attrib:
@@ -33,9 +63,24 @@ def create_materials(matfile, basedir, use_dds=True, use_tif=False):
             else:
                 mat_name = os.path.splitext(matfile)[0]
             print("Processing material " + mat_name)
+            # Reuse an identical material from an earlier import or another material file.  The baked
+            # textures it would use are part of the fingerprint, so a failed bake isn't reused later.
+            baked_textures = None
+            if material_xml.attrib["Shader"] in SURFACE_SHADERS:
+                baked_textures = get_surface_bakes(material_xml, file_extension, *SURFACE_SHADERS[material_xml.attrib["Shader"]])[3:]
+            fingerprint = material_fingerprint(material_xml, FINGERPRINT_VERSION, file_extension,
+                                               os.path.normcase(os.path.abspath(basedir)), baked_textures)
+            material = existing_materials.get(fingerprint)
+            if material is not None:
+                print("Reusing material " + material.name + " for " + mat_name)
+                materials[mat_name] = material
+                material_summary["reused"][mat_name] = material.name
+                continue
             # An actual material.  Create the material, set to nodes, clear and rebuild using the info from the material XML file.
-            # TODO:  Make sure the material doesn't already exist.  Figure out how to handle if so.
             material = bpy.data.materials.new(mat_name)
+            material[FINGERPRINT_PROPERTY] = fingerprint
+            existing_materials[fingerprint] = material
+            material_summary["created"] += 1
             materials[mat_name] = material
             material.use_nodes = True
             shader = material_xml.attrib["Shader"]
@@ -85,7 +130,7 @@ def create_materials(matfile, basedir, use_dds=True, use_tif=False):
                         if texture.attrib["Map"] == "Diffuse":
                             texturefile = utilities.get_filename(texture.attrib["File"], file_extension)
                             print("Texturefile: " + str(texturefile))
-                            if os.path.isfile(texturefile):
+                            if utilities.file_exists(texturefile):
                                 matDiffuse = bpy.data.images.load(filepath=texturefile, check_existing=True)
                                 shaderDiffImg = tree_nodes.nodes.new('ShaderNodeTexImage')
                                 shaderDiffImg.image=matDiffuse
@@ -93,7 +138,7 @@ def create_materials(matfile, basedir, use_dds=True, use_tif=False):
                                 links.new(shaderDiffImg.outputs[0], shaderPrincipledBSDF.inputs['Base Color'])
                         if texture.attrib["Map"] == "Specular":
                             texturefile = utilities.get_filename(texture.attrib["File"], file_extension)
-                            if os.path.isfile(texturefile):
+                            if utilities.file_exists(texturefile):
                                 matSpec=bpy.data.images.load(filepath=texturefile, check_existing=True)
                                 matSpec.colorspace_settings.name = 'Non-Color'
                                 shaderSpecImg=tree_nodes.nodes.new('ShaderNodeTexImage')
@@ -102,8 +147,8 @@ def create_materials(matfile, basedir, use_dds=True, use_tif=False):
                                 shaderSpecImg.location = 0,325
                                 links.new(shaderSpecImg.outputs[0], shaderPrincipledBSDF.inputs['Specular Tint'])
                         if texture.attrib["Map"] == "Bumpmap":
-                            if os.path.isfile(texturefile):
-                                texturefile = utilities.get_filename(texture.attrib["File"], file_extension)
+                            texturefile = utilities.get_filename(texture.attrib["File"], file_extension)
+                            if utilities.file_exists(texturefile):
                                 matNormal=bpy.data.images.load(filepath=texturefile, check_existing=True)
                                 matNormal.colorspace_settings.name = 'Non-Color'
                                 shaderNormalImg=tree_nodes.nodes.new('ShaderNodeTexImage')
@@ -130,19 +175,10 @@ def create_nodraw_shader_material(material_xml, material, file_extension):
     for n in tree_nodes.nodes:
         tree_nodes.nodes.remove(n)
     
-    # Create a Principled BSDF node
-    shaderPrincipledBSDF = tree_nodes.nodes.new('ShaderNodeBsdfPrincipled')
-    shaderPrincipledBSDF.location = 300, 600
-    
-    # Set to fully transparent
-    shaderPrincipledBSDF.inputs['Base Color'].default_value = (1.0, 1.0, 1.0, 1.0)
-    shaderPrincipledBSDF.inputs['Alpha'].default_value = 0.0  # Fully transparent
-    shaderPrincipledBSDF.inputs['Transmission Weight'].default_value = 1.0  # Fully transmissive
-    
-    output_node = tree_nodes.nodes.new('ShaderNodeOutputMaterial')
-    output_node.location = 500, 600
-    
-    links.new(shaderPrincipledBSDF.outputs[0], output_node.inputs[0])
+    # The fully transparent shader is a node group shared by every Nodraw material.
+    group_node = create_shader_group_node(tree_nodes, get_nodraw_shader_group())
+    output_node = create_output_node(tree_nodes)
+    links.new(group_node.outputs[0], output_node.inputs[0])
     
     # Check if there's a texture (though this should rarely happen for nodraw)
     for texture in material_xml.iter("Texture"):
@@ -151,206 +187,238 @@ def create_nodraw_shader_material(material_xml, material, file_extension):
             if texture_node:
                 texture_node.location = 0, 600
                 
-    return shaderPrincipledBSDF  # Return the shader node for consistency
+    return group_node  # Return the shader node for consistency
 
 def create_mechcockpit_shader_material(material_xml, material, file_extension):
     print("MechCockpit shader")
-    tree_nodes = material.node_tree
-    links = tree_nodes.links
-    for n in tree_nodes.nodes:
-        tree_nodes.nodes.remove(n)
-    # Every material will have a PrincipledBSDF and Material output.  Add, place, and link.
-    shaderPrincipledBSDF = create_principle_bsdf_root_node(material_xml, tree_nodes)
-    output_node = create_output_node(tree_nodes)
-    links.new(shaderPrincipledBSDF.outputs[0], output_node.inputs[0])
-    uses_gloss_from_diffuse_alpha = False
-    if "StringGenMask" in material_xml.keys():
-        if "%GLOSS_DIFFUSEALPHA" in material_xml.attrib["StringGenMask"]:
-            uses_gloss_from_diffuse_alpha = True
-    for texture in material_xml.iter("Texture"):
-        map = texture.attrib["Map"]
-        if map == "Diffuse":
-            print("Adding Diffuse Map")
-            texture_node = create_image_texture_node(tree_nodes, texture, file_extension)
-            if texture_node:
-                texture_node.location = 0, 600
-                links.new(texture_node.outputs[0], shaderPrincipledBSDF.inputs['Base Color'])
-                
-                # If using gloss from diffuse alpha, connect the alpha to roughness through an invert node
-                if uses_gloss_from_diffuse_alpha:
-                    # Create invert node (since gloss is inverse of roughness)
-                    invert_node = tree_nodes.nodes.new('ShaderNodeInvert')
-                    invert_node.location = 150, 400
-                    links.new(texture_node.outputs[1], invert_node.inputs[1])
-                    links.new(invert_node.outputs[0], shaderPrincipledBSDF.inputs['Roughness'])
-                    
-                    # Adjust shininess range based on material settings
-                    if "Shininess" in material_xml.keys():
-                        shininess = float(material_xml.attrib["Shininess"])
-                        # For GLOSS_DIFFUSEALPHA the shininess value often acts as a multiplier
-                        # Add a math multiply node
-                        multiply_node = tree_nodes.nodes.new('ShaderNodeMath')
-                        multiply_node.operation = 'MULTIPLY'
-                        multiply_node.location = 280, 400
-                        
-                        # Set the second value based on a 0-1 range for shininess
-                        # For shininess values close to 10 (as in your example), 
-                        # we use a lower factor to prevent over-roughening
-                        normalized_shininess = min(1.0, max(0.0, shininess / 100.0))
-                        multiply_node.inputs[1].default_value = normalized_shininess
-                        
-                        links.new(invert_node.outputs[0], multiply_node.inputs[0])
-                        links.new(multiply_node.outputs[0], shaderPrincipledBSDF.inputs['Roughness'])
-        
-        if map == "Specular":
-            print("Adding Specular Map")
-            texture_node = create_image_texture_node(tree_nodes, texture, file_extension)
-            if texture_node:
-                texture_node.location = 0, 300
-                texture_node.image.colorspace_settings.name = "Non-Color"
-                links.new(texture_node.outputs[0], shaderPrincipledBSDF.inputs['Specular Tint'])
-                # If the material uses gloss in alpha channel, connect it to Roughness inverted
-                if "StringGenMask" in material_xml.keys() and "%SPECULARPOW_GLOSSALPHA%" in material_xml.attrib["StringGenMask"]:
-                    invert_node = tree_nodes.nodes.new('ShaderNodeInvert')
-                    invert_node.location = 150, 200
-                    links.new(texture_node.outputs[1], invert_node.inputs[1])
-                    links.new(invert_node.outputs[0], shaderPrincipledBSDF.inputs['Roughness'])
-        if map == "Bumpmap" or map == "TexSlot2":
-            print("Adding Bump Map")
-            texture_node = create_image_texture_node(tree_nodes, texture, file_extension)
-            if texture_node:
-                texture_node.location = -500, 0  # Move further left to make room for nodes
-                texture_node.image.colorspace_settings.name = "Non-Color"
-                normal_map_node = tree_nodes.nodes.new('ShaderNodeNormalMap')
-                normal_map_node.location = 50, 0
-                process_normal_map_nodes(tree_nodes, texture_node, normal_map_node, links)
-                links.new(normal_map_node.outputs[0], shaderPrincipledBSDF.inputs['Normal'])
-    pass
+    create_surface_shader_material(material_xml, material, file_extension, "MechCockpit", *MECHCOCKPIT_TEXTURES)
 
 def create_illum_shader_material(material_xml, material, file_extension):
     print("Illum shader")
     material.blend_method = "CLIP"
-    tree_nodes = material.node_tree
-    links = tree_nodes.links
-    for n in tree_nodes.nodes:
-        tree_nodes.nodes.remove(n)
-    # Every material will have a PrincipledBSDF and Material output.  Add, place, and link.
-    shaderPrincipledBSDF = create_principle_bsdf_root_node(material_xml, tree_nodes)
-    output_node = create_output_node(tree_nodes)
-    links.new(shaderPrincipledBSDF.outputs[0], output_node.inputs[0])
-
-    uses_gloss_from_diffuse_alpha = False
-    if "StringGenMask" in material_xml.keys():
-        if "%GLOSS_DIFFUSEALPHA" in material_xml.attrib["StringGenMask"]:
-            uses_gloss_from_diffuse_alpha = True
-    for texture in material_xml.iter("Texture"):
-        map = texture.attrib["Map"]
-        if map == "Diffuse" or map == "TexSlot1":
-            print("Adding Diffuse Map")
-            texture_node = create_image_texture_node(tree_nodes, texture, file_extension)
-            if texture_node:
-                texture_node.location = 0, 600
-                links.new(texture_node.outputs[0], shaderPrincipledBSDF.inputs['Base Color'])
-                
-                # If using gloss from diffuse alpha, connect the alpha to roughness through an invert node
-                if uses_gloss_from_diffuse_alpha:
-                    # Create invert node (since gloss is inverse of roughness)
-                    invert_node = tree_nodes.nodes.new('ShaderNodeInvert')
-                    invert_node.location = 150, 400
-                    links.new(texture_node.outputs[1], invert_node.inputs[1])
-                    links.new(invert_node.outputs[0], shaderPrincipledBSDF.inputs['Roughness'])
-                    
-                    # Adjust shininess range based on material settings
-                    if "Shininess" in material_xml.keys():
-                        shininess = float(material_xml.attrib["Shininess"])
-                        # For GLOSS_DIFFUSEALPHA the shininess value often acts as a multiplier
-                        # Add a math multiply node
-                        multiply_node = tree_nodes.nodes.new('ShaderNodeMath')
-                        multiply_node.operation = 'MULTIPLY'
-                        multiply_node.location = 280, 400
-                        
-                        # Set the second value based on a 0-1 range for shininess
-                        # For shininess values close to 10 (as in your example), 
-                        # we use a lower factor to prevent over-roughening
-                        normalized_shininess = min(1.0, max(0.0, shininess / 100.0))
-                        multiply_node.inputs[1].default_value = normalized_shininess
-                        
-                        links.new(invert_node.outputs[0], multiply_node.inputs[0])
-                        links.new(multiply_node.outputs[0], shaderPrincipledBSDF.inputs['Roughness'])
-
-        if map == "Specular":
-            print("Adding Specular Map")
-            texture_node = create_image_texture_node(tree_nodes, texture, file_extension)
-            if texture_node:
-                texture_node.location = 0, 300
-                texture_node.image.colorspace_settings.name = "Non-Color"
-                links.new(texture_node.outputs[0], shaderPrincipledBSDF.inputs['Specular Tint'])
-                # If the material uses gloss in alpha channel, connect it to Roughness inverted
-                if "StringGenMask" in material_xml.keys() and "%SPECULARPOW_GLOSSALPHA%" in material_xml.attrib["StringGenMask"]:
-                    invert_node = tree_nodes.nodes.new('ShaderNodeInvert')
-                    invert_node.location = 150, 200
-                    links.new(texture_node.outputs[1], invert_node.inputs[1])
-                    links.new(invert_node.outputs[0], shaderPrincipledBSDF.inputs['Roughness'])
-        if map == "Bumpmap" or map == "TexSlot2":
-            print("Adding Bump Map")
-            texture_node = create_image_texture_node(tree_nodes, texture, file_extension)
-            if texture_node:
-                texture_node.location = -500, 0  # Move further left to make room for nodes
-                texture_node.image.colorspace_settings.name = "Non-Color"
-                
-                # Add a normal map node
-                normal_map_node = tree_nodes.nodes.new('ShaderNodeNormalMap')
-                normal_map_node.location = 50, 0
-                process_normal_map_nodes(tree_nodes, texture_node, normal_map_node, links)
-                links.new(normal_map_node.outputs[0], shaderPrincipledBSDF.inputs['Normal'])
-    pass
+    create_surface_shader_material(material_xml, material, file_extension, "Illum", *ILLUM_TEXTURES)
 
 def create_mech_shader_material(material_xml, material, file_extension):
     print("Mech shader")
+    create_surface_shader_material(material_xml, material, file_extension, "Mech", *MECH_TEXTURES)
+
+def create_surface_shader_material(material_xml, material, file_extension, shader, texture_maps, use_gloss_maps=False):
+    # Builds a material from the shader's node group: only the image textures, the group and
+    # the output are added to the material.  texture_maps maps Texture Map names to
+    # DIFFUSE_MAP, SPECULAR_MAP or NORMAL_MAP.  Baked normal and roughness maps are linked
+    # when there are any, and the group then leaves out the nodes correcting them.
     tree_nodes = material.node_tree
     links = tree_nodes.links
     for n in tree_nodes.nodes:
         tree_nodes.nodes.remove(n)
-    # Every material will have a PrincipledBSDF and Material output.  Add, place, and link.
-    shaderPrincipledBSDF = create_principle_bsdf_root_node(material_xml, tree_nodes)
+    (textures, gloss_from_diffuse_alpha, gloss_from_specular_alpha,
+     baked_normal, baked_roughness) = get_surface_bakes(material_xml, file_extension, texture_maps, use_gloss_maps)
+    group = get_surface_shader_group(shader, gloss_from_diffuse_alpha, gloss_from_specular_alpha, NORMAL_MAP in textures,
+                                     fix_normal_map=baked_normal is None)
+    group_node = create_shader_group_node(tree_nodes, group)
+    for name, value in get_surface_parameters(material_xml).items():
+        group_node.inputs[name].default_value = value
     output_node = create_output_node(tree_nodes)
-    links.new(shaderPrincipledBSDF.outputs[0], output_node.inputs[0])
-    for texture in material_xml.iter("Texture"):
-        map = texture.attrib["Map"]
-        if map == "Diffuse" or map == "TexSlot1":
-            print("Adding Diffuse Map")
-            texture_node = create_image_texture_node(tree_nodes, texture, file_extension)
-            if texture_node:
-                texture_node.location = 0, 600
-                links.new(texture_node.outputs[0], shaderPrincipledBSDF.inputs['Base Color'])
-        if map == "Specular" or map == "TexSlot4":
-            print("Adding Specular Map")
-            texture_node = create_image_texture_node(tree_nodes, texture, file_extension)
-            if texture_node:
-                texture_node.location = 0, 300
-                texture_node.image.colorspace_settings.name = "Non-Color"
-                links.new(texture_node.outputs[0], shaderPrincipledBSDF.inputs['Specular Tint'])
-        if map == "Bumpmap" or map == "TexSlot2":
-            print("Adding Bump Map")
-            texture_node = create_image_texture_node(tree_nodes, texture, file_extension)
-            if texture_node:
-                texture_node.location = -500, 0  # Move further left to make room for nodes
-                texture_node.image.colorspace_settings.name = "Non-Color"
-                
-                # Add a normal map node
-                normal_map_node = tree_nodes.nodes.new('ShaderNodeNormalMap')
-                normal_map_node.location = 50, 0
-                process_normal_map_nodes(tree_nodes, texture_node, normal_map_node, links)
-                links.new(normal_map_node.outputs[0], shaderPrincipledBSDF.inputs['Normal'])
-    pass
+    links.new(group_node.outputs[0], output_node.inputs[0])
+    if DIFFUSE_MAP in textures:
+        print("Adding Diffuse Map")
+        texture_node = create_image_texture_node(tree_nodes, textures[DIFFUSE_MAP], file_extension)
+        texture_node.location = 0, 600
+        links.new(texture_node.outputs[0], group_node.inputs["Base Color"])
+        links.new(texture_node.outputs[1], group_node.inputs["Diffuse Alpha"])
+    if SPECULAR_MAP in textures:
+        print("Adding Specular Map")
+        texture_node = create_image_texture_node(tree_nodes, textures[SPECULAR_MAP], file_extension)
+        texture_node.location = 0, 300
+        texture_node.image.colorspace_settings.name = "Non-Color"
+        links.new(texture_node.outputs[0], group_node.inputs["Specular Tint"])
+        links.new(texture_node.outputs[1], group_node.inputs["Specular Alpha"])
+    if NORMAL_MAP in textures:
+        print("Adding Bump Map")
+        if baked_normal is not None:
+            texture_node = create_baked_texture_node(tree_nodes, baked_normal)
+        else:
+            texture_node = create_image_texture_node(tree_nodes, textures[NORMAL_MAP], file_extension)
+        texture_node.location = 0, 0
+        texture_node.image.colorspace_settings.name = "Non-Color"
+        links.new(texture_node.outputs[0], group_node.inputs["Normal Map"])
+    if baked_roughness is not None:
+        texture_node = create_baked_texture_node(tree_nodes, baked_roughness)
+        texture_node.location = 0, -300
+        texture_node.image.colorspace_settings.name = "Non-Color"
+        links.new(texture_node.outputs[0], group_node.inputs["Roughness"])
+    return group_node
+
+def get_surface_bakes(material_xml, file_extension, texture_maps, use_gloss_maps=False):
+    # The surface textures of a material as get_surface_textures returns them, followed by its
+    # baked normal and roughness maps (None when there aren't any).  Roughness no longer comes
+    # from an alpha channel once it is baked.
+    textures, gloss_from_diffuse_alpha, gloss_from_specular_alpha = get_surface_textures(material_xml, texture_maps, use_gloss_maps)
+    baked_normal = get_baked_texture(textures.get(NORMAL_MAP), file_extension, BAKE_NORMAL)
+    baked_roughness = None
+    if gloss_from_specular_alpha:
+        baked_roughness = get_baked_texture(textures[SPECULAR_MAP], file_extension, BAKE_ROUGHNESS)
+    elif gloss_from_diffuse_alpha:
+        baked_roughness = get_baked_texture(textures[DIFFUSE_MAP], file_extension, BAKE_ROUGHNESS, get_gloss_scale(material_xml))
+    if baked_roughness is not None:
+        gloss_from_diffuse_alpha = gloss_from_specular_alpha = False
+    return textures, gloss_from_diffuse_alpha, gloss_from_specular_alpha, baked_normal, baked_roughness
 
 def create_image_texture_node(tree_nodes, texture, file_extension):
     texturefile = utilities.get_filename(texture.attrib["File"], file_extension)
-    texture_image = bpy.data.images.load(texturefile, check_existing=True) if os.path.isfile(texturefile) else bpy.data.images.load(default_texture_file)
+    texture_image = load_image(texturefile) if utilities.file_exists(texturefile) else bpy.data.images.load(default_texture_file)
     texture_node = tree_nodes.nodes.new('ShaderNodeTexImage')
     texture_node.image = texture_image
     return texture_node
 
+def load_image(texturefile):
+    # Reuses the image already loaded from texturefile, or pointed at a downscaled copy of it.
+    # The images are indexed by file the first time an import loads one.
+    global loaded_images
+    if loaded_images is None:
+        files = [image for image in bpy.data.images if image.source == 'FILE']
+        loaded_images = {get_image_key(bpy.path.abspath(image.filepath)): image for image in files}
+        loaded_images.update((get_image_key(image[FULL_RESOLUTION_PROPERTY]), image)
+                             for image in files if FULL_RESOLUTION_PROPERTY in image)
+    key = get_image_key(texturefile)
+    image = loaded_images.get(key)
+    if image is None:
+        image = loaded_images[key] = bpy.data.images.load(texturefile, check_existing=True)
+    return image
+
+def get_image_key(texturefile):
+    return os.path.normcase(os.path.normpath(texturefile))
+
+def reset_loaded_images():
+    # Images can be removed or repointed between imports, so each import indexes them again.
+    global loaded_images
+    loaded_images = None
+
+def create_baked_texture_node(tree_nodes, baked_file):
+    texture_node = tree_nodes.nodes.new('ShaderNodeTexImage')
+    texture_node.image = bpy.data.images.load(baked_file, check_existing=True)
+    return texture_node
+
+def get_texture_files(matfiles, use_dds=True, use_tif=False):
+    # The texture files each material file uses, by material file name.
+    file_extension = ".dds" if use_dds else ".tif"
+    texture_files = {os.path.basename(matfile): set() for matfile in matfiles}
+    for matfile, material_xml in iter_material_files(matfiles):
+        for texture in material_xml.iter("Texture"):
+            texturefile = get_texture_file(texture.attrib.get("File"), file_extension)
+            if texturefile is not None:
+                texture_files[os.path.basename(matfile)].add(texturefile)
+    return texture_files
+
+def get_texture_file(texture, file_extension):
+    # The file on disk for a Texture's File attribute, or None when it's missing or not a file.
+    if not texture or texture.startswith("$"):
+        return None
+    texturefile = utilities.get_filename(texture, file_extension)
+    return texturefile if utilities.file_exists(texturefile) else None
+
+def iter_material_files(matfiles):
+    cry_xml = CryXmlSerializer(lazy=True, cache=parse_cache, file_system=constants.file_system, string_pool=string_pool)
+    for matfile in matfiles:
+        mats = cry_xml.read_file(utilities.resolve_file(matfile, extract=False))
+        for material_xml in mats.iter("Material"):
+            yield matfile, material_xml
+
+def get_baked_texture(texture, file_extension, operation, scale=1.0):
+    # The baked version of a texture from TextureBaker, or None when there isn't one.
+    if texture is None or not texture_baker.enabled:
+        return None
+    texturefile = utilities.get_filename(texture.attrib["File"], file_extension)
+    if not utilities.file_exists(texturefile):
+        return None
+    return texture_baker.lookup(texturefile, operation, scale)
+
+def bake_textures(matfiles, use_dds=True, use_tif=False):
+    # Bakes the normal and roughness maps of the materials in matfiles on worker processes.
+    file_extension = ".dds" if use_dds else ".tif"
+    jobs = []
+    for matfile, material_xml in iter_material_files(matfiles):
+        jobs.extend(get_bake_jobs(material_xml, lambda texture: get_texture_file(texture, file_extension)))
+    run_texture_baker(jobs)
+
+def get_downscaled_textures(texturefiles, downscale):
+    """ Returns {texture file: downscaled copy} for the DDS and TIF files in texturefiles,
+        making the copies that aren't in the texture cache yet.
+    """
+    texturefiles = [texturefile for texturefile in texturefiles if texturefile.lower().endswith(TEXTURE_EXTENSIONS)]
+    run_texture_baker([(texturefile, BAKE_DOWNSCALE, downscale) for texturefile in texturefiles])
+    downscaled = {}
+    for texturefile in texturefiles:
+        copy = texture_baker.lookup(texturefile, BAKE_DOWNSCALE, downscale)
+        if copy is not None:
+            downscaled[texturefile] = copy
+    return downscaled
+
+def use_downscaled_images(images, downscale):
+    """ Points images at downscaled copies of their files.  The original file is kept in a
+        custom property, so use_full_resolution_images can switch back.
+    """
+    files = {image: bpy.path.abspath(image.filepath) for image in images
+             if image.source == 'FILE' and FULL_RESOLUTION_PROPERTY not in image}
+    downscaled = get_downscaled_textures(set(files.values()), downscale)
+    for image, texturefile in files.items():
+        if texturefile in downscaled:
+            image[FULL_RESOLUTION_PROPERTY] = texturefile
+            image.filepath = downscaled[texturefile]
+    reset_loaded_images()
+    print("Using 1/" + str(downscale) + " size copies of " + str(len(downscaled)) + " textures")
+
+def use_full_resolution_images():
+    # Points every image using a downscaled copy back at its texture file.  Returns how many changed.
+    images = [image for image in bpy.data.images if FULL_RESOLUTION_PROPERTY in image]
+    for image in images:
+        image.filepath = image[FULL_RESOLUTION_PROPERTY]
+        del image[FULL_RESOLUTION_PROPERTY]
+    reset_loaded_images()
+    return len(images)
+
+def run_texture_baker(jobs):
+    """ Runs cryengine_tools.TextureBaker with Blender's Python, as its worker processes can't import bpy.
+        Returns its summary, or None if it didn't finish.  Failures are added to
+        constants.import_warnings, and their textures are used without the bakes.
+    """
+    if not jobs:
+        return None
+    with tempfile.TemporaryDirectory() as temp_dir:
+        jobs_file = os.path.join(temp_dir, "bake_jobs.json")
+        summary_file = os.path.join(temp_dir, "bake_summary.json")
+        with open(jobs_file, "w", encoding="utf-8") as f:
+            json.dump(jobs, f)
+        command = [sys.executable, "-m", "cryengine_tools.TextureBaker", "--jobs", jobs_file, "--summary", summary_file,
+                   "--cache-dir", texture_baker.cache_dir]
+        # Run from the lib directory, where cryengine_tools is a top level package.
+        lib_dir = os.path.dirname(os.path.dirname(os.path.abspath(TextureBaker.__file__)))
+        try:
+            completed = subprocess.run(command, cwd=lib_dir, stdout=subprocess.PIPE, stderr=subprocess.PIPE, encoding="utf-8",
+                                       errors="replace", timeout=BAKE_TIMEOUT, check=True)
+        except subprocess.CalledProcessError as e:
+            completed = e   # Exits with 1 when any bake failed.
+        except subprocess.TimeoutExpired:
+            constants.import_warnings.append("Texture baking stopped after " + str(BAKE_TIMEOUT) + "s.")
+            return None
+        except OSError as e:
+            constants.import_warnings.append("Unable to run the texture baker: " + str(e))
+            return None
+        print(completed.stdout, end="")
+        print(completed.stderr, end="")
+        try:
+            with open(summary_file, encoding="utf-8") as f:
+                summary = json.load(f)
+        except (OSError, ValueError):
+            error = completed.stderr.strip().splitlines()
+            constants.import_warnings.append("Texture baker exited with code " + str(completed.returncode) +
+                                             (": " + error[-1] if error else ""))
+            return None
+    if summary["failed"]:
+        constants.import_warnings.append(str(summary["failed"]) + " of " + str(len(set(jobs))) +
+                                         " textures failed to bake, see the system console.")
+    return summary
+
 def create_output_node(tree_nodes):
     shout = tree_nodes.nodes.new('ShaderNodeOutputMaterial')
     shout.location = 600, 600
@@ -366,7 +434,7 @@ def create_glass_material(mat, tree_nodes, shaderPrincipledBSDF, material_extens
     for texture in mat.iter('Texture'):
         if texture.attrib['Map'] == 'Diffuse':
             texturefile = utilities.get_filename(texture.attrib["File"], material_extension)
-            if os.path.isfile(texturefile):
+            if utilities.file_exists(texturefile):
                 matDiffuse = bpy.data.images.load(filepath=texturefile, check_existing=True)
                 shaderDiffImg = tree_nodes.nodes.new('ShaderNodeTexImage')
                 shaderDiffImg.image=matDiffuse
@@ -375,7 +443,7 @@ def create_glass_material(mat, tree_nodes, shaderPrincipledBSDF, material_extens
                 links.new(shaderDiffImg.outputs[1], shaderPrincipledBSDF.inputs['Coat Weight'])
         if texture.attrib['Map'] == 'Specular':
             texturefile = utilities.get_filename(texture.attrib["File"], material_extension)
-            if os.path.isfile(texturefile):
+            if utilities.file_exists(texturefile):
                 matSpec=bpy.data.images.load(filepath=texturefile, check_existing=True)
                 matSpec.colorspace_settings.name = 'Non-Color'
                 shaderSpecImg=tree_nodes.nodes.new('ShaderNodeTexImage')
@@ -384,8 +452,8 @@ def create_glass_material(mat, tree_nodes, shaderPrincipledBSDF, material_extens
                 shaderSpecImg.location = 0,325
                 links.new(shaderSpecImg.outputs[0], shaderPrincipledBSDF.inputs['Specular Tint'])
         if texture.attrib['Map'] == 'Bumpmap':
-            if os.path.isfile(texturefile):
-                texturefile = utilities.get_filename(texture.attrib["File"], material_extension)
+            texturefile = utilities.get_filename(texture.attrib["File"], material_extension)
+            if utilities.file_exists(texturefile):
                 matNormal=bpy.data.images.load(filepath=texturefile, check_existing=True)
                 matNormal.colorspace_settings.name = 'Non-Color'
                 shaderNormalImg=tree_nodes.nodes.new('ShaderNodeTexImage')
@@ -397,73 +465,165 @@ def create_glass_material(mat, tree_nodes, shaderPrincipledBSDF, material_extens
                 links.new(shaderNormalImg.outputs[0], converterNormalMap.inputs[1])
                 links.new(converterNormalMap.outputs[0], shaderPrincipledBSDF.inputs['Coat Normal'])
 
-def create_principle_bsdf_root_node(material_xml, tree_nodes):
-    shaderPrincipledBSDF = tree_nodes.nodes.new('ShaderNodeBsdfPrincipled')
-    shaderPrincipledBSDF.inputs['Metallic'].default_value = 1.0
-    shaderPrincipledBSDF.location = 300, 600
+def get_surface_parameters(material_xml):
+    # Values for the surface group's inputs from the material's attributes.
+    parameters = {}
     
     # Map CryEngine Diffuse to Blender Base Color
     if "Diffuse" in material_xml.keys():
-        diffuseColor = utilities.convert_to_rgba(str(material_xml.attrib["Diffuse"]))
-        shaderPrincipledBSDF.inputs['Base Color'].default_value = (diffuseColor[0], diffuseColor[1], diffuseColor[2], diffuseColor[3])
+        parameters["Base Color"] = utilities.convert_to_rgba(str(material_xml.attrib["Diffuse"]))
     
     # Map CryEngine Specular to Blender Specular IOR Level
     if "Specular" in material_xml.keys():
         specColor = utilities.convert_to_rgba(str(material_xml.attrib["Specular"]))
-        specValue = (specColor[0] + specColor[1] + specColor[2]) / 3.0
-        # Set Specular IOR Level (still a float)
-        shaderPrincipledBSDF.inputs['Specular IOR Level'].default_value = specValue
-        
+        parameters["Specular IOR Level"] = (specColor[0] + specColor[1] + specColor[2]) / 3.0
         # In Blender 4.4, Specular Tint is now a color (RGB) not a float
         # Set it to the original specular color to maintain tint
-        shaderPrincipledBSDF.inputs['Specular Tint'].default_value = (specColor[0], specColor[1], specColor[2], 1.0)
+        parameters["Specular Tint"] = (specColor[0], specColor[1], specColor[2], 1.0)
     
     # Map CryEngine IndirectColor to Blender Emission
     if "IndirectColor" in material_xml.keys():
         indirectColor = utilities.convert_to_rgba(str(material_xml.attrib["IndirectColor"]))
         averageIndirect = (indirectColor[0] + indirectColor[1] + indirectColor[2]) / 3.0
-        # Use correct emission inputs
-        shaderPrincipledBSDF.inputs['Emission'].default_value = (indirectColor[0], indirectColor[1], indirectColor[2], indirectColor[3])
-        shaderPrincipledBSDF.inputs['Emission Strength'].default_value = averageIndirect * 0.5  # Reduce emission strength
+        parameters["Emission"] = indirectColor
+        parameters["Emission Strength"] = averageIndirect * 0.5  # Reduce emission strength
     
     # Map CryEngine Opacity to Blender Alpha and Transmission Weight
     if "Opacity" in material_xml.keys():
-        transmission = float(material_xml.attrib["Opacity"])  # Fix variable name to match usage
+        opacity = float(material_xml.attrib["Opacity"])
         # For typical opacity/transparency handling (0=transparent, 1=opaque)
-        shaderPrincipledBSDF.inputs['Alpha'].default_value = transmission
-        
+        parameters["Alpha"] = opacity
         # For glass-like transmission (1=fully transmissive)
-        # In Blender 4.4, "Transmission" is renamed to "Transmission Weight"
-        shaderPrincipledBSDF.inputs['Transmission Weight'].default_value = 1.0 - transmission
+        parameters["Transmission Weight"] = 1.0 - opacity
     
-    # Improved roughness handling from Shininess
     # CryEngine uses 0-255 for shininess, where 255 is very glossy (0 roughness in PBR)
     if "Shininess" in material_xml.keys():
         shininess = float(material_xml.attrib["Shininess"])
-        # Convert shininess to roughness (inverse relationship)
-        # For CryEngine, higher values (255) mean less roughness
-        # Map 0-255 to 1-0 (inverted) with a curve adjustment for better results
-        normalized_shininess = shininess / 255.0
-        # Apply a curve for better visual results - this gives a more balanced conversion
-        roughness = 1.0 - (normalized_shininess ** 0.5)  # Square root for a better curve
-        shaderPrincipledBSDF.inputs['Roughness'].default_value = roughness
-    else:
-        # Default to a medium roughness if not specified
-        shaderPrincipledBSDF.inputs['Roughness'].default_value = 0.5
+        # Map 0-255 to 1-0 (inverted), with a square root curve for better visual results
+        parameters["Roughness"] = 1.0 - ((shininess / 255.0) ** 0.5)
+        # Gloss maps are scaled by the shininess.
+        parameters["Gloss Scale"] = get_gloss_scale(material_xml)
     
     # Check for shader flags in GenMask to make further adjustments
     if "StringGenMask" in material_xml.keys():
         genMask = material_xml.attrib["StringGenMask"]
-        
         # Lower the metallic value for more realistic metals if not specifically set to be very metallic
         if "%METAL%" not in genMask:
-            shaderPrincipledBSDF.inputs['Metallic'].default_value = 0.7  # Less extreme metallic value
-        
+            parameters["Metallic"] = 0.7  # Less extreme metallic value
         # Reduce specular for non-metal materials
         if "%GLOSS_MAP%" in genMask and "%METAL%" not in genMask:
-            shaderPrincipledBSDF.inputs['Specular IOR Level'].default_value = 0.3
+            parameters["Specular IOR Level"] = 0.3
     
-    return shaderPrincipledBSDF
+    return parameters
+
+def create_shader_group_node(tree_nodes, group):
+    group_node = tree_nodes.nodes.new('ShaderNodeGroup')
+    group_node.node_tree = group
+    group_node.location = 300, 600
+    return group_node
+
+def new_group_socket(group, name, in_out, socket_type, default_value=None):
+    socket = group.interface.new_socket(name, in_out=in_out, socket_type=socket_type)
+    if default_value is not None:
+        socket.default_value = default_value
+    return socket
+
+def get_nodraw_shader_group():
+    group = bpy.data.node_groups.get(SHADER_GROUP_PREFIX + "Nodraw")
+    if group is not None:
+        return group
+    group = bpy.data.node_groups.new(SHADER_GROUP_PREFIX + "Nodraw", 'ShaderNodeTree')
+    new_group_socket(group, "BSDF", 'OUTPUT', 'NodeSocketShader')
+    shaderPrincipledBSDF = group.nodes.new('ShaderNodeBsdfPrincipled')
+    # Set to fully transparent
+    shaderPrincipledBSDF.inputs['Base Color'].default_value = (1.0, 1.0, 1.0, 1.0)
+    shaderPrincipledBSDF.inputs['Alpha'].default_value = 0.0  # Fully transparent
+    shaderPrincipledBSDF.inputs['Transmission Weight'].default_value = 1.0  # Fully transmissive
+    group_output = group.nodes.new('NodeGroupOutput')
+    group_output.location = 300, 0
+    group.links.new(shaderPrincipledBSDF.outputs[0], group_output.inputs[0])
+    return group
+
+def get_surface_shader_group(shader, gloss_from_diffuse_alpha=False, gloss_from_specular_alpha=False, use_normal_map=False,
+                             fix_normal_map=True):
+    """ Returns the node group for a shader and the features its material uses, building it
+        the first time.  The group holds the Principled BSDF, the gloss to roughness chain
+        and the normal map fix; materials only plug their textures and values into it.
+        fix_normal_map is False for baked normal maps, which already have their blue channel.
+    """
+    features = []
+    if gloss_from_specular_alpha:
+        features.append("Specular Gloss")
+    elif gloss_from_diffuse_alpha:
+        features.append("Diffuse Gloss")
+    if use_normal_map:
+        features.append("Normal Map" if fix_normal_map else "Baked Normal Map")
+    name = SHADER_GROUP_PREFIX + shader + (" (" + ", ".join(features) + ")" if features else "")
+    group = bpy.data.node_groups.get(name)
+    if group is not None:
+        return group
+    group = bpy.data.node_groups.new(name, 'ShaderNodeTree')
+    for socket_name, socket_type, default_value in SURFACE_GROUP_INPUTS:
+        new_group_socket(group, socket_name, 'INPUT', socket_type, default_value)
+    new_group_socket(group, "BSDF", 'OUTPUT', 'NodeSocketShader')
+    nodes = group.nodes
+    links = group.links
+    group_input = nodes.new('NodeGroupInput')
+    group_input.location = -900, 0
+    shaderPrincipledBSDF = nodes.new('ShaderNodeBsdfPrincipled')
+    shaderPrincipledBSDF.location = 300, 300
+    group_output = nodes.new('NodeGroupOutput')
+    group_output.location = 600, 300
+    links.new(shaderPrincipledBSDF.outputs[0], group_output.inputs[0])
+    for socket_name, bsdf_input in (("Base Color", "Base Color"), ("Specular Tint", "Specular Tint"), ("Metallic", "Metallic"),
+                                    ("Specular IOR Level", "Specular IOR Level"), ("Emission", "Emission Color"),
+                                    ("Emission Strength", "Emission Strength"), ("Alpha", "Alpha"),
+                                    ("Transmission Weight", "Transmission Weight")):
+        links.new(group_input.outputs[socket_name], shaderPrincipledBSDF.inputs[bsdf_input])
+    # Roughness: the material's value, or inverted gloss from a texture alpha.
+    if gloss_from_specular_alpha:
+        invert_node = nodes.new('ShaderNodeInvert')
+        invert_node.location = 0, 200
+        links.new(group_input.outputs["Specular Alpha"], invert_node.inputs[1])
+        links.new(invert_node.outputs[0], shaderPrincipledBSDF.inputs['Roughness'])
+    elif gloss_from_diffuse_alpha:
+        invert_node = nodes.new('ShaderNodeInvert')
+        invert_node.location = -150, 400
+        links.new(group_input.outputs["Diffuse Alpha"], invert_node.inputs[1])
+        multiply_node = nodes.new('ShaderNodeMath')
+        multiply_node.operation = 'MULTIPLY'
+        multiply_node.location = 0, 400
+        links.new(invert_node.outputs[0], multiply_node.inputs[0])
+        links.new(group_input.outputs["Gloss Scale"], multiply_node.inputs[1])
+        links.new(multiply_node.outputs[0], shaderPrincipledBSDF.inputs['Roughness'])
+    else:
+        links.new(group_input.outputs["Roughness"], shaderPrincipledBSDF.inputs['Roughness'])
+    if use_normal_map:
+        normal_map_node = nodes.new('ShaderNodeNormalMap')
+        normal_map_node.location = 50, -200
+        if fix_normal_map:
+            # The normal map fix takes its input from a reroute standing in for the texture node.
+            normal_input = nodes.new('NodeReroute')
+            normal_input.location = -700, -200
+            links.new(group_input.outputs["Normal Map"], normal_input.inputs[0])
+            process_normal_map_nodes(group, normal_input, normal_map_node, links)
+        else:
+            links.new(group_input.outputs["Normal Map"], normal_map_node.inputs[1])
+        links.new(normal_map_node.outputs[0], shaderPrincipledBSDF.inputs['Normal'])
+    return group
+
+def get_fingerprinted_materials():
+    # The materials built by create_materials in this file, by fingerprint.
+    return {material[FINGERPRINT_PROPERTY]: material for material in bpy.data.materials if FINGERPRINT_PROPERTY in material}
+
+def reset_material_summary():
+    material_summary["created"] = 0
+    material_summary["reused"].clear()
+
+def print_material_summary():
+    print("Materials: " + str(material_summary["created"]) + " created, " + str(len(material_summary["reused"])) + " reused")
+    for name, existing in sorted(material_summary["reused"].items()):
+        print("   " + name + " -> " + existing)
 
 def remove_unlinked_materials():
     for material in bpy.data.materials:
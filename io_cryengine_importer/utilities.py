@@ -1,6 +1,7 @@
 import os
 import bpy
 import mathutils
+import numpy
 from . import constants
 
 def get_scaling_factor(o):
@@ -45,14 +46,77 @@ def get_transform_matrix(rotation, location, scale = mathutils.Vector((1.0,1.0,1
     mat_out = mat_location @ mat_rotation @ mat_scale
     return mat_out
 
+def parse_vectors(values, size, default):
+    # Parses comma separated vectors ("x,y,z") into an (n, size) array in one pass.  If any value
+    # is malformed or has the wrong number of components, they are parsed one at a time and the
+    # bad ones are replaced with default.
+    try:
+        vectors = numpy.array([value.split(",") for value in values], dtype=numpy.float64)
+        if vectors.shape == (len(values), size):
+            return vectors
+    except ValueError:
+        pass
+    vectors = numpy.empty((len(values), size))
+    for i, value in enumerate(values):
+        try:
+            vector = [float(component) for component in value.split(",")]
+        except ValueError:
+            vector = None
+        if vector is None or len(vector) != size:
+            print("Invalid vector '" + value + "', using " + str(default))
+            vector = default
+        vectors[i] = vector
+    return vectors
+
+def compose_transform_matrices(locations, rotations, scales):
+    # Returns (n, 4, 4) matrices from (n, 3) locations, (n, 4) w,x,y,z quaternions and (n, 3) scales.
+    lengths = numpy.linalg.norm(rotations, axis=1)
+    rotations = numpy.where(lengths[:, None] > 0, rotations / numpy.maximum(lengths, 1e-12)[:, None], (1.0, 0.0, 0.0, 0.0))
+    w, x, y, z = rotations.T
+    matrices = numpy.zeros((len(locations), 4, 4))
+    matrices[:, 0, 0] = 1 - 2 * (y * y + z * z)
+    matrices[:, 0, 1] = 2 * (x * y - w * z)
+    matrices[:, 0, 2] = 2 * (x * z + w * y)
+    matrices[:, 1, 0] = 2 * (x * y + w * z)
+    matrices[:, 1, 1] = 1 - 2 * (x * x + z * z)
+    matrices[:, 1, 2] = 2 * (y * z - w * x)
+    matrices[:, 2, 0] = 2 * (x * z - w * y)
+    matrices[:, 2, 1] = 2 * (y * z + w * x)
+    matrices[:, 2, 2] = 1 - 2 * (x * x + y * y)
+    matrices[:, :3, :3] *= scales[:, None, :]
+    matrices[:, :3, 3] = locations
+    matrices[:, 3, 3] = 1.0
+    return matrices
+
 def set_mode(new_mode):
     bpy.ops.object.mode_set(mode=new_mode)
 
 def get_filename(texture, material_extension):
     # Don't do relative filenames!  It doesn't work until the .blend file is saved, and even then it doesn't work!
     texturefile = os.path.normpath(os.path.join(constants.basedir, os.path.splitext(texture)[0] + material_extension))
-    tex = texturefile.replace("/", "\\\\")
-    return tex
+    return resolve_file(texturefile)
+
+def resolve_file(path, extract=True):
+    # Returns the real path on disk for a game file.  Looked up case insensitively in the asset index,
+    # then extracted from the pak files (if extract is set) when it only exists there.  Unknown files
+    # are returned unchanged.
+    if constants.asset_index is not None and constants.asset_index.covers(path):
+        real_path = constants.asset_index.lookup(path)
+        if real_path is not None:
+            return real_path
+    elif os.path.isfile(path):
+        return path
+    if extract and constants.file_system is not None:
+        extracted = constants.file_system.extract(path)
+        if extracted is not None:
+            return extracted
+    return path
+
+def file_exists(path):
+    # Answers from the asset index when it covers path.  Only files missing from the index are stat'ed.
+    if constants.asset_index is not None and constants.asset_index.covers(path):
+        return constants.asset_index.lookup(path) is not None
+    return os.path.isfile(path)
 
 #=======================================================================
 # Error handling
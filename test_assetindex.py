@@ -0,0 +1,69 @@
+import os
+
+from cryengine_tools.AssetIndex import AssetIndex
+from cryengine_tools.CryXmlB.CryXmlCache import CryXmlCache
+
+def create_game_dir(tmp_path):
+    game = tmp_path / "Game"
+    textures = game / "Objects" / "Mechs" / "Atlas" / "Body" / "Textures"
+    textures.mkdir(parents=True)
+    (textures / "Atlas_Diff.dds").write_bytes(b"DDS ")
+    (game / "Objects" / "Mechs" / "Atlas" / "atlas.cdf").write_bytes(b"<CharacterDefinition/>")
+    return game
+
+def test_case_insensitive_lookups(tmp_path):
+    game = create_game_dir(tmp_path)
+    index = AssetIndex(str(game))
+    diffuse = str(game / "Objects" / "Mechs" / "Atlas" / "Body" / "Textures" / "Atlas_Diff.dds")
+    assert index.lookup("objects/mechs/atlas/body/textures/atlas_diff.dds") == diffuse
+    assert index.lookup("Objects\\Mechs\\Atlas\\Body\\Textures\\ATLAS_DIFF.dds") == diffuse
+    assert index.lookup(os.path.join(str(game), "OBJECTS", "mechs", "atlas", "body", "..", "atlas.cdf")) == \
+        str(game / "Objects" / "Mechs" / "Atlas" / "atlas.cdf")
+    assert index.lookup("objects/mechs/atlas/body/textures/atlas_ddna.dds") is None
+    assert index.lookup(diffuse) == diffuse
+
+def test_paths_outside_root_are_not_covered(tmp_path):
+    game = create_game_dir(tmp_path)
+    index = AssetIndex(str(game))
+    outside = str(tmp_path / "elsewhere" / "atlas_diff.dds")
+    assert not index.covers(outside)
+    assert index.lookup(outside) is None
+    assert index.covers("objects/missing.dds")
+
+def test_cached_index_skips_the_walk(tmp_path, monkeypatch):
+    game = create_game_dir(tmp_path)
+    cache = CryXmlCache(str(tmp_path / "cache"))
+    files = AssetIndex(str(game), cache).files
+    monkeypatch.setattr(AssetIndex, "scan", None)      # Any walk would fail.
+    assert AssetIndex(str(game), cache).files == files
+    assert cache.hits == 1
+
+def test_index_is_built_once_per_directory(tmp_path):
+    game = create_game_dir(tmp_path)
+    index = AssetIndex.for_directory(str(game))
+    assert AssetIndex.for_directory(str(game) + os.sep) is index
+    assert AssetIndex.for_directory(str(tmp_path)) is not index
+
+def test_files_added_later_are_found(tmp_path, monkeypatch):
+    game = create_game_dir(tmp_path)
+    index = AssetIndex(str(game))
+    textures = game / "Objects" / "Mechs" / "Atlas" / "Body" / "Textures"
+    (textures / "Atlas_Spec.dds").write_bytes(b"DDS ")
+    (textures / "Atlas_Ddna.dds").write_bytes(b"DDS ")
+    scan = AssetIndex.scan
+    monkeypatch.setattr(AssetIndex, "scan", None)      # The lookup mustn't walk the tree.
+    assert index.lookup("Objects/Mechs/Atlas/Body/Textures/Atlas_Spec.dds") == str(textures / "Atlas_Spec.dds")
+    assert "objects/mechs/atlas/body/textures/atlas_spec.dds" in index.files
+    monkeypatch.setattr(AssetIndex, "scan", scan)
+    assert index.revalidate()
+    assert "objects/mechs/atlas/body/textures/atlas_ddna.dds" in index.files
+
+def test_changed_directories_are_rescanned(tmp_path):
+    game = create_game_dir(tmp_path)
+    index = AssetIndex.for_directory(str(game))
+    assert not index.revalidate()
+    textures = game / "Objects" / "Mechs" / "Atlas" / "Body" / "Textures"
+    (textures / "Atlas_Spec.dds").write_bytes(b"DDS ")
+    os.utime(textures, ns=(0, 0))       # Don't rely on the file system's timestamp resolution.
+    assert AssetIndex.for_directory(str(game)) is index
+    assert "objects/mechs/atlas/body/textures/atlas_spec.dds" in index.files
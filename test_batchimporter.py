@@ -0,0 +1,83 @@
+import json
+import sys
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from cryengine_tools.BatchImporter import BatchImporter, BatchJob, MECH, PREFAB, find_jobs
+from cryengine_tools.CryXmlB.CryXmlWriter import write_cryxmlb
+
+# Stands in for Blender: crashes on the first run of crash.cdf, reports a Python error
+# for broken.cdf, and imports everything else.
+FAKE_WORKER = """
+import json, os, sys
+job_file, result_file = sys.argv[1:3]
+with open(job_file) as f:
+    job = json.load(f)
+marker = job_file + ".started"
+if os.path.basename(job["path"]) == "crash.cdf" and not os.path.exists(marker):
+    open(marker, "w").close()
+    print("Segmentation fault")
+    os._exit(139)
+if os.path.basename(job["path"]) == "broken.cdf":
+    result = {"status": "failed", "error": "Traceback\\nKeyError: 'Armature'"}
+else:
+    result = {"status": "ok", "output": job["output"], "import_seconds": 1.0, "save_seconds": 0.5}
+with open(result_file, "w") as f:
+    json.dump(result, f)
+"""
+
+class FakeBlenderImporter(BatchImporter):
+    def command(self, job_file, result_file):
+        return [sys.executable, self.worker_script, job_file, result_file]
+
+def create_game_dir(tmp_path):
+    mechs = tmp_path / "Objects" / "Mechs"
+    (mechs / "atlas").mkdir(parents=True)
+    (mechs / "atlas" / "atlas.cdf").write_bytes(write_cryxmlb(ET.Element("CharacterDefinition")))
+    (mechs / "atlas" / "atlas_body.xml").write_bytes(write_cryxmlb(ET.Element("Materials")))
+    prefabs = tmp_path / "Prefabs"
+    prefabs.mkdir()
+    (prefabs / "props.xml").write_bytes(write_cryxmlb(ET.Element("PrefabsLibrary", Name="Props")))
+    return tmp_path
+
+def test_find_jobs_in_directories_and_manifests(tmp_path):
+    game = create_game_dir(tmp_path)
+    jobs = find_jobs([str(game)], str(tmp_path / "out"), {"use_tif": True})
+    assert [(job.type, job.output) for job in jobs] == [
+        (MECH, str(tmp_path / "out" / "atlas.blend")), (PREFAB, str(tmp_path / "out" / "props.blend"))]
+    assert jobs[0].options == {"use_tif": True}
+
+    manifest = tmp_path / "roster.json"
+    manifest.write_text(json.dumps({"options": {"use_pak_files": True},
+                                    "jobs": ["Objects/Mechs/atlas/atlas.cdf",
+                                             {"path": "Prefabs/props.xml", "output": "props_v2.blend",
+                                              "options": {"use_collection_instances": True}}]}))
+    jobs = find_jobs([str(manifest)])
+    assert [(job.type, job.output) for job in jobs] == [(MECH, None), (PREFAB, str(tmp_path / "props_v2.blend"))]
+    assert jobs[1].options == {"use_pak_files": True, "use_collection_instances": True}
+
+    with pytest.raises(ValueError):
+        find_jobs([str(game / "Objects" / "Mechs" / "atlas" / "atlas_body.xml")])
+    with pytest.raises(ValueError):
+        find_jobs([str(game), str(game)], str(tmp_path / "out"))
+
+def test_crashed_workers_are_retried(tmp_path):
+    worker = tmp_path / "worker.py"
+    worker.write_text(FAKE_WORKER)
+    jobs = [BatchJob(str(tmp_path / name), MECH, str(tmp_path / (name + ".blend"))) for name in ("atlas.cdf", "crash.cdf", "broken.cdf")]
+    report = FakeBlenderImporter(workers=2, retries=1, worker_script=str(worker)).run(jobs)
+    assert (report["succeeded"], report["failed"]) == (2, 1)
+    atlas, crash, broken = report["assets"]
+    assert (atlas["status"], atlas["attempts"], atlas["import_seconds"]) == ("ok", 1, 1.0)
+    assert (crash["status"], crash["attempts"]) == ("ok", 2)
+    assert (broken["status"], broken["attempts"]) == ("failed", 1)
+    assert "KeyError" in broken["error"]
+
+def test_workers_that_keep_crashing_fail(tmp_path):
+    worker = tmp_path / "worker.py"
+    worker.write_text("import os\nos._exit(3)\n")
+    report = FakeBlenderImporter(workers=1, retries=2, worker_script=str(worker)).run([BatchJob("atlas.cdf", MECH)])
+    assert report["failed"] == 1
+    assert report["assets"][0]["attempts"] == 3
+    assert report["assets"][0]["error"] == "Blender exited with code 3"
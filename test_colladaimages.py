@@ -0,0 +1,26 @@
+import io
+import os
+
+from cryengine_tools.ColladaImages import read_image_paths, resolve_image_path
+
+COLLADA = b"""<?xml version="1.0" encoding="utf-8"?>
+<COLLADA xmlns="http://www.collada.org/2005/11/COLLADASchema" version="1.4.1">
+  <library_images>
+    <image id="crate_diff" name="crate_diff"><init_from>textures/crate%20diff.dds</init_from></image>
+    <image id="crate_ddna"><init_from>file:///C:/Game/textures/crate_ddna.dds</init_from></image>
+    <image id="crate_spec"><init_from><ref>../shared/crate_spec.dds</ref></init_from></image>
+  </library_images>
+  <library_geometries>
+    <geometry id="crate"><mesh/></geometry>
+  </library_geometries>
+  <library_images>
+    <image id="after_geometry"><init_from>ignored.dds</init_from></image>
+  </library_images>
+</COLLADA>"""
+
+def test_image_paths():
+    images = read_image_paths(io.BytesIO(COLLADA))
+    assert images == {"crate_diff": "textures/crate diff.dds", "crate_ddna": "C:/Game/textures/crate_ddna.dds",
+                      "crate_spec": "../shared/crate_spec.dds"}
+    dae_file = os.path.join("game", "objects", "crate.dae")
+    assert resolve_image_path(dae_file, images["crate_spec"]) == os.path.join("game", "shared", "crate_spec.dds")
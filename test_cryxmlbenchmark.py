@@ -0,0 +1,156 @@
+""" Parser throughput, peak memory, table decoding and parse pipeline overlap benchmarks.  Runs without Blender:
+
+    python -m pytest -q -s test_cryxmlbenchmark.py
+
+Set CRYXML_BENCHMARK_NODES (e.g. "1000,10000,100000") to change the corpus sizes.
+"""
+
+import io
+import os
+import struct
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from cryengine_tools.CryXmlB.CryXmlReader import CryXmlSerializer, NODE_FORMAT
+from cryengine_tools.CryXmlB.CryXmlWriter import generate_tree, write_corpus, write_cryxmlb
+from cryengine_tools.ParsePipeline import ParsePipeline
+from test_cryxmlreader import create_large_tree
+
+NODE_COUNTS = [int(n) for n in os.environ.get("CRYXML_BENCHMARK_NODES", "1000,10000").split(",")]
+REPEAT = 3
+PIPELINE_FILES = 8
+PIPELINE_FLOATS = 50000     # Per float array, two arrays per file
+PIPELINE_BUILD_STEPS = 200000   # Pure Python loop standing in for the bpy work on each file
+
+MODES = {
+    "read": lambda: CryXmlSerializer(),
+    "mmap": lambda: CryXmlSerializer(use_mmap=True),
+    "lazy": lambda: CryXmlSerializer(lazy=True),
+    "lazy+mmap": lambda: CryXmlSerializer(use_mmap=True, lazy=True),
+}
+
+@pytest.fixture(scope="module")
+def corpus(tmp_path_factory):
+    return write_corpus(str(tmp_path_factory.mktemp("corpus")), NODE_COUNTS)
+
+def measure(read):
+    """ Returns (best time in seconds, peak traced memory in bytes) of read(). """
+    best = None
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        read()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    try:
+        result = read()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    del result
+    return best, peak
+
+def report(name, node_count, file, seconds, peak):
+    megabytes = os.path.getsize(file) / (1024 * 1024)
+    print("\n%-10s %7d nodes %7.2f MB  %8.4fs  %8.0f nodes/s  %6.1f MB/s  peak %7.1f MB" %
+          (name, node_count, megabytes, seconds, node_count / seconds, megabytes / seconds, peak / (1024 * 1024)))
+
+@pytest.mark.parametrize("mode", list(MODES))
+def test_benchmark_binary(corpus, mode):
+    for node_count, binary_file, _ in corpus:
+        seconds, peak = measure(lambda: MODES[mode]().read_file(binary_file))
+        report(mode, node_count, binary_file, seconds, peak)
+
+def test_benchmark_text_fallback(corpus):
+    for node_count, _, text_file in corpus:
+        seconds, peak = measure(lambda: CryXmlSerializer().read_file(text_file))
+        report("text", node_count, text_file, seconds, peak)
+
+def test_benchmark_lazy_iter(corpus):
+    # The importers only walk a few tags, which is where the lazy document saves the most.
+    for node_count, binary_file, _ in corpus:
+        seconds, peak = measure(lambda: [e.attrib for e in CryXmlSerializer(lazy=True).read_file(binary_file).iter("Texture")])
+        report("lazy iter", node_count, binary_file, seconds, peak)
+
+def test_benchmark_bulk_table_decoding():
+    serializer = CryXmlSerializer()
+    data = write_cryxmlb(create_large_tree(20000))
+    node_offset, node_count = struct.unpack_from('<2i', data, 12)
+    reader = io.BytesIO(data)
+
+    start = time.perf_counter()
+    reader.seek(node_offset)
+    while reader.tell() < node_offset + node_count * NODE_FORMAT.size:
+        for read in (serializer.read_int32, serializer.read_int32, serializer.read_int16, serializer.read_int16,
+                     serializer.read_int32, serializer.read_int32, serializer.read_int32, serializer.read_int32):
+            read(reader)
+    per_field = time.perf_counter() - start
+
+    start = time.perf_counter()
+    serializer.read_table(data, node_offset, node_count, NODE_FORMAT)
+    bulk = time.perf_counter() - start
+
+    print("\n%d nodes: per-field %.4fs, bulk %.4fs (%.1fx)" % (node_count, per_field, bulk, per_field / bulk))
+
+def test_corpus_round_trip(corpus):
+    node_count, binary_file, text_file = corpus[0]
+    binary = CryXmlSerializer().read_file(binary_file)
+    assert len(list(binary.iter())) == node_count
+    assert ET.tostring(binary) == ET.tostring(ET.parse(text_file).getroot())
+
+def test_generate_tree_shape():
+    root = generate_tree(500, attribute_count=20, depth=6, string_count=10)
+    elements = list(root.iter())
+    assert len(elements) == 500
+    assert all(len(e.attrib) == 20 for e in elements[1:])
+    assert len({v for e in elements[1:] for v in e.attrib.values()}) <= 10
+    depth = lambda element: 1 + max((depth(child) for child in element), default=0)
+    assert depth(root) == 7
+
+def build_objects(decoded):
+    # Holds the GIL the whole time, like the datablock calls on the main thread.
+    total = 0
+    for i in range(PIPELINE_BUILD_STEPS):
+        total += i
+    return total
+
+def test_benchmark_parse_pipeline(tmp_path):
+    # How much decode time the worker threads hide behind the main thread's work, for
+    # parsing Collada text (expat and numpy's text parser hold the GIL) and for loading a
+    # cached array (file reads release it).
+    numpy = pytest.importorskip("numpy")
+    values = " ".join("%.5f" % value for value in numpy.linspace(0.0, 1.0, PIPELINE_FLOATS))
+    files = []
+    for i in range(PIPELINE_FILES):
+        path = tmp_path / ("part%d.dae" % i)
+        path.write_text("<COLLADA><float_array>%s</float_array><float_array>%s</float_array></COLLADA>" % (values, values))
+        numpy.save(str(path) + ".npy", numpy.linspace(0.0, 1.0, 2 * PIPELINE_FLOATS, dtype=numpy.float32))
+        files.append(str(path))
+    def parse(path):
+        root = ET.parse(path).getroot()
+        return [numpy.fromstring(array.text, dtype=numpy.float32, sep=" ") for array in root.iter("float_array")]
+    def load_cached(path):
+        return numpy.load(path + ".npy")
+    def run_pipelined(decode):
+        with ParsePipeline(decode, files) as pipeline:
+            for path in files:
+                build_objects(pipeline.get(path))
+    def best_time(run):
+        best = None
+        for _ in range(REPEAT):
+            start = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+    for name, decode in (("parse", parse), ("cached", load_cached)):
+        decode_seconds = best_time(lambda: [decode(path) for path in files])
+        build_seconds = best_time(lambda: [build_objects(None) for _ in files])
+        serial_seconds = best_time(lambda: [build_objects(decode(path)) for path in files])
+        pipelined_seconds = best_time(lambda: run_pipelined(decode))
+        print("\npipeline %-6s decode %.3fs  build %.3fs  serial %.3fs  pipelined %.3fs  saved %+.3fs on %d CPUs" %
+              (name, decode_seconds, build_seconds, serial_seconds, pipelined_seconds, serial_seconds - pipelined_seconds,
+               os.cpu_count()))
@@ -0,0 +1,73 @@
+import os
+import xml.etree.ElementTree as ET
+
+from cryengine_tools.CryXmlB.CryXmlCache import CryXmlCache
+from cryengine_tools.CryXmlB.CryXmlReader import CryXmlSerializer
+from cryengine_tools.CryXmlB.CryXmlWriter import write_cryxmlb
+from test_cryxmlreader import create_large_tree
+
+def write_binary_file(path, object_count):
+    path.write_bytes(write_cryxmlb(create_large_tree(object_count)))
+    return str(path)
+
+def test_cache_hit_skips_decoding(tmp_path):
+    file = write_binary_file(tmp_path / "prefab.xml", 10)
+    cache = CryXmlCache(str(tmp_path / "cache"))
+    expected = ET.tostring(CryXmlSerializer().read_file(file))
+    assert ET.tostring(CryXmlSerializer(cache=cache).read_file(file)) == expected
+    assert (cache.hits, cache.misses) == (0, 1)
+
+    serializer = CryXmlSerializer(cache=cache)
+    serializer.read_tables = None      # Any decoding attempt would fail.
+    assert ET.tostring(serializer.read_file(file)) == expected
+    document = CryXmlSerializer(lazy=True, cache=cache).read_file(file)
+    assert ET.tostring(document.getroot().to_element()) == expected
+    assert cache.hits == 2
+
+def test_cache_invalidated_when_file_changes(tmp_path):
+    path = tmp_path / "prefab.xml"
+    file = write_binary_file(path, 10)
+    cache = CryXmlCache(str(tmp_path / "cache"))
+    CryXmlSerializer(cache=cache).read_file(file)
+    write_binary_file(path, 12)
+    os.utime(file, ns=(0, os.stat(file).st_mtime_ns + 1))
+    assert len(list(CryXmlSerializer(cache=cache).read_file(file).iter("Object"))) == 12
+    assert cache.hits == 0
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = CryXmlCache(str(tmp_path / "cache"))
+    files = [write_binary_file(tmp_path / ("prefab%d.xml" % i), 50) for i in range(3)]
+    for i, file in enumerate(files):
+        CryXmlSerializer(cache=cache).read_file(file)
+        os.utime(cache.entry_path(file), ns=(i, i))
+    cache.max_size = cache.size() - 1
+    cache.load(files[0])        # Touch the oldest entry so the second one is evicted instead.
+    cache.evict()
+    assert [os.path.exists(cache.entry_path(file)) for file in files] == [True, False, True]
+
+def test_cache_scans_only_when_full(tmp_path, monkeypatch):
+    cache = CryXmlCache(str(tmp_path / "cache"))
+    files = [write_binary_file(tmp_path / ("prefab%d.xml" % i), 50) for i in range(4)]
+    scans = []
+    entries = cache.entries
+    monkeypatch.setattr(cache, "entries", lambda: scans.append(1) or entries())
+    for file in files[:3]:
+        CryXmlSerializer(cache=cache).read_file(file)
+    cache.store(files[0], cache.load(files[0]))     # Replacing an entry doesn't grow the total.
+    assert len(scans) == 1
+    assert cache.total_size == sum(size for _, size, _ in entries())
+    cache.max_size = cache.total_size
+    CryXmlSerializer(cache=cache).read_file(files[3])
+    assert len(scans) == 2
+    assert len(entries()) == 3 and cache.total_size <= cache.max_size
+
+def test_cache_disabled_and_purge(tmp_path):
+    file = write_binary_file(tmp_path / "prefab.xml", 5)
+    cache = CryXmlCache(str(tmp_path / "cache"), enabled=False)
+    CryXmlSerializer(cache=cache).read_file(file)
+    assert cache.entries() == []
+    cache.enabled = True
+    CryXmlSerializer(cache=cache).read_file(file)
+    assert len(cache.entries()) == 1
+    cache.purge()
+    assert cache.entries() == []
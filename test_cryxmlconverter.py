@@ -0,0 +1,24 @@
+import os
+import xml.etree.ElementTree as ET
+
+from cryengine_tools.CryXmlB.CryXmlConverter import convert_directory
+from cryengine_tools.CryXmlB.CryXmlWriter import write_cryxmlb
+from test_cryxmlreader import create_large_tree, create_test_file
+
+def test_convert_directory(tmp_path):
+    source = tmp_path / "game"
+    (source / "objects").mkdir(parents=True)
+    (source / "objects" / "body.mtl").write_bytes(write_cryxmlb(create_large_tree(5)))
+    (source / "prefab.xml").write_text(create_test_file())
+
+    summary = convert_directory(str(source), workers=1)
+    assert (summary["converted"], summary["skipped"], summary["failed"]) == (1, 1, 0)
+    converted = ET.parse(str(source / "objects" / "body.mtl.xml")).getroot()
+    assert len(list(converted.iter("Object"))) == 5
+
+    summary = convert_directory(str(source), workers=1)
+    assert (summary["converted"], summary["up_to_date"]) == (0, 1)
+
+    summary = convert_directory(str(source), str(tmp_path / "mirror"), workers=1)
+    assert summary["converted"] == 1
+    assert os.path.isfile(str(tmp_path / "mirror" / "objects" / "body.mtl"))
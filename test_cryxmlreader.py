@@ -1,4 +1,12 @@
+import gc
+import io
+import struct
 import unittest
+import xml.etree.ElementTree as ET
+
+from cryengine_tools.CryXmlB.CryXmlReader import (CryXmlSerializer, CryXmlStringPool, NODE_FORMAT, REFERENCE_FORMAT,
+                                                  ORDER_FORMAT)
+from cryengine_tools.CryXmlB.CryXmlWriter import write_cryxmlb
 
 def test_canAssertTrue():
     assert True
@@ -10,3 +18,194 @@ def create_test_file():
         <Object ColorRGB=\"65535\" EntityClass=\"CharacterAttachHelper\" FloorNumber=\"-1\" Id=\"{2900FA6B-BE74-4254-B20F-B930A86E7631}\" Layer=\"Main\" Name=\"attach_helper\" Pos=\"0,0,0\" Rotate=\"1,0,0,0\" Type=\"CharAttachHelper\"> \
         <Properties BoneName=\"Bip01 Head\" /> \
         </Object></Objects></Prefab></PrefabsLibrary>"
+
+def create_large_tree(object_count):
+    root = ET.Element("PrefabsLibrary", Name="synthetic")
+    objects = ET.SubElement(ET.SubElement(root, "Prefab", Name="synthetic.prefab"), "Objects")
+    for i in range(object_count):
+        obj = ET.SubElement(objects, "Object", Id=str(i), Name="object_" + str(i), Pos="0,0," + str(i),
+                            Rotate="1,0,0,0", Type="Brush")
+        ET.SubElement(obj, "Properties", BoneName="Bip01 Head")
+    return root
+
+def test_read_binary_file_matches_source_tree(tmp_path):
+    source = ET.fromstring(create_test_file())
+    for element in source.iter():
+        element.text = element.tail = None      # Text content isn't decoded from binary files.
+    path = tmp_path / "prefab.xml"
+    path.write_bytes(write_cryxmlb(source))
+    parsed = CryXmlSerializer().read_file(str(path))
+    assert ET.tostring(parsed) == ET.tostring(source)
+
+def test_read_table_matches_per_field_reads():
+    serializer = CryXmlSerializer()
+    data = write_cryxmlb(create_large_tree(100))
+    node_offset, node_count = struct.unpack_from('<2i', data, 12)
+    reader = io.BytesIO(data)
+    reader.seek(node_offset)
+    expected = [(serializer.read_int32(reader), serializer.read_int32(reader), serializer.read_int16(reader),
+                 serializer.read_int16(reader), serializer.read_int32(reader), serializer.read_int32(reader),
+                 serializer.read_int32(reader), serializer.read_int32(reader)) for _ in range(node_count)]
+    assert serializer.read_table(data, node_offset, node_count, NODE_FORMAT) == expected
+
+def test_read_string_table_offsets_and_utf8():
+    data = "Material\0Name\0Zürich_röd\0\0File\0".encode("utf-8")
+    data_map = CryXmlSerializer().read_string_table(data, 0, len(data))
+    assert data_map == {0: "Material", 9: "Name", 14: "Zürich_röd", 27: "", 28: "File"}
+
+def test_read_binary_file_with_multibyte_values(tmp_path):
+    source = ET.Element("Material", Name="Zürich_röd", File="textures/ü.dds")
+    path = tmp_path / "material.mtl"
+    path.write_bytes(write_cryxmlb(source))
+    parsed = CryXmlSerializer().read_file(str(path))
+    assert parsed.attrib == {"Name": "Zürich_röd", "File": "textures/ü.dds"}
+
+def test_read_file_mmap_matches_read(tmp_path):
+    path = tmp_path / "prefab.xml"
+    path.write_bytes(write_cryxmlb(create_large_tree(50)))
+    expected = ET.tostring(CryXmlSerializer().read_file(str(path)))
+    assert ET.tostring(CryXmlSerializer(use_mmap=True).read_file(str(path))) == expected
+
+def test_read_file_mmap_text_xml(tmp_path):
+    path = tmp_path / "prefab.xml"
+    path.write_text(create_test_file())
+    parsed = CryXmlSerializer(use_mmap=True).read_file(str(path))
+    assert parsed.getroot().attrib["Name"] == "asteroid_hangar_landingpad_medium"
+
+def test_lazy_document_matches_element_tree(tmp_path):
+    path = tmp_path / "prefab.xml"
+    path.write_bytes(write_cryxmlb(create_large_tree(20)))
+    expected = CryXmlSerializer().read_file(str(path))
+    for use_mmap in (False, True):
+        document = CryXmlSerializer(use_mmap=use_mmap, lazy=True).read_file(str(path))
+        assert ET.tostring(document.getroot().to_element()) == ET.tostring(expected)
+        assert [e.attrib for e in document.iter("Object")] == [e.attrib for e in expected.iter("Object")]
+        assert [e.tag for e in document.iter()] == [e.tag for e in expected.iter()]
+
+def test_lazy_element_api(tmp_path):
+    path = tmp_path / "prefab.xml"
+    path.write_bytes(write_cryxmlb(create_large_tree(3)))
+    document = CryXmlSerializer(lazy=True).read_file(str(path))
+    root = document.getroot()
+    assert root.attrib == {"Name": "synthetic"}
+    assert root[0].get("Name") == "synthetic.prefab"
+    assert len(root[0][0]) == 3
+    obj = document.find(".//Object[@Id='1']")
+    assert obj.attrib["Pos"] == "0,0,1"
+    assert obj[0].tag == "Properties"
+    assert obj.find("Properties").attrib["BoneName"] == "Bip01 Head"
+    assert [e.get("Id") for e in root.findall("Prefab/Objects/Object")] == ["0", "1", "2"]
+    assert [e.tag for e in obj.iter()] == ["Object", "Properties"]
+    assert document.find("Missing") is None
+
+def test_lazy_mmap_document_closes_its_map(tmp_path):
+    path = tmp_path / "prefab.xml"
+    path.write_bytes(write_cryxmlb(create_large_tree(3)))
+    serializer = CryXmlSerializer(use_mmap=True, lazy=True)
+    with serializer.read_file(str(path)) as document:
+        assert document.getroot().attrib == {"Name": "synthetic"}
+        buffer = document.data_map.buffer
+    assert buffer.closed
+    document = serializer.read_file(str(path))
+    buffer = document.data_map.buffer
+    assert document.getroot()[0].get("Name") == "synthetic.prefab"
+    del document
+    gc.collect()        # Elements and their document reference each other.
+    assert buffer.closed
+
+def test_string_pool_shared_across_documents(tmp_path):
+    pool = CryXmlStringPool()
+    binary = tmp_path / "prefab.xml"
+    binary.write_bytes(write_cryxmlb(create_large_tree(5)))
+    text = tmp_path / "prefab_text.xml"
+    text.write_text(create_test_file())
+    first = CryXmlSerializer(string_pool=pool).read_file(str(binary))
+    second = CryXmlSerializer(lazy=True, use_mmap=True, string_pool=pool).read_file(str(binary))
+    third = CryXmlSerializer(string_pool=pool).read_file(str(text))
+    assert first[0].attrib["Name"] is second.getroot()[0].attrib["Name"]
+    assert first.find(".//Properties").attrib["BoneName"] is third.find(".//Properties").attrib["BoneName"]
+    assert pool.hits > 0 and pool.bytes_saved > 0
+    assert 0.0 < pool.hit_rate() < 1.0
+
+def test_iterparse_matches_text_iterparse(tmp_path):
+    source = create_large_tree(4)
+    binary = tmp_path / "prefab.xml"
+    binary.write_bytes(write_cryxmlb(source))
+    text = tmp_path / "prefab_text.xml"
+    text.write_bytes(ET.tostring(source))
+    expected = [(event, e.tag, dict(e.attrib)) for event, e in ET.iterparse(str(text), ("start", "end"))]
+    for path in (binary, text):
+        for serializer in (CryXmlSerializer(), CryXmlSerializer(use_mmap=True, string_pool=CryXmlStringPool())):
+            events = [(event, e.tag, dict(e.attrib)) for event, e in serializer.iterparse(str(path), ("start", "end"))]
+            assert events == expected
+
+def test_iterparse_clear_processed_elements(tmp_path):
+    binary = tmp_path / "prefab.xml"
+    binary.write_bytes(write_cryxmlb(create_large_tree(50)))
+    seen = []
+    for event, element in CryXmlSerializer().iterparse(str(binary)):
+        if element.tag == "Object":
+            seen.append(element.attrib["Id"])
+            assert element[0].attrib["BoneName"] == "Bip01 Head"
+            element.clear()
+        elif element.tag == "Objects":
+            assert all(len(child) == 0 for child in element)
+    assert seen == [str(i) for i in range(50)]
+
+def test_iterparse_decodes_binary_files_as_it_walks(tmp_path, monkeypatch):
+    binary = tmp_path / "prefab.xml"
+    binary.write_bytes(write_cryxmlb(create_large_tree(5)))
+    expected = [(e.tag, e.attrib) for e in CryXmlSerializer().read_file(str(binary)).iter()]
+    monkeypatch.setattr(CryXmlSerializer, "read_table", None)           # Any bulk decode would fail.
+    monkeypatch.setattr(CryXmlSerializer, "read_string_table", None)
+    events = CryXmlSerializer(string_pool=CryXmlStringPool()).iterparse(str(binary), ("start",))
+    assert [(e.tag, e.attrib) for event, e in events] == expected
+
+def test_lazy_strings_reject_offsets_inside_strings(tmp_path):
+    data = bytearray(write_cryxmlb(ET.Element("Material", Name="Zürich_röd", File="textures/crate.dds")))
+    reference_offset = struct.unpack_from('<i', data, 20)[0]
+    name_offset, value_offset = struct.unpack_from('<2i', data, reference_offset)
+    struct.pack_into('<i', data, reference_offset + 4, value_offset + 3)    # Points into the middle of the value.
+    path = tmp_path / "material.mtl"
+    path.write_bytes(bytes(data))
+    expected = {"Name": "BUGGED", "File": "textures/crate.dds"}
+    assert CryXmlSerializer().read_file(str(path)).attrib == expected
+    for use_mmap in (False, True):
+        assert CryXmlSerializer(use_mmap=use_mmap, lazy=True).read_file(str(path)).getroot().attrib == expected
+    events = CryXmlSerializer().iterparse(str(path), ("start",))
+    assert [e.attrib for event, e in events] == [expected]
+
+def reverse_tables(data):
+    """ Rewrites a CryXmlB file with the reference and order tables stored in reverse node
+        order, so only the first attribute and first child indexes locate each node's records.
+    """
+    data = bytearray(data)
+    node_offset, node_count, reference_offset, reference_count, order_offset = struct.unpack_from('<5i', data, 12)
+    nodes = [list(NODE_FORMAT.unpack_from(data, node_offset + i * NODE_FORMAT.size)) for i in range(node_count)]
+    references, order = bytearray(), bytearray()
+    for node in reversed(nodes):
+        attributes = data[reference_offset + node[5] * REFERENCE_FORMAT.size:
+                          reference_offset + (node[5] + node[2]) * REFERENCE_FORMAT.size]
+        children = data[order_offset + node[6] * ORDER_FORMAT.size:
+                        order_offset + (node[6] + node[3]) * ORDER_FORMAT.size]
+        node[5] = len(references) // REFERENCE_FORMAT.size
+        node[6] = len(order) // ORDER_FORMAT.size
+        references += attributes
+        order += children
+    for i, node in enumerate(nodes):
+        NODE_FORMAT.pack_into(data, node_offset + i * NODE_FORMAT.size, *node)
+    data[reference_offset:reference_offset + len(references)] = references
+    data[order_offset:order_offset + len(order)] = order
+    return bytes(data)
+
+def test_read_tables_stored_out_of_order(tmp_path):
+    source = create_large_tree(3)
+    path = tmp_path / "prefab.xml"
+    path.write_bytes(reverse_tables(write_cryxmlb(source)))
+    expected = ET.tostring(source)
+    for use_mmap in (False, True):
+        assert ET.tostring(CryXmlSerializer(use_mmap=use_mmap).read_file(str(path))) == expected
+        document = CryXmlSerializer(use_mmap=use_mmap, lazy=True).read_file(str(path))
+        assert ET.tostring(document.getroot().to_element()) == expected
+    events = CryXmlSerializer().iterparse(str(path), ("start",))
+    assert [(e.tag, e.attrib) for event, e in events] == [(e.tag, e.attrib) for e in source.iter()]
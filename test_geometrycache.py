@@ -0,0 +1,70 @@
+import os
+
+import pytest
+
+numpy = pytest.importorskip("numpy")
+
+from cryengine_tools.GeometryCache import GeometryCache, read_npz
+
+def write_source_file(path, size=100):
+    path.write_bytes(b"x" * size)
+    return str(path)
+
+def create_arrays(vertex_count=100):
+    return {"positions": numpy.arange(vertex_count * 3, dtype=numpy.float32).reshape(-1, 3),
+            "loop_starts": numpy.arange(0, vertex_count, 3, dtype=numpy.int32),
+            "uvs": numpy.zeros((0, 2), dtype=numpy.float32),
+            "scene": numpy.array('{"up_axis": "Z_UP"}')}
+
+def test_cache_round_trip_shares_one_buffer(tmp_path):
+    file = write_source_file(tmp_path / "part.dae")
+    cache = GeometryCache(str(tmp_path / "cache"))
+    arrays = create_arrays()
+    assert cache.load(file) is None
+    cache.store(file, arrays)
+    loaded = cache.load(file)
+    assert sorted(loaded) == sorted(arrays)
+    for name, array in arrays.items():
+        assert loaded[name].dtype == array.dtype
+        assert numpy.array_equal(loaded[name], array)
+    assert not loaded["positions"].flags.owndata
+    assert not loaded["positions"].flags.writeable
+    assert (cache.hits, cache.misses) == (1, 1)
+    cache.store(file, create_arrays(10))      # The loaded arrays don't keep the entry open.
+    assert len(cache.load(file)["positions"]) == 10
+    assert numpy.array_equal(loaded["positions"], arrays["positions"])
+
+def test_cache_invalidated_when_file_changes(tmp_path):
+    path = tmp_path / "part.dae"
+    file = write_source_file(path)
+    cache = GeometryCache(str(tmp_path / "cache"))
+    cache.store(file, create_arrays())
+    write_source_file(path, 120)
+    assert cache.load(file) is None
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = GeometryCache(str(tmp_path / "cache"))
+    files = [write_source_file(tmp_path / ("part%d.dae" % i)) for i in range(3)]
+    for i, file in enumerate(files):
+        cache.store(file, create_arrays())
+        os.utime(cache.entry_path(file), ns=(i * 10**9, i * 10**9))
+    entry_size = os.path.getsize(cache.entry_path(files[0]))
+    cache.max_size = entry_size * 2
+    cache.evict()
+    assert cache.load(files[0]) is None
+    assert cache.load(files[2]) is not None
+
+def test_unreadable_entry_is_removed(tmp_path):
+    file = write_source_file(tmp_path / "part.dae")
+    cache = GeometryCache(str(tmp_path / "cache"))
+    os.makedirs(cache.cache_dir)
+    with open(cache.entry_path(file), "wb") as f:
+        f.write(b"not a zip file")
+    assert cache.load(file) is None
+    assert not os.path.exists(cache.entry_path(file))
+
+def test_read_npz_rejects_compressed_files(tmp_path):
+    path = str(tmp_path / "compressed.npz")
+    numpy.savez_compressed(path, positions=numpy.ones(10, dtype=numpy.float32))
+    with pytest.raises(ValueError):
+        read_npz(path)
@@ -0,0 +1,31 @@
+import xml.etree.ElementTree as ET
+
+from cryengine_tools.MaterialFingerprint import material_fingerprint
+
+def create_material(name="atlas_body", diffuse="Objects/Mechs/Atlas/atlas_body_diff.tif", **attributes):
+    material = ET.Element("Material", Name=name, Shader="Illum", StringGenMask="%BUMP_MAP%SPECULAR_MAP", **attributes)
+    textures = ET.SubElement(material, "Textures")
+    ET.SubElement(textures, "Texture", Map="Diffuse", File=diffuse)
+    ET.SubElement(textures, "Texture", Map="Bumpmap", File="objects/mechs/atlas/atlas_body_ddn.tif")
+    return material
+
+def test_identical_materials_match():
+    fingerprint = material_fingerprint(create_material(), ".dds")
+    assert material_fingerprint(create_material(name="atlas_variant"), ".dds") == fingerprint
+    assert material_fingerprint(create_material(diffuse="objects\\mechs\\atlas\\ATLAS_BODY_DIFF.tif"), ".dds") == fingerprint
+    reordered = ET.Element("Material", StringGenMask="%BUMP_MAP%SPECULAR_MAP", Shader="Illum", Name="atlas_body")
+    reordered.extend(create_material())
+    assert material_fingerprint(reordered, ".dds") == fingerprint
+
+def test_differences_change_the_fingerprint():
+    fingerprint = material_fingerprint(create_material(), ".dds")
+    assert material_fingerprint(create_material(), ".tif") != fingerprint
+    assert material_fingerprint(create_material(diffuse="objects/mechs/atlas/atlas_body_spec.tif"), ".dds") != fingerprint
+    assert material_fingerprint(create_material(Diffuse="1,0,0"), ".dds") != fingerprint
+
+def test_submaterials_are_ignored():
+    parent = create_material()
+    fingerprint = material_fingerprint(parent)
+    submaterials = ET.SubElement(parent, "SubMaterials")
+    submaterials.append(create_material(name="decal", diffuse="objects/decal.tif"))
+    assert material_fingerprint(parent) == fingerprint
@@ -0,0 +1,73 @@
+import os
+import zipfile
+
+from cryengine_tools.CryXmlB.CryXmlCache import CryXmlCache
+from cryengine_tools.CryXmlB.CryXmlReader import CryXmlSerializer
+from cryengine_tools.PakFileSystem import PakFileSystem
+from cryengine_tools.CryXmlB.CryXmlWriter import write_cryxmlb
+from test_cryxmlreader import create_large_tree, create_test_file
+
+def create_game_dir(tmp_path):
+    game = tmp_path / "Game"
+    game.mkdir()
+    with zipfile.ZipFile(str(game / "Objects.pak"), "w") as pak:
+        pak.writestr("Objects/Mechs/Atlas/Body/atlas_body.mtl", write_cryxmlb(create_large_tree(3)), zipfile.ZIP_DEFLATED)
+        pak.writestr("Objects/Mechs/Atlas/atlas.cdf", create_test_file(), zipfile.ZIP_STORED)
+    with zipfile.ZipFile(str(game / "Textures.pak"), "w") as pak:
+        pak.writestr("objects/mechs/atlas/body/textures/atlas_diff.dds", b"DDS " + bytes(124), zipfile.ZIP_DEFLATED)
+    return game
+
+def test_case_insensitive_reads(tmp_path):
+    game = create_game_dir(tmp_path)
+    file_system = PakFileSystem.from_directory(str(game), CryXmlCache(str(tmp_path / "index")), str(tmp_path / "extract"))
+    assert file_system.exists("objects/mechs/atlas/atlas.cdf")
+    assert file_system.exists(os.path.join(str(game), "OBJECTS", "Mechs", "atlas", "ATLAS.cdf"))
+    assert file_system.read("Objects\\\\Mechs\\\\Atlas\\\\Body\\\\Textures\\\\Atlas_Diff.dds")[:4] == b"DDS "
+    assert file_system.read("objects/missing.mtl") is None
+
+def test_serializer_reads_from_pak(tmp_path):
+    game = create_game_dir(tmp_path)
+    file_system = PakFileSystem.from_directory(str(game), CryXmlCache(str(tmp_path / "index")), str(tmp_path / "extract"))
+    serializer = CryXmlSerializer(lazy=True, file_system=file_system)
+    materials = serializer.read_file(os.path.join(str(game), "objects", "mechs", "atlas", "body", "atlas_body.mtl"))
+    assert len(list(materials.iter("Object"))) == 3
+    cdf = serializer.read_file(os.path.join(str(game), "objects", "mechs", "atlas", "atlas.cdf"))
+    assert cdf.getroot().attrib["Name"] == "asteroid_hangar_landingpad_medium"
+
+def test_index_cache_and_extract(tmp_path):
+    game = create_game_dir(tmp_path)
+    index_cache = CryXmlCache(str(tmp_path / "index"))
+    PakFileSystem.from_directory(str(game), index_cache, str(tmp_path / "extract"))
+    file_system = PakFileSystem.from_directory(str(game), index_cache, str(tmp_path / "extract"))
+    assert index_cache.hits == 2
+    extracted = file_system.extract("Objects/Mechs/Atlas/Body/Textures/atlas_diff.dds")
+    assert extracted.startswith(str(tmp_path / "extract"))
+    with open(extracted, "rb") as f:
+        assert f.read(4) == b"DDS "
+
+def test_patched_files_are_extracted_again(tmp_path):
+    game = create_game_dir(tmp_path)
+    index_cache = CryXmlCache(str(tmp_path / "index"))
+    file_system = PakFileSystem.from_directory(str(game), index_cache, str(tmp_path / "extract"))
+    extracted = file_system.extract("objects/mechs/atlas/body/textures/atlas_diff.dds")
+    assert file_system.extract("objects/mechs/atlas/body/textures/atlas_diff.dds") == extracted
+    # A patch that keeps the texture's size.
+    with zipfile.ZipFile(str(game / "Textures.pak"), "w") as pak:
+        pak.writestr("objects/mechs/atlas/body/textures/atlas_diff.dds", b"DDS " + bytes(123) + b"!", zipfile.ZIP_DEFLATED)
+    os.utime(str(game / "Textures.pak"), ns=(0, 0))
+    file_system = PakFileSystem.from_directory(str(game), index_cache, str(tmp_path / "extract"))
+    assert file_system.extract("objects/mechs/atlas/body/textures/atlas_diff.dds") == extracted
+    with open(extracted, "rb") as f:
+        assert f.read() == b"DDS " + bytes(123) + b"!"
+
+def test_header_reads(tmp_path):
+    game = create_game_dir(tmp_path)
+    data = bytes(range(256)) * 1024
+    with zipfile.ZipFile(str(game / "Large.pak"), "w") as pak:
+        pak.writestr("objects/large.bin", data, zipfile.ZIP_DEFLATED)
+        pak.writestr("objects/stored.bin", data, zipfile.ZIP_STORED)
+    file_system = PakFileSystem.from_directory(str(game), CryXmlCache(str(tmp_path / "index")), str(tmp_path / "extract"))
+    assert file_system.read_header("objects/large.bin", 300) == data[:300]
+    assert file_system.read_header("objects/stored.bin", 300) == data[:300]
+    assert file_system.read_header("objects/mechs/atlas/body/textures/atlas_diff.dds", 4096) == b"DDS " + bytes(124)
+    assert file_system.read_header("objects/missing.bin", 300) is None
@@ -0,0 +1,43 @@
+import threading
+
+import pytest
+
+from cryengine_tools.ParsePipeline import ParsePipeline
+
+def test_results_follow_the_items():
+    with ParsePipeline(lambda item: item * 2, [1, 2, 3, 2]) as pipeline:
+        assert [pipeline.get(item) for item in [1, 2, 3, 2]] == [2, 4, 6, 4]
+        assert pipeline.decoded == 4
+
+def test_decoding_stays_within_max_pending():
+    started = []
+    release = threading.Event()
+    def decode(item):
+        started.append(item)
+        release.wait(5)
+        return item
+    with ParsePipeline(decode, list(range(10)), workers=4, max_pending=2) as pipeline:
+        assert len(pipeline.pending) == 2
+        release.set()
+        assert pipeline.get(0) == 0
+        assert pipeline.next_item == 3
+    assert max(started) <= 2
+
+def test_skipped_and_unqueued_items():
+    decoded = []
+    def decode(item):
+        decoded.append(threading.current_thread() is threading.main_thread())
+        return item.upper()
+    with ParsePipeline(decode, ["a", "b", "c", "d", "e"], max_pending=1) as pipeline:
+        assert pipeline.get("d") == "D"     # Skips a to c, decodes d on the calling thread.
+        assert [item for item, _ in pipeline.pending] == ["e"]
+        assert pipeline.get("e") == "E"
+        assert pipeline.get("x") == "X"
+    assert decoded.count(True) >= 2
+
+def test_decode_errors_are_raised_by_get():
+    def decode(item):
+        raise ValueError(item)
+    with ParsePipeline(decode, ["bad.dae"]) as pipeline:
+        with pytest.raises(ValueError):
+            pipeline.get("bad.dae")
@@ -0,0 +1,86 @@
+import xml.etree.ElementTree as ET
+import zipfile
+
+from cryengine_tools.AssetIndex import AssetIndex
+from cryengine_tools.CryXmlB.CryXmlCache import CryXmlCache
+from cryengine_tools.CryXmlB.CryXmlWriter import write_cryxmlb
+from cryengine_tools.PakFileSystem import PakFileSystem
+from cryengine_tools.PrefabDependencies import DependencyResolver, PAK_FILE
+
+def create_material(*textures):
+    material = ET.Element("Material", Name="crate")
+    textures_element = ET.SubElement(material, "Textures")
+    for texture in textures:
+        ET.SubElement(textures_element, "Texture", Map="Diffuse", File=texture)
+    return write_cryxmlb(material)
+
+CRATE_COLLADA = (b'<COLLADA xmlns="http://www.collada.org/2005/11/COLLADASchema"><library_images>'
+                 b'<image id="crate_diff"><init_from>Textures/Crate_Diff.dds</init_from></image>'
+                 b'<image id="outside"><init_from>../../../../outside.dds</init_from></image>'
+                 b'</library_images><library_geometries/></COLLADA>')
+
+def create_prefab_library():
+    library = ET.Element("PrefabsLibrary", Name="Props")
+    prefab = ET.SubElement(library, "Prefab", Name="Crates", Library="Props")
+    objects = ET.SubElement(prefab, "Objects")
+    ET.SubElement(objects, "Object", Type="Brush", Id="1", Prefab="Objects/Props/Crate.cgf", Material="Objects/Props/crate")
+    ET.SubElement(objects, "Object", Type="Brush", Id="2", Prefab="objects/props/crate.cgf", Material="objects/props/crate.mtl")
+    group = ET.SubElement(objects, "Object", Type="Group", Id="3")
+    members = ET.SubElement(group, "Objects")
+    ET.SubElement(members, "Object", Type="GeomEntity", Id="4", Geometry="objects/props/barrel.cgf")
+    entity = ET.SubElement(members, "Object", Type="Entity", Id="5")
+    ET.SubElement(entity, "Properties", objModel="objects/props/missing.cga")
+    return ET.tostring(library)
+
+def create_game_dir(tmp_path):
+    game = tmp_path / "Game"
+    props = game / "Objects" / "Props"
+    props.mkdir(parents=True)
+    (props / "Crate.dae").write_bytes(CRATE_COLLADA)
+    (props / "Textures").mkdir()
+    (props / "Textures" / "crate_diff.dds").write_bytes(b"DDS " + bytes(124))
+    (props / "crate.mtl").write_bytes(create_material("objects/props/crate_diff.tif", "objects/props/crate_ddna.tif",
+                                                      "$NearestCubeMap"))
+    (props / "crate_diff.dds").write_bytes(b"DDS " + bytes(124))
+    with zipfile.ZipFile(str(game / "Props.pak"), "w") as pak:
+        pak.writestr("objects/props/barrel.dae", b"<COLLADA/>", zipfile.ZIP_DEFLATED)
+    prefab_file = game / "Prefabs" / "props.xml"
+    prefab_file.parent.mkdir()
+    prefab_file.write_bytes(create_prefab_library())
+    return game, str(prefab_file)
+
+def create_resolver(tmp_path, game):
+    file_system = PakFileSystem.from_directory(str(game), CryXmlCache(str(tmp_path / "index")), str(tmp_path / "extract"))
+    return DependencyResolver(str(game), AssetIndex(str(game)), file_system, cache=CryXmlCache(str(tmp_path / "cache")))
+
+def test_dependency_closure(tmp_path):
+    game, prefab_file = create_game_dir(tmp_path)
+    dependencies = create_resolver(tmp_path, game).resolve(prefab_file)
+    assert (dependencies.prefabs, dependencies.objects, dependencies.groups) == (1, 5, 1)
+    assert dependencies.geometry == {"objects/props/crate.dae": str(game / "Objects" / "Props" / "Crate.dae"),
+                                     "objects/props/barrel.dae": PAK_FILE,
+                                     "objects/props/missing.dae": None}
+    assert list(dependencies.materials) == ["objects/props/crate.mtl"]
+    assert dependencies.textures == {"objects/props/crate_diff.dds": str(game / "Objects" / "Props" / "crate_diff.dds"),
+                                     "objects/props/crate_ddna.dds": None,
+                                     "objects/props/textures/crate_diff.dds": str(game / "Objects" / "Props" / "Textures" / "crate_diff.dds")}
+    assert dependencies.missing() == ["objects/props/crate_ddna.dds", "objects/props/missing.dae"]
+    assert dependencies.prefab_materials == {"Crates": {"objects/props/crate.mtl"}}
+    assert dependencies.material_textures == {"objects/props/crate.mtl": ["objects/props/crate_diff.dds", "objects/props/crate_ddna.dds"]}
+    assert dependencies.prefab_geometry == {"Crates": {"objects/props/crate.dae", "objects/props/barrel.dae", "objects/props/missing.dae"}}
+    assert dependencies.geometry_textures == {"objects/props/crate.dae": ["objects/props/textures/crate_diff.dds"],
+                                              "objects/props/barrel.dae": []}
+    assert dependencies.sizes["objects/props/crate.dae"] == len(CRATE_COLLADA)
+    assert dependencies.sizes["objects/props/barrel.dae"] == 10
+
+def test_prefetch_reads_every_found_file(tmp_path):
+    game, prefab_file = create_game_dir(tmp_path)
+    resolver = create_resolver(tmp_path, game)
+    dependencies = resolver.resolve(prefab_file)
+    warmed = []
+    summary = resolver.prefetch(dependencies, {".dae": warmed.append})
+    assert (summary["files"], summary["failed"]) == (5, 0)
+    assert summary["bytes"] == dependencies.total_size()
+    assert sorted(warmed) == sorted([str(game / "Objects" / "Props" / "Crate.dae"),
+                                     str(tmp_path / "extract" / "objects" / "props" / "barrel.dae")])
+    assert resolver.cache.hits >= 1
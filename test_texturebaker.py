@@ -0,0 +1,112 @@
+import struct
+import xml.etree.ElementTree as ET
+import zlib
+
+import pytest
+
+numpy = pytest.importorskip("numpy")
+
+from cryengine_tools.TextureBaker import TextureBaker, BAKE_DOWNSCALE, BAKE_NORMAL, BAKE_ROUGHNESS, get_bake_jobs, bake_normal, bake_roughness
+from cryengine_tools.TextureReader import (DDS_HEADER_FORMAT, DDS_MAGIC, UnsupportedTextureError, downscale_pixels, read_dds,
+                           read_downscaled_texture, read_texture)
+
+def create_dds(width, height, four_cc, data, mip_count=1):
+    header = DDS_HEADER_FORMAT.pack(124, 0, height, width, len(data), 0, mip_count, 32, 0x4, four_cc, 0, 0, 0, 0, 0)
+    return DDS_MAGIC + header + data
+
+def create_tiff(pixels):
+    # Little endian, uncompressed, one strip.
+    height, width, samples = pixels.shape
+    data = pixels.tobytes()
+    entries = [(256, 3, 1, width), (257, 3, 1, height), (258, 3, 1, 8), (259, 3, 1, 1), (262, 3, 1, 2),
+               (273, 4, 1, 8), (277, 3, 1, samples), (279, 4, 1, len(data))]
+    ifd = struct.pack("<H", len(entries)) + b"".join(struct.pack("<HHII", *entry) for entry in entries) + b"\0\0\0\0"
+    return b"II" + struct.pack("<HI", 42, 8 + len(data)) + data + ifd
+
+def read_png(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    width, height, _, color_type = struct.unpack(">2I2B", data[16:26])
+    channels = {0: 1, 2: 3, 4: 2, 6: 4}[color_type]
+    rows = numpy.frombuffer(zlib.decompress(data[41:-12]), dtype=numpy.uint8).reshape(height, -1)
+    return rows[:, 1:].reshape(height, width, channels)
+
+def test_block_compressed_dds():
+    # BC1: pure red and pure blue endpoints, texels alternating between them.
+    red, blue = 0xf800, 0x001f
+    block = struct.pack("<2HI", red, blue, 0x44444444)   # Rows of 0, 1, 0, 1
+    pixels = read_dds(create_dds(4, 4, b"DXT1", block))
+    assert pixels.shape == (4, 4, 4)
+    assert pixels[0, 0].tolist() == [255, 0, 0, 255]
+    assert pixels[0, 1].tolist() == [0, 0, 255, 255]
+    # BC5: a constant red channel and a green one interpolated between its endpoints.
+    red_block = bytes([200, 100]) + bytes(6)
+    green_block = bytes([255, 0]) + (0x249249249249).to_bytes(6, "little")     # Index 1 everywhere
+    pixels = read_dds(create_dds(2, 2, b"ATI2", red_block + green_block))
+    assert pixels.shape == (2, 2, 4)
+    assert pixels[:, :, :2].reshape(-1, 2).tolist() == [[200, 0]] * 4
+
+    with pytest.raises(UnsupportedTextureError):
+        read_dds(create_dds(8, 8, b"DXT5", bytes(16)))     # Larger mips in separate files
+
+def test_uncompressed_tiff(tmp_path):
+    pixels = numpy.arange(2 * 3 * 4, dtype=numpy.uint8).reshape(2, 3, 4)
+    path = tmp_path / "gloss.tif"
+    path.write_bytes(create_tiff(pixels))
+    assert numpy.array_equal(read_texture(str(path)), pixels)
+
+def test_bakes():
+    pixels = numpy.zeros((1, 3, 4), dtype=numpy.uint8)
+    pixels[0, :, 0] = (128, 255, 0)
+    pixels[0, :, 1] = 128
+    pixels[0, :, 3] = (255, 0, 51)
+    assert bake_normal(pixels)[0, :, 2].tolist() == [255, 128, 128]
+    assert bake_roughness(pixels).tolist() == [[0, 255, 204]]
+    assert bake_roughness(pixels, 0.5).tolist() == [[0, 128, 102]]
+
+def test_baked_textures_are_content_addressed(tmp_path):
+    block = bytes([255, 0]) + (0x249249249249).to_bytes(6, "little")
+    texture = tmp_path / "atlas_ddn.dds"
+    texture.write_bytes(create_dds(4, 4, b"ATI2", block + block))
+    copy = tmp_path / "copy_ddn.dds"
+    copy.write_bytes(texture.read_bytes())
+    baker = TextureBaker(str(tmp_path / "cache"))
+    assert baker.lookup(str(texture), BAKE_NORMAL) is None
+    path, baked = baker.bake(str(texture), BAKE_NORMAL)
+    assert baked
+    assert baker.lookup(str(copy), BAKE_NORMAL) == path
+    assert baker.bake(str(copy), BAKE_NORMAL) == (path, False)
+    assert read_png(path).shape == (4, 4, 3)
+    assert baker.lookup(str(texture), BAKE_ROUGHNESS) is None
+    assert baker.bake_all([(str(texture), BAKE_ROUGHNESS, 1.0), (str(copy), BAKE_ROUGHNESS, 1.0), (str(copy), BAKE_NORMAL, 1.0)],
+                          workers=1)["baked"] == 1   # The copy's roughness is the same file
+    assert baker.lookup(str(copy), BAKE_ROUGHNESS) is not None
+
+def test_bake_jobs():
+    material = ET.Element("Material", Shader="Illum", StringGenMask="%GLOSS_DIFFUSEALPHA%BUMP_MAP", Shininess="50")
+    textures = ET.SubElement(material, "Textures")
+    ET.SubElement(textures, "Texture", Map="Diffuse", File="atlas_diff.tif")
+    ET.SubElement(textures, "Texture", Map="Bumpmap", File="atlas_ddn.tif")
+    assert get_bake_jobs(material, lambda file: file.replace(".tif", ".dds")) == [
+        ("atlas_ddn.dds", BAKE_NORMAL, 1.0), ("atlas_diff.dds", BAKE_ROUGHNESS, 0.5)]
+    material.set("Shader", "Glass")
+    assert get_bake_jobs(material, lambda file: file) == []
+
+def test_downscaled_textures(tmp_path):
+    # 8x8 BC1 with 4 mips: black, then red, green and blue.
+    black, red, green, blue = (struct.pack("<2HI", color, 0, 0) for color in (0, 0xf800, 0x07e0, 0x001f))
+    texture = tmp_path / "atlas_diff.dds"
+    texture.write_bytes(create_dds(8, 8, b"DXT1", black * 4 + red + green + blue, mip_count=4))
+    assert read_downscaled_texture(str(texture), 2)[0, 0].tolist() == [255, 0, 0, 255]
+    assert read_downscaled_texture(str(texture), 4).shape == (2, 2, 4)
+    assert read_downscaled_texture(str(texture), 16).shape == (1, 1, 4)      # Past the last mip: box filtered
+
+    pixels = numpy.zeros((4, 6, 4), dtype=numpy.uint8)
+    pixels[:, ::2] = 255
+    assert downscale_pixels(pixels, 2).tolist() == [[[128] * 4] * 3] * 2
+    assert downscale_pixels(pixels, 8).shape == (1, 1, 4)
+
+    baker = TextureBaker(str(tmp_path / "cache"))
+    baker.bake_all([(str(texture), BAKE_DOWNSCALE, 4)], workers=1)
+    assert read_png(baker.lookup(str(texture), BAKE_DOWNSCALE, 4))[0, 0].tolist() == [0, 255, 0, 255]
+    assert baker.lookup(str(texture), BAKE_DOWNSCALE, 2) is None
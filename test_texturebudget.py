@@ -0,0 +1,80 @@
+import struct
+import zipfile
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from cryengine_tools.CryXmlB.CryXmlCache import CryXmlCache
+from cryengine_tools.PakFileSystem import PakFileSystem
+from cryengine_tools.PrefabDependencies import PAK_FILE, PrefabDependencies
+from cryengine_tools.TextureBudget import TextureInfo, TextureMemoryEstimate, estimate_prefab_textures, estimate_textures, read_texture_info
+from cryengine_tools.TextureReader import DDS_DX10_HEADER_FORMAT, DDS_HEADER_FORMAT, DDS_MAGIC, read_texture_header
+
+def create_dds_header(width, height, four_cc, mip_count=1, dxgi_format=None):
+    header = DDS_MAGIC + DDS_HEADER_FORMAT.pack(124, 0, height, width, 0, 0, mip_count, 32, 0x4, four_cc, 0, 0, 0, 0, 0)
+    if dxgi_format is not None:
+        header += DDS_DX10_HEADER_FORMAT.pack(dxgi_format, 3, 0, 1, 0)
+    return header
+
+def create_tiff_header(width, height, samples, ifd_offset=64):
+    # Big endian, with the image directory after the (missing) pixels.
+    entries = [(256, 4, 1, width), (257, 4, 1, height), (277, 3, 1, samples << 16)]
+    ifd = struct.pack(">H", len(entries)) + b"".join(struct.pack(">HHII", *entry) for entry in entries)
+    return b"MM" + struct.pack(">HI", 42, ifd_offset) + bytes(ifd_offset - 8) + ifd
+
+def test_texture_headers(tmp_path):
+    (tmp_path / "diff.dds").write_bytes(create_dds_header(2048, 1024, b"DXT5", 12))     # No pixels needed
+    (tmp_path / "ddna.dds").write_bytes(create_dds_header(512, 512, b"DX10", 10, dxgi_format=98))
+    (tmp_path / "spec.tif").write_bytes(create_tiff_header(256, 128, 3))
+    with open(tmp_path / "diff.dds", "rb") as f:
+        assert read_texture_header(f) == (2048, 1024, 12, "BC3")
+    with open(tmp_path / "ddna.dds", "rb") as f:
+        assert read_texture_header(f) == (512, 512, 10, "BC7")
+    with open(tmp_path / "spec.tif", "rb") as f:
+        assert read_texture_header(f) == (256, 128, 1, "unknown")     # Missing BitsPerSample means 1 bit
+
+    estimate = estimate_textures({"atlas_body.mtl": [str(tmp_path / "diff.dds"), str(tmp_path / "ddna.dds")],
+                                  "atlas_cockpit.mtl": [str(tmp_path / "diff.dds"), str(tmp_path / "spec.tif")]})
+    assert estimate.textures[str(tmp_path / "diff.dds")] == TextureInfo(2048, 1024, 12, "BC3")
+    assert estimate.asset_memory() == {"atlas_body.mtl": TextureInfo(2048, 1024, 1, "").memory() + TextureInfo(512, 512, 1, "").memory(),
+                                       "atlas_cockpit.mtl": TextureInfo(2048, 1024, 1, "").memory() + TextureInfo(256, 128, 1, "").memory()}
+    assert estimate.memory() < sum(estimate.asset_memory().values())     # The shared diffuse is counted once
+
+def test_prefab_estimate_and_downscale(tmp_path):
+    (tmp_path / "crate_diff.dds").write_bytes(create_dds_header(1024, 1024, b"DXT1"))
+    (tmp_path / "barrel_diff.dds").write_bytes(b"not a texture")
+    dependencies = PrefabDependencies(
+        textures={"crate_diff.dds": str(tmp_path / "crate_diff.dds"), "barrel_diff.dds": str(tmp_path / "barrel_diff.dds"),
+                  "missing.dds": None},
+        prefab_geometry={"Crates": {"crate.dae"}, "Barrels": {"barrel.dae", "crate.dae"}},
+        geometry_textures={"crate.dae": ["crate_diff.dds"], "barrel.dae": ["barrel_diff.dds", "missing.dds"]},
+        prefab_materials={"Crates": {"crate.mtl"}}, material_textures={"crate.mtl": ["unused_diff.dds"]})
+    estimate = estimate_prefab_textures(dependencies)
+    assert estimate.unreadable() == ["barrel_diff.dds"]
+    assert "unused_diff.dds" not in estimate.textures      # The prefab importer doesn't build .mtl materials
+    assert estimate.assets == {"Crates": ["crate_diff.dds"], "Barrels": ["barrel_diff.dds", "crate_diff.dds", "missing.dds"]}
+    memory = 1024 * 1024 * 4 * 4 // 3
+    assert estimate.asset_memory() == {"Crates": memory, "Barrels": memory}
+    assert estimate.get_downscale(memory) == 1
+    assert estimate.get_downscale(memory // 3) == 2
+    assert estimate.get_downscale(memory // 64) == 8
+    assert estimate.get_downscale(memory // 65) is None
+    assert TextureMemoryEstimate().memory() == 0
+
+def test_pak_texture_headers(tmp_path, monkeypatch):
+    game = tmp_path / "Game"
+    game.mkdir()
+    with zipfile.ZipFile(str(game / "Textures.pak"), "w") as pak:
+        pak.writestr("textures/diff.dds", create_dds_header(2048, 2048, b"DXT1") + bytes(2048 * 2048 // 2), zipfile.ZIP_DEFLATED)
+        pak.writestr("textures/spec.tif", create_tiff_header(256, 128, 3), zipfile.ZIP_DEFLATED)
+        pak.writestr("textures/gloss.tif", create_tiff_header(512, 512, 4, 256 * 1024), zipfile.ZIP_DEFLATED)
+    file_system = PakFileSystem.from_directory(str(game), CryXmlCache(str(tmp_path / "index")), str(tmp_path / "extract"))
+    reads = []
+    monkeypatch.setattr(file_system, "read", lambda path: reads.append(path) or PakFileSystem.read(file_system, path))
+    assert read_texture_info("textures/diff.dds", PAK_FILE, file_system) == TextureInfo(2048, 2048, 1, "BC1")
+    assert read_texture_info("textures/spec.tif", PAK_FILE, file_system) == TextureInfo(256, 128, 1, "unknown")
+    assert reads == []      # Both headers fit in the first bytes
+    assert read_texture_info("textures/gloss.tif", PAK_FILE, file_system) == TextureInfo(512, 512, 1, "unknown")
+    assert reads == ["textures/gloss.tif"]
+    assert read_texture_info("textures/missing.dds", PAK_FILE, file_system) is None